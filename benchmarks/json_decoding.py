@@ -0,0 +1,62 @@
+"""Compare JSON decoders on a synthetic expanded instance listing.
+
+Usage, with beren installed:
+
+    python benchmarks/json_decoding.py [number_of_instances]
+
+The payload mimics ``get_instances(expand=True)``: one record per instance with
+its ``MainDicomTags`` and parent identifiers.
+"""
+
+from beren.decoders import available_decoders, get_decoder
+from hashlib import sha1
+from timeit import repeat
+import json
+import sys
+
+
+def orthanc_id(*parts):
+    h = sha1("|".join(parts).encode()).hexdigest()
+    return "-".join(h[i : i + 8] for i in range(0, 40, 8))
+
+
+def expanded_instances(count):
+    records = []
+    for i in range(count):
+        uid = "1.2.826.0.1.3680043.8.498.{}".format(i)
+        records.append(
+            {
+                "ID": orthanc_id("instance", str(i)),
+                "Type": "Instance",
+                "FileSize": 526000 + i,
+                "FileUuid": orthanc_id("file", str(i)),
+                "IndexInSeries": i % 500,
+                "ParentSeries": orthanc_id("series", str(i // 500)),
+                "Labels": [],
+                "MainDicomTags": {
+                    "AcquisitionNumber": "1",
+                    "ImageOrientationPatient": "1\\0\\0\\0\\1\\0",
+                    "ImagePositionPatient": "-250\\-250\\{}".format(i * 0.625),
+                    "InstanceCreationDate": "20200101",
+                    "InstanceCreationTime": "101010.000",
+                    "InstanceNumber": str(i % 500 + 1),
+                    "SOPInstanceUID": uid,
+                },
+            }
+        )
+    return json.dumps(records).encode()
+
+
+def main(count):
+    payload = expanded_instances(count)
+    print("{} instances, {:.1f} MB payload".format(count, len(payload) / 1024 / 1024))
+    baseline = None
+    for name in available_decoders()[::-1]:
+        decode = get_decoder(name)
+        best = min(repeat(lambda: decode(payload), number=1, repeat=5))
+        baseline = baseline or best
+        print("{:>8}: {:8.1f} ms  ({:.1f}x)".format(name, best * 1000, baseline / best))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -12,3 +12,21 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from .orthanc import *
+from .transport import *
+from .decoders import *
+from .records import *
+from .graph import *
+from .cache import *
+from .tables import *
+from .transcode import *
+from .export import *
+from .bulk import *
+from .jobs import *
+from .archive import *
+from .download import *
+from .federation import *
+from .replication import *
+from .mirror import *
+from .remote import *
+from .sender import *
+from .ids import *
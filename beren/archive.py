@@ -0,0 +1,338 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from concurrent.futures import wait
+from requests.exceptions import RequestException
+from struct import unpack
+from tempfile import mkstemp
+from time import sleep
+import os
+import zlib
+
+__all__ = ["extract_archive", "iter_zip", "stream_job_output"]
+
+LOCAL_HEADER = b"PK\x03\x04"
+DATA_DESCRIPTOR = b"PK\x07\x08"
+CENTRAL_DIRECTORY = (b"PK\x01\x02", b"PK\x05\x06", b"PK\x06\x06")
+
+STORED = 0
+DEFLATED = 8
+
+
+def iter_zip(chunks):
+    """Incrementally parse a ZIP stream
+
+    Members are yielded as soon as their local header is read, so files can
+    be used before the end of the archive. Only the member being read is
+    held in memory, chunk by chunk. Each member's chunks must be consumed
+    (or the member skipped) before asking for the next member.
+
+    Handles the streamed archives produced by Orthanc: deflated or stored
+    members, data descriptors with unknown sizes, and ZIP64.
+
+    Example:
+
+        >>> for name, data in iter_zip(orthanc.get_study_archive(<id>)):
+        ...     with open(os.path.basename(name), "wb") as f:
+        ...         for chunk in data:
+        ...             f.write(chunk)
+
+    :param iterable chunks:
+        Chunks of the ZIP file
+    :return:
+        Yields ``(member name, generator of bytes chunks)`` pairs
+    :rtype:
+        generator
+    :raises ValueError:
+        Malformed or truncated archive, unsupported compression, or CRC mismatch
+    """
+    reader = _Reader(chunks)
+    while True:
+        signature = reader.read(4, allow_eof=True)
+        if signature in CENTRAL_DIRECTORY or signature == b"":
+            return
+        if signature != LOCAL_HEADER:
+            raise ValueError("Not a ZIP local file header: {!r}".format(signature))
+        member = _Member(reader)
+        data = member.chunks()
+        yield member.name, data
+        for _ in data:  # skip what the consumer did not read
+            pass
+
+
+class _Reader:
+    """Byte buffer over a chunk iterator"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def _fill(self):
+        for chunk in self._chunks:
+            if chunk:
+                self._buffer += chunk
+                return True
+        return False
+
+    def read(self, size, allow_eof=False):
+        while len(self._buffer) < size:
+            if not self._fill():
+                if allow_eof and not self._buffer:
+                    return b""
+                raise ValueError("Truncated ZIP stream")
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def read_some(self):
+        """Return whatever is buffered, or the next chunk"""
+        if not self._buffer and not self._fill():
+            raise ValueError("Truncated ZIP stream")
+        data, self._buffer = self._buffer, b""
+        return data
+
+    def unread(self, data):
+        self._buffer = data + self._buffer
+
+
+class _Member:
+    """A ZIP member whose local header has just been read"""
+
+    def __init__(self, reader):
+        self.reader = reader
+        (
+            _,
+            self.flags,
+            self.method,
+            _,
+            _,
+            self.crc,
+            self.compressed_size,
+            self.size,
+            name_length,
+            extra_length,
+        ) = unpack("<HHHHHIIIHH", reader.read(26))
+        name = reader.read(name_length)
+        self.name = name.decode("utf-8" if self.flags & 0x800 else "cp437")
+        self.zip64 = False
+        self._parse_extra(reader.read(extra_length))
+        if self.method not in (STORED, DEFLATED):
+            raise ValueError(
+                "Unsupported compression method {} for {}".format(
+                    self.method, self.name
+                )
+            )
+        self.has_descriptor = bool(self.flags & 0x08)
+        if self.method == STORED and self.has_descriptor and not self.compressed_size:
+            raise ValueError("Stored member {} of unknown size".format(self.name))
+
+    def _parse_extra(self, extra):
+        while len(extra) >= 4:
+            tag, length = unpack("<HH", extra[:4])
+            if tag == 0x0001:
+                self.zip64 = True
+                values = extra[4 : 4 + length]
+                if self.size == 0xFFFFFFFF and len(values) >= 8:
+                    self.size = unpack("<Q", values[:8])[0]
+                    values = values[8:]
+                if self.compressed_size == 0xFFFFFFFF and len(values) >= 8:
+                    self.compressed_size = unpack("<Q", values[:8])[0]
+            extra = extra[4 + length :]
+
+    def chunks(self):
+        crc = 0
+        size = 0
+        self.consumed = 0
+        stream = self._inflate() if self.method == DEFLATED else self._stored()
+        for chunk in stream:
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            yield chunk
+        if self.has_descriptor:
+            self.crc, self.compressed_size, self.size = self._read_descriptor(size)
+        if (crc, size) != (self.crc, self.size):
+            raise ValueError("CRC or size mismatch for {}".format(self.name))
+
+    def _read_descriptor(self, size):
+        """Data descriptor ``(crc, compressed size, size)``
+
+        Its signature is optional and its sizes take 4 or 8 bytes (ZIP64);
+        the right layout is the one matching what was actually read.
+        """
+        data = self.reader.read(4)
+        if data == DATA_DESCRIPTOR:
+            data = self.reader.read(4)
+        crc = unpack("<I", data)[0]
+        sizes = self.reader.read(8)
+        if not self.zip64 and unpack("<II", sizes) == (
+            self.consumed % 2**32,
+            size % 2**32,
+        ):
+            return (crc,) + unpack("<II", sizes)
+        sizes += self.reader.read(8)
+        return (crc,) + unpack("<QQ", sizes)
+
+    def _inflate(self):
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        while not decompressor.eof:
+            compressed = self.reader.read_some()
+            try:
+                data = decompressor.decompress(compressed)
+            except zlib.error as e:
+                raise ValueError("Corrupted member {}: {}".format(self.name, e))
+            self.consumed += len(compressed) - len(decompressor.unused_data)
+            if data:
+                yield data
+        self.reader.unread(decompressor.unused_data)
+
+    def _stored(self):
+        remaining = self.compressed_size
+        while remaining:
+            data = self.reader.read_some()
+            if len(data) > remaining:
+                self.reader.unread(data[remaining:])
+                data = data[:remaining]
+            remaining -= len(data)
+            self.consumed += len(data)
+            yield data
+
+
+def write_file(path, chunks):
+    """Write ``chunks`` to ``path`` through a temporary file renamed into place"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _destination(directory, name):
+    """Path of a member inside ``directory``, refusing paths escaping it"""
+    path = os.path.normpath(os.path.join(directory, name))
+    if os.path.isabs(name) or os.path.commonpath([directory, path]) != directory:
+        raise ValueError("Unsafe member path {!r}".format(name))
+    return path
+
+
+def extract_archive(chunks, directory=None, callback=None):
+    """Extract a ZIP stream while it downloads, without a temporary ZIP file
+
+    Each member is written to ``directory`` (keeping the archive's
+    Patient/Study/Series layout) through a temporary file renamed into place,
+    so files are complete as soon as they appear. Alternatively, each member
+    is handed to ``callback``.
+
+    Example:
+
+        >>> extract_archive(orthanc.get_study_archive(<id>), '/data/export')
+        ['/data/export/PATIENT/STUDY/CT SERIES/CT000000.dcm', ...]
+
+    :param iterable chunks:
+        ZIP stream, e.g. ``get_study_archive(...)``
+    :param str directory:
+        Destination directory
+    :param callable callback:
+        Called with ``(member name, member bytes)`` instead of writing files
+    :return:
+        Written paths, or member names with a callback
+    :rtype:
+        list
+    :raises ValueError:
+        Malformed archive, or a member path outside ``directory``
+    """
+    if (directory is None) == (callback is None):
+        raise ValueError("Provide either directory or callback")
+    if directory is not None:
+        directory = os.path.abspath(directory)
+    extracted = []
+    for name, data in iter_zip(chunks):
+        if name.endswith("/"):  # directory entry
+            continue
+        if callback is not None:
+            callback(name, b"".join(data))
+            extracted.append(name)
+            continue
+        path = _destination(directory, name)
+        write_file(path, data)
+        extracted.append(path)
+    return extracted
+
+
+def stream_job_output(
+    orthanc, job, key="archive", progress=None, attempts=5, backoff=1.0
+):
+    """Wait for a job, then stream its output, resuming after transient failures
+
+    When the download breaks (connection reset, proxy timeout...), it is
+    retried from the last byte received: with a ``Range`` request when the
+    server honours it, otherwise by skipping the bytes already yielded.
+
+    :param beren.Orthanc orthanc:
+        The client
+    :param beren.Job job:
+        Handle of the job, see :meth:`beren.Orthanc.track_job`
+    :param str key:
+        Output name (default: "archive")
+    :param callable progress:
+        Called with the job handle whenever its progress changes (optional)
+    :param int attempts:
+        Consecutive failed attempts before giving up (default: 5)
+    :param float backoff:
+        Seconds before the first retry, doubled on every failure (default: 1)
+    :return:
+        Yields ``bytes`` chunks
+    :rtype:
+        generator
+    :raises beren.JobFailed:
+        The job failed
+    """
+    reported = None
+    while not job.done():
+        wait([job], timeout=1.0)
+        if progress is not None and job.progress != reported:
+            reported = job.progress
+            progress(job)
+    job.result()
+
+    received = 0
+    failures = 0
+    while True:
+        headers = {"Range": "bytes={}-".format(received)} if received else {}
+        try:
+            response = orthanc.stream_job_output(
+                job.id, key, headers=headers, return_raw_response_object=True
+            )
+            skip = received if response.status_code != 206 else 0
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                if skip:
+                    if len(chunk) <= skip:
+                        skip -= len(chunk)
+                        continue
+                    chunk, skip = chunk[skip:], 0
+                received += len(chunk)
+                failures = 0
+                yield chunk
+            return
+        except RequestException as e:
+            status = getattr(e.response, "status_code", None)
+            failures += 1
+            if failures >= attempts or (status and 400 <= status < 500):
+                raise
+            sleep(backoff * 2 ** (failures - 1))
@@ -0,0 +1,167 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from beren.jobs import JobFailed, JobManager
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, wait
+from requests.exceptions import RequestException
+
+__all__ = ["BulkResult", "bulk_anonymize", "bulk_modify"]
+
+# Single-resource operations creating new resources, by level
+OPERATIONS = {
+    ("anonymize", "Patient"): "anonymize_patient",
+    ("anonymize", "Study"): "anonymize_study",
+    ("anonymize", "Series"): "anonymize_series",
+    ("modify", "Patient"): "modify_patient",
+    ("modify", "Study"): "modify_study",
+    ("modify", "Series"): "modify_series",
+}
+
+BulkResult = namedtuple("BulkResult", ["old_id", "new_id", "job_id", "error"])
+BulkResult.__doc__ = """Outcome of one resource of a bulk operation
+
+``new_id`` is None and ``error`` describes the failure when the operation
+did not succeed.
+"""
+
+
+def _run(orthanc, operation, level, ids, query, data, concurrency, interval):
+    """Check the arguments now, return the generator doing the work"""
+    try:
+        method = getattr(orthanc, OPERATIONS[operation, level])
+    except KeyError:
+        raise ValueError("Cannot {} at the {} level".format(operation, level))
+    if (ids is None) == (query is None):
+        raise ValueError("Provide either ids or query")
+    body = dict(data or {}, Asynchronous=True)
+    return _results(orthanc, method, level, ids, query, body, concurrency, interval)
+
+
+def _results(orthanc, method, level, ids, query, body, concurrency, interval):
+    if query is not None:
+        ids = orthanc.find(query, level)
+    pending = iter(ids)
+    jobs = {}  # handle -> old resource id
+
+    with JobManager(
+        orthanc, min_interval=min(0.2, interval), max_interval=interval
+    ) as manager:
+        while True:
+            for id_ in pending:
+                try:
+                    job = manager.track(method(id_, body))
+                except RequestException as e:
+                    yield BulkResult(id_, None, None, str(e))
+                    continue
+                jobs[job] = id_
+                if len(jobs) >= concurrency:
+                    break
+            if not jobs:
+                return
+            done, _ = wait(jobs, return_when=FIRST_COMPLETED)
+            for job in done:
+                old_id = jobs.pop(job)
+                try:
+                    new_id = job.result().get("ID")
+                except JobFailed as e:
+                    yield BulkResult(
+                        old_id,
+                        None,
+                        job.id,
+                        e.info.get("ErrorDescription") or "Job failed",
+                    )
+                else:
+                    yield BulkResult(old_id, new_id, job.id, None)
+
+
+def bulk_anonymize(
+    orthanc,
+    ids=None,
+    level="Study",
+    query=None,
+    data=None,
+    concurrency=4,
+    interval=1.0,
+):
+    """Anonymize many resources with asynchronous jobs
+
+    Each resource is submitted as an asynchronous Orthanc job, keeping at
+    most ``concurrency`` jobs in flight, and results are yielded as jobs end
+    (not in submission order).
+
+    Example:
+
+        >>> for result in bulk_anonymize(orthanc, query={"StudyDescription": "*LUNG*"}):
+        ...     if result.error:
+        ...         print("failed", result.old_id, result.error)
+        ...     else:
+        ...         mapping[result.old_id] = result.new_id
+
+    :param beren.Orthanc orthanc:
+        The client
+    :param list ids:
+        Resource UUIDs
+    :param str level:
+        "Patient", "Study", or "Series" (default: "Study")
+    :param dict query:
+        Anonymize the resources matching this ``find`` query instead of ``ids``
+    :param dict data:
+        Anonymization request body (Keep, Replace, Remove, KeepPrivateTags...)
+    :param int concurrency:
+        Maximum number of jobs in flight (default: 4)
+    :param float interval:
+        Longest time between job status checks, in seconds (default: 1)
+    :return:
+        Yields a :class:`BulkResult` per resource
+    :rtype:
+        generator
+    :raises ValueError:
+        Unsupported level, or both or neither of ``ids`` and ``query``
+    """
+    return _run(orthanc, "anonymize", level, ids, query, data, concurrency, interval)
+
+
+def bulk_modify(
+    orthanc,
+    data,
+    ids=None,
+    level="Study",
+    query=None,
+    concurrency=4,
+    interval=1.0,
+):
+    """Modify many resources with asynchronous jobs
+
+    Like :func:`bulk_anonymize`, with a modification request body.
+
+    :param beren.Orthanc orthanc:
+        The client
+    :param dict data:
+        Modification request body (Replace, Remove, Force...)
+    :param list ids:
+        Resource UUIDs
+    :param str level:
+        "Patient", "Study", or "Series" (default: "Study")
+    :param dict query:
+        Modify the resources matching this ``find`` query instead of ``ids``
+    :param int concurrency:
+        Maximum number of jobs in flight (default: 4)
+    :param float interval:
+        Longest time between job status checks, in seconds (default: 1)
+    :return:
+        Yields a :class:`BulkResult` per resource
+    :rtype:
+        generator
+    """
+    return _run(orthanc, "modify", level, ids, query, data, concurrency, interval)
@@ -0,0 +1,526 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+from copy import deepcopy
+from hashlib import sha256
+from tempfile import mkstemp
+from threading import Lock, local
+from time import monotonic, time
+import json
+import os
+import sqlite3
+
+__all__ = ["DiskCache", "FindCache", "SQLiteCache"]
+
+
+def cache_key(*parts):
+    """Stable key for the given identifying parts"""
+    return sha256("\x00".join(str(p) for p in parts).encode()).hexdigest()
+
+
+def normalize_find(query, level, expand=False, limit=None):
+    """Canonical form of a ``tools/find`` request, for use as a cache key
+
+    Queries differing only in key order, surrounding whitespace, level case,
+    or universal ``"*"`` constraints (which match everything) give the same
+    string.
+
+    :rtype:
+        str
+    """
+    constraints = {}
+    for tag, value in (query or {}).items():
+        if isinstance(value, str):
+            value = value.strip()
+            if value == "*":
+                continue
+        constraints[tag.strip()] = value
+    body = {
+        "Query": constraints,
+        "Level": level.capitalize(),
+        "Expand": bool(expand),
+        "Limit": int(limit) if limit else None,
+    }
+    return json.dumps(body, sort_keys=True, separators=(",", ":"))
+
+
+# Marks a miss, None being a valid cached value
+_MISSING = object()
+
+
+class DiskCache:
+    """
+    Persistent cache of immutable payloads (instance files, frames, tags).
+
+    Entries are files named after the SHA-256 of what identifies them (server,
+    resource UUID, and variant), spread over 256 subdirectories. Writes go to
+    a temporary file renamed into place, so concurrent processes sharing the
+    directory never see partial entries. When the total size exceeds
+    ``max_size``, the least recently used entries (by modification time,
+    refreshed on every hit) are removed until the cache is back under
+    ``low_water`` of the cap.
+
+    Each process tracks the size from its own writes. Past ``low_water`` of
+    the cap, it rescans the directory every ``max_size / 100`` bytes it
+    writes, so the cap holds for processes sharing the directory, give or
+    take 1% per process.
+
+    :param str directory:
+        Cache directory, created if needed
+    :param int max_size:
+        Size cap in bytes (default: 10 GiB)
+    :param float low_water:
+        Fraction of ``max_size`` kept after an eviction (default: 0.9)
+    :param int chunk_size:
+        Size of the chunks yielded when reading entries (default: 1 MiB)
+    """
+
+    def __init__(
+        self, directory, max_size=10 * 1024**3, low_water=0.9, chunk_size=1024**2
+    ):
+        self.directory = os.path.abspath(directory)
+        self.max_size = max_size
+        self.low_water = low_water
+        self.chunk_size = chunk_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = None  # estimate, rescanned on eviction
+        self._unscanned = 0  # bytes written since the last scan
+        self._lock = Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __repr__(self):
+        return "<DiskCache({}, hits={}, misses={})>".format(
+            self.directory, self.hits, self.misses
+        )
+
+    def stats(self):
+        """Hit/miss statistics of this process
+
+        :rtype:
+            dict
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "size": self.size(),
+        }
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _open(self, key):
+        """Open the entry for reading and mark it as recently used, or None"""
+        path = self._path(key)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return f
+
+    def _read(self, f):
+        with f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def _write(self, key, chunks):
+        """Store the entry atomically while yielding ``chunks`` through"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+                    yield chunk
+            os.replace(tmp, path)
+        except BaseException:
+            # Includes the consumer closing the generator early
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        self._added(size)
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def stream(self, key, fetch):
+        """Yield the entry's chunks, fetching and storing it on a miss
+
+        The fetch happens immediately, so errors surface at call time as
+        with the uncached endpoints.
+
+        :param str key:
+            Entry key, see :func:`cache_key`
+        :param callable fetch:
+            Returns an iterable of ``bytes`` chunks
+        :rtype:
+            generator
+        """
+        f = self._open(key)
+        if f is not None:
+            return self._read(f)
+        return self._write(key, fetch())
+
+    def get_json(self, key, fetch):
+        """Return the cached JSON value, fetching and storing it on a miss
+
+        :param str key:
+            Entry key, see :func:`cache_key`
+        :param callable fetch:
+            Returns a JSON-serializable value
+        """
+        f = self._open(key)
+        if f is not None:
+            with f:
+                return json.load(f)
+        value = fetch()
+        for _ in self._write(key, [json.dumps(value).encode()]):
+            pass
+        return value
+
+    def clear(self):
+        """Remove every entry"""
+        for path, _, _ in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with self._lock:
+            self._size = 0
+
+    def size(self):
+        """Total size of the entries in bytes"""
+        return sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        for sub in os.scandir(self.directory):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.startswith(".tmp-"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:  # removed by another process
+                    continue
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def _added(self, size):
+        with self._lock:
+            self._unscanned += size
+            if self._size is not None:
+                self._size += size
+            # Other processes write to the directory too, check its actual size
+            scan = self._size is None or (
+                self._size > self.max_size * self.low_water
+                and self._unscanned >= self.max_size / 100
+            )
+        if scan:
+            total = self.size()
+            with self._lock:
+                self._size = total
+                self._unscanned = 0
+        if self._size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until under the low water mark
+
+        Safe to run from several processes at once: files already removed by
+        another process are skipped.
+        """
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_size * self.low_water
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self.evictions += 1
+        with self._lock:
+            self._size = total
+            self._unscanned = 0
+
+
+class SQLiteCache:
+    """
+    Metadata cache shared by every process of a host.
+
+    Values are JSON documents stored in a SQLite database in WAL mode, so one
+    worker's fetch is reused by all the others (gunicorn or Celery workers
+    pointing at the same file) while readers never block the writer. Entries
+    expire after ``ttl`` seconds, since metadata such as a study still
+    receiving instances can change. Expired entries are deleted by
+    :meth:`set` every ``purge_interval`` seconds, so the database does not
+    grow without bound.
+
+    Each thread (and each process after a fork) opens its own connection.
+
+    :param str path:
+        Database file, created if needed
+    :param float ttl:
+        Lifetime of entries in seconds (default: 60)
+    :param float timeout:
+        Seconds to wait for a lock held by another process (default: 5)
+    :param float purge_interval:
+        Seconds between two deletions of expired entries (default: 300)
+    """
+
+    def __init__(self, path, ttl=60, timeout=5, purge_interval=300):
+        self.path = os.path.abspath(path)
+        self.ttl = ttl
+        self.timeout = timeout
+        self.purge_interval = purge_interval
+        self._purged = monotonic()
+        self.hits = 0
+        self.misses = 0
+        self._local = local()
+        self._lock = Lock()
+        with self._connection() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)"
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires)"
+            )
+
+    def __repr__(self):
+        return "<SQLiteCache({}, hits={}, misses={})>".format(
+            self.path, self.hits, self.misses
+        )
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=self.timeout)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def stats(self):
+        """Hit/miss statistics of this process
+
+        :rtype:
+            dict
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+    def get(self, key, default=None):
+        """The cached value, or ``default`` when missing or expired"""
+        row = (
+            self._connection()
+            .execute(
+                "SELECT value FROM entries WHERE key = ? AND expires > ?", (key, time())
+            )
+            .fetchone()
+        )
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        """Store ``value`` for ``ttl`` seconds (default: the cache's ``ttl``)"""
+        expires = time() + (self.ttl if ttl is None else ttl)
+        with self._connection() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires),
+            )
+        with self._lock:
+            purge = monotonic() - self._purged >= self.purge_interval
+            if purge:
+                self._purged = monotonic()
+        if purge:
+            self.purge()
+
+    def get_json(self, key, fetch):
+        """Return the cached value, fetching and storing it on a miss
+
+        :param str key:
+            Entry key, see :func:`cache_key`
+        :param callable fetch:
+            Returns a JSON-serializable value
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:  # a cached null is a hit
+            value = fetch()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key):
+        """Remove a single entry"""
+        with self._connection() as db:
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def purge(self):
+        """Remove expired entries"""
+        with self._connection() as db:
+            db.execute("DELETE FROM entries WHERE expires <= ?", (time(),))
+
+    def clear(self):
+        """Remove every entry"""
+        with self._connection() as db:
+            db.execute("DELETE FROM entries")
+
+
+class FindCache:
+    """
+    Cache of ``find`` results, valid until the server records a change.
+
+    Every entry remembers the server's change sequence (``Last`` of
+    ``get_changes(last=True)``) read before the query ran. A lookup reuses
+    the entry only while the sequence has not moved: any new, modified, or
+    deleted resource invalidates every cached query of that server. The
+    sequence itself is read at most once per ``check_interval`` seconds,
+    so repeated queries cost one small request instead of a full scan.
+
+    Every call returns its own copy of the result, so callers may sort or
+    extend it without affecting the others.
+
+    :param int max_entries:
+        Entries kept in memory, least recently used dropped first (default: 256)
+    :param float check_interval:
+        Seconds during which a read change sequence is trusted (default: 1)
+    :param beren.SQLiteCache store:
+        Keep entries there instead of in memory, to share them between
+        processes (optional)
+    """
+
+    def __init__(self, max_entries=256, check_interval=1.0, store=None):
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._sequences = {}
+        self._lock = Lock()
+
+    def __repr__(self):
+        return "<FindCache(hits={}, misses={})>".format(self.hits, self.misses)
+
+    def stats(self):
+        """Hit/miss statistics of this process
+
+        :rtype:
+            dict
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+        }
+
+    def sequence(self, server, fetch_sequence):
+        """Current change sequence of ``server``, re-read when too old"""
+        now = monotonic()
+        with self._lock:
+            checked = self._sequences.get(server)
+        if checked is not None and now - checked[0] < self.check_interval:
+            return checked[1]
+        last = fetch_sequence()
+        with self._lock:
+            self._sequences[server] = (now, last)
+        return last
+
+    def _load(self, key):
+        if self.store is not None:
+            return self.store.get(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        return deepcopy(entry)
+
+    def _save(self, key, entry):
+        if self.store is not None:
+            self.store.set(key, entry)
+            return
+        entry = deepcopy(entry)  # the caller keeps the original
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_json(self, server, body, fetch, fetch_sequence):
+        """Return the cached result of a query, running it when stale
+
+        :param str server:
+            Server URL, cached sequences and entries are per server
+        :param str body:
+            Normalized query, see :func:`normalize_find`
+        :param callable fetch:
+            Runs the query
+        :param callable fetch_sequence:
+            Returns the server's current change sequence
+        """
+        key = cache_key(server, "find", body)
+        sequence = self.sequence(server, fetch_sequence)
+        entry = self._load(key)
+        if entry is not None and entry["Sequence"] == sequence:
+            with self._lock:
+                self.hits += 1
+            return entry["Result"]
+        with self._lock:
+            self.misses += 1
+        result = fetch()
+        self._save(key, {"Sequence": sequence, "Result": result})
+        return result
+
+    def clear(self):
+        """Forget every entry and sequence"""
+        with self._lock:
+            self._entries.clear()
+            self._sequences.clear()
+        if self.store is not None:
+            self.store.clear()
@@ -0,0 +1,93 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+
+__all__ = ["available_decoders", "get_decoder"]
+
+
+def _stdlib():
+    return json.loads
+
+
+def _orjson():
+    import orjson
+
+    return orjson.loads
+
+
+def _msgspec():
+    import msgspec
+
+    return msgspec.json.Decoder().decode
+
+
+def _ujson():
+    import ujson
+
+    return ujson.loads
+
+
+# Ordered from fastest to slowest, "auto" picks the first one installed
+DECODERS = {
+    "orjson": _orjson,
+    "msgspec": _msgspec,
+    "ujson": _ujson,
+    "json": _stdlib,
+}
+
+
+def available_decoders():
+    """List the names of the JSON decoders that can be imported
+
+    :return:
+        Decoder names, fastest first
+    :rtype:
+        list (str)
+    """
+    names = []
+    for name, loader in DECODERS.items():
+        try:
+            loader()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def get_decoder(decoder="auto"):
+    """Resolve a JSON decoder
+
+    :param decoder:
+        A decoder name ("orjson", "msgspec", "ujson", "json"), "auto" for the
+        fastest installed one, or a callable taking the raw response bytes
+    :return:
+        Callable decoding ``bytes`` into Python objects
+    :rtype:
+        callable
+    :raises ValueError:
+        Unknown decoder name
+    :raises ImportError:
+        The named decoder is not installed
+    """
+    if callable(decoder):
+        return decoder
+    if decoder == "auto":
+        decoder = available_decoders()[0]
+    try:
+        loader = DECODERS[decoder]
+    except KeyError:
+        raise ValueError(
+            "Decoder must be a callable, 'auto', or one of {}".format(list(DECODERS))
+        )
+    return loader()
@@ -0,0 +1,233 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from beren.archive import extract_archive, iter_zip, write_file
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+__all__ = ["DownloadPlan", "download_study", "plan_study_download"]
+
+STRATEGIES = ("archive", "series", "instances")
+
+DownloadPlan = namedtuple("DownloadPlan", ["strategy", "items", "size", "instances"])
+DownloadPlan.__doc__ = """How to download a study
+
+``strategy`` is "archive" (``items`` holds the study UUID), "series" (series
+UUIDs, one archive each), or "instances" (``(series UUID, instance UUID)``
+pairs, one file each). ``size`` is the size of the DICOM files in bytes.
+"""
+
+
+def _archive_name(values, default):
+    """Name Orthanc gives a directory or file in its archives"""
+    name = " ".join(value for value in values if value)
+    name = "".join(c for c in name if 32 <= ord(c) < 127)  # ASCII only
+    name = name.replace("/", "_").replace("\\", "_").strip()
+    return name or default
+
+
+def _series_layout(orthanc, id_, directory):
+    """Directory, file name prefix, and instances of every series of a study
+
+    Series directories are named as in Orthanc's archives, made unique when
+    several series share a modality and description.
+    """
+    study = orthanc.get_study(id_)
+    patient_tags = study.get("PatientMainDicomTags", {})
+    study_tags = study.get("MainDicomTags", {})
+    study_dir = os.path.join(
+        directory,
+        _archive_name(
+            [patient_tags.get("PatientID"), patient_tags.get("PatientName")],
+            "Unknown Patient",
+        ),
+        _archive_name(
+            [study_tags.get("AccessionNumber"), study_tags.get("StudyDescription")],
+            "Unknown Study",
+        ),
+    )
+    layout = {}
+    used = set()
+    for series in orthanc.get_study_series(id_):
+        tags = series.get("MainDicomTags", {})
+        modality = tags.get("Modality")
+        name = _archive_name(
+            [modality, tags.get("SeriesDescription")], "Unknown Series"
+        )
+        folder, n = name, 1
+        while folder in used:  # e.g. several series without description
+            n += 1
+            folder = "{}_{}".format(name, n)
+        used.add(folder)
+        prefix = _archive_name([modality], "IM")
+        layout[series["ID"]] = (
+            os.path.join(study_dir, folder),
+            prefix,
+            series["Instances"],
+        )
+    return layout
+
+
+def _instance_paths(layout):
+    """Path of every instance of a study, named as in Orthanc's archives"""
+    paths = {}
+    for folder, prefix, instances in layout.values():
+        for index, instance in enumerate(instances):
+            paths[instance] = os.path.join(folder, "{}{:06d}.dcm".format(prefix, index))
+    return paths
+
+
+def plan_study_download(
+    orthanc, id_, strategy="auto", split_size=256 * 1024**2, workers=4
+):
+    """Choose how to download a study
+
+    Small studies (under ``split_size`` bytes) are downloaded as a single
+    archive, which Orthanc builds on one thread. Larger ones are split so
+    that ``workers`` requests run at once: one archive per series when the
+    instances are spread over enough series, otherwise (a few huge series,
+    e.g. mammography or a single thin-slice CT) one request per instance.
+
+    :param beren.Orthanc orthanc:
+        The client
+    :param str id_:
+        Study UUID
+    :param str strategy:
+        "auto", or force "archive", "series", or "instances"
+    :param int split_size:
+        Size in bytes from which the download is split (default: 256 MiB)
+    :param int workers:
+        Number of concurrent requests the split is planned for (default: 4)
+    :rtype:
+        DownloadPlan
+    :raises ValueError:
+        Unknown strategy
+    """
+    if strategy != "auto" and strategy not in STRATEGIES:
+        raise ValueError("Unknown strategy {!r}".format(strategy))
+    statistics = orthanc.get_study_statistics(id_)
+    size = int(
+        statistics.get("DicomDiskSize") or statistics.get("UncompressedSize") or 0
+    )
+    count = int(statistics.get("CountInstances", 0))
+    if strategy == "auto" and size < split_size:
+        strategy = "archive"
+    if strategy == "archive":
+        return DownloadPlan("archive", [id_], size, count)
+
+    series = orthanc.get_study_series(id_)
+    if strategy == "auto":
+        largest = max((len(s["Instances"]) for s in series), default=0)
+        # Per-series archives keep every worker busy only with enough
+        # series and none dominating
+        spread = len(series) >= workers and largest <= count / 2
+        strategy = "series" if spread else "instances"
+    if strategy == "series":
+        # Largest first, so the longest download starts right away
+        ordered = sorted(series, key=lambda s: len(s["Instances"]), reverse=True)
+        return DownloadPlan("series", [s["ID"] for s in ordered], size, count)
+    items = [(s["ID"], i) for s in series for i in s["Instances"]]
+    return DownloadPlan("instances", items, size, count)
+
+
+def _download_instance(orthanc, path, instance_id, options):
+    write_file(path, orthanc.get_instance_file(instance_id, **options))
+    return [path]
+
+
+def _download_series(orthanc, folder, series_id, options):
+    """Extract a series archive into the series' own directory"""
+    paths = []
+    for name, data in iter_zip(orthanc.get_series_archive(series_id, **options)):
+        if name.endswith("/"):  # directory entry
+            continue
+        # Series sharing a description share a directory in their archives
+        filename = os.path.basename(name)
+        if filename in ("", ".", ".."):
+            raise ValueError("Unsafe member path {!r}".format(name))
+        path = os.path.join(folder, filename)
+        write_file(path, data)
+        paths.append(path)
+    return paths
+
+
+def download_study(
+    orthanc, id_, directory, workers=4, plan=None, transcode=None, **kwargs
+):
+    """Download a study to a directory, split into concurrent requests when large
+
+    Archives are extracted while they download (see
+    :func:`beren.extract_archive`). Files are laid out as in Orthanc's
+    archives: ``<PatientID PatientName>/<AccessionNumber
+    StudyDescription>/<Modality SeriesDescription>/CT000000.dcm``. With the
+    "series" and "instances" strategies, the directories are computed here
+    and made unique (``CT AXIAL``, ``CT AXIAL_2``...) when series share a
+    description; files keep the names of the series archives, or are named
+    the same way when downloaded one by one. The "archive" strategy keeps
+    the names chosen by Orthanc, which may differ in such details (e.g. how
+    duplicate series directories are told apart). Every file is written
+    atomically.
+
+    Example:
+
+        >>> plan = orthanc.plan_study_download(<id>)
+        >>> plan.strategy, len(plan.items)
+        ('series', 12)
+        >>> paths = orthanc.download_study(<id>, '/data/export', plan=plan)
+
+    :param beren.Orthanc orthanc:
+        The client
+    :param str id_:
+        Study UUID
+    :param str directory:
+        Destination directory
+    :param int workers:
+        Number of concurrent requests (default: 4)
+    :param DownloadPlan plan:
+        Plan to follow (default: :func:`plan_study_download` with ``kwargs``)
+    :param str transcode:
+        Transfer syntax the server transcodes the files to (optional)
+    :return:
+        Written paths
+    :rtype:
+        list
+    """
+    if plan is None:
+        plan = plan_study_download(orthanc, id_, workers=workers, **kwargs)
+    directory = os.path.abspath(directory)
+    options = {} if transcode is None else {"transcode": transcode}
+    if plan.strategy == "archive":
+        return extract_archive(orthanc.get_study_archive(id_, **options), directory)
+    layout = _series_layout(orthanc, id_, directory)
+    if plan.strategy == "series":
+        task = lambda series_id: _download_series(
+            orthanc, layout[series_id][0], series_id, options
+        )
+    else:
+        locations = _instance_paths(layout)
+        task = lambda item: _download_instance(
+            orthanc, locations[item[1]], item[1], options
+        )
+
+    paths = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(task, item) for item in plan.items]
+        try:
+            for future in futures:
+                paths.extend(future.result())
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    return paths
@@ -12,6 +12,7 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from apiron import JsonEndpoint, StreamingEndpoint, Endpoint, Service
+from .streaming import GzipStreamingEndpoint, JsonStreamingEndpoint
 
 __all__ = ["OrthancInstances"]
 
@@ -19,6 +20,7 @@ __all__ = ["OrthancInstances"]
 class OrthancInstances(Service):
 
     instances = JsonEndpoint(path="instances/")
+    instances_stream = JsonStreamingEndpoint(path="instances/")
     add_instance = JsonEndpoint(path="instances/", default_method="POST")
     instance = JsonEndpoint(path="instances/{id_}/")
     del_instance = JsonEndpoint(path="instances/{id_}/", default_method="DELETE")
@@ -65,6 +67,7 @@ class OrthancInstances(Service):
     file_ = StreamingEndpoint(path="instances/{id_}/file/")
     frames = JsonEndpoint(path="instances/{id_}/frames/")
     frame = StreamingEndpoint(path="instances/{id_}/frames/{number}/{format_}/")
+    frame_raw_gz = GzipStreamingEndpoint(path="instances/{id_}/frames/{number}/raw.gz/")
     frame_preview = StreamingEndpoint(path="instances/{id_}/frames/{number}/preview/")
     header = JsonEndpoint(path="instances/{id_}/header/")
     image = StreamingEndpoint(path="instances/{id_}/{format_}/")
@@ -12,6 +12,7 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from apiron import JsonEndpoint, StreamingEndpoint, Endpoint, Service
+from .streaming import ChunkedStreamingEndpoint, JsonStreamingEndpoint
 
 __all__ = ["OrthancServer"]
 
@@ -31,6 +32,7 @@ class OrthancServer(Service):
     resubmit_job = JsonEndpoint(path="jobs/{id_}/resubmit/", default_method="POST")
     resume_job = JsonEndpoint(path="jobs/{id_}/resume/", default_method="POST")
     job_output = JsonEndpoint(path="jobs/{id_}/{key}/")
+    job_output_stream = ChunkedStreamingEndpoint(path="jobs/{id_}/{key}/")
 
     peers = JsonEndpoint(path="peers/")
     peer = JsonEndpoint(path="peers/{peer}/")
@@ -45,16 +47,19 @@ class OrthancServer(Service):
     statistics = JsonEndpoint(path="statistics/")
     system = JsonEndpoint(path="system/")
 
-    tools_create_archive = StreamingEndpoint(
+    tools_create_archive = ChunkedStreamingEndpoint(
+        path="tools/create-archive/", default_method="POST"
+    )
+    tools_create_archive_job = JsonEndpoint(
         path="tools/create-archive/", default_method="POST"
     )
     tools_create_dicom = StreamingEndpoint(
         path="tools/create-dicom/", default_method="POST"
     )
-    tools_create_media = StreamingEndpoint(
+    tools_create_media = ChunkedStreamingEndpoint(
         path="tools/create-media/", default_method="POST"
     )
-    tools_create_media_extended = StreamingEndpoint(
+    tools_create_media_extended = ChunkedStreamingEndpoint(
         path="tools/create-media-extended/", default_method="POST"
     )
     tools_default_encoding = Endpoint(path="tools/default-encoding/")
@@ -69,6 +74,7 @@ class OrthancServer(Service):
         path="tools/execute-script/", default_method="POST"
     )
     tools_find = JsonEndpoint(path="tools/find/", default_method="POST")
+    tools_find_stream = JsonStreamingEndpoint(path="tools/find/", default_method="POST")
     tools_generate_uid = Endpoint(path="tools/generate-uid/")
     tools_invalidate_tags = JsonEndpoint(
         path="tools/invalidate-tags/", default_method="POST"
@@ -12,6 +12,7 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from apiron import JsonEndpoint, StreamingEndpoint, Endpoint, Service
+from .streaming import ChunkedStreamingEndpoint, JsonStreamingEndpoint
 
 __all__ = ["OrthancPatients"]
 
@@ -19,10 +20,12 @@ __all__ = ["OrthancPatients"]
 class OrthancPatients(Service):
 
     patients = JsonEndpoint(path="patients/")
+    patients_stream = JsonStreamingEndpoint(path="patients/")
     patient = JsonEndpoint(path="patients/{id_}/")
     del_patient = JsonEndpoint(path="patients/{id_}/", default_method="DELETE")
     anonymize = JsonEndpoint(path="patients/{id_}/anonymize/", default_method="POST")
-    archive = StreamingEndpoint(path="patients/{id_}/archive/")
+    archive = ChunkedStreamingEndpoint(path="patients/{id_}/archive/")
+    archive_job = JsonEndpoint(path="patients/{id_}/archive/", default_method="POST")
     attachments = JsonEndpoint(path="patients/{id_}/attachments")
     attachment = JsonEndpoint(path="patients/{id_}/attachment/{name}/")
     del_attachment = JsonEndpoint(
@@ -57,6 +60,7 @@ class OrthancPatients(Service):
     )
     instances = JsonEndpoint(path="patients/{id_}/instances/")
     instances_tags = JsonEndpoint(path="patients/{id_}/instances-tags/")
+    instances_tags_stream = JsonStreamingEndpoint(path="patients/{id_}/instances-tags/")
     list_metadata = JsonEndpoint(path="patients/{id_}/metadata/")
     metadata = Endpoint(path="patients/{id_}/metadata/{name}/")
     del_metadata = JsonEndpoint(
@@ -67,7 +71,7 @@ class OrthancPatients(Service):
     )
     modify = JsonEndpoint(path="patients/{id_}/modify/", default_method="POST")
     module = JsonEndpoint(path="patients/{id_}/module/")
-    media = StreamingEndpoint(path="patients/{id_}/media/")
+    media = ChunkedStreamingEndpoint(path="patients/{id_}/media/")
     protected = Endpoint(path="patients/{id_}/protected/")
     put_protected = Endpoint(path="patients/{id_}/protected/", default_method="PUT")
     reconstruct = JsonEndpoint(
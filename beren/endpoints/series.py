@@ -12,6 +12,7 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from apiron import JsonEndpoint, StreamingEndpoint, Service
+from .streaming import ChunkedStreamingEndpoint, JsonStreamingEndpoint
 
 __all__ = ["OrthancSeries"]
 
@@ -19,10 +20,12 @@ __all__ = ["OrthancSeries"]
 class OrthancSeries(Service):
 
     series = JsonEndpoint(path="series/")
+    series_stream = JsonStreamingEndpoint(path="series/")
     part = JsonEndpoint(path="series/{id_}/")
     del_part = JsonEndpoint(path="series/{id_}/", default_method="DELETE")
     anonymize = JsonEndpoint(path="series/{id_}/anonymize/", default_method="POST")
-    archive = StreamingEndpoint(path="series/{id_}/archive/")
+    archive = ChunkedStreamingEndpoint(path="series/{id_}/archive/")
+    archive_job = JsonEndpoint(path="series/{id_}/archive/", default_method="POST")
     attachments = JsonEndpoint(path="series/{id_}/attachments/")
     attachment = JsonEndpoint(path="series/{id_}/attachment/{name}/")
     del_attachment = JsonEndpoint(
@@ -57,7 +60,8 @@ class OrthancSeries(Service):
     )
     instances = JsonEndpoint(path="series/{id_}/instances/")
     instances_tags = JsonEndpoint(path="series/{id_}/instances-tags/")
-    media = StreamingEndpoint(path="series/{id_}/media/")
+    instances_tags_stream = JsonStreamingEndpoint(path="series/{id_}/instances-tags/")
+    media = ChunkedStreamingEndpoint(path="series/{id_}/media/")
     list_metadata = JsonEndpoint(path="series/{id_}/metadata/")
     metadata = JsonEndpoint(path="series/{id_}/metadata/{name}/")
     del_metadata = JsonEndpoint(
@@ -0,0 +1,57 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from apiron import StreamingEndpoint
+import zlib
+
+__all__ = [
+    "ChunkedStreamingEndpoint",
+    "GzipStreamingEndpoint",
+    "JsonStreamingEndpoint",
+]
+
+
+class ChunkedStreamingEndpoint(StreamingEndpoint):
+    """A binary endpoint streamed in bounded chunks, even when the server sends a Content-Length"""
+
+    chunk_size = 1024 * 1024
+
+    def format_response(self, response):
+        return response.iter_content(chunk_size=self.chunk_size)
+
+
+class GzipStreamingEndpoint(ChunkedStreamingEndpoint):
+    """A gzip file (e.g. a "raw.gz" frame) streamed and decompressed chunk by chunk"""
+
+    def format_response(self, response):
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        for chunk in response.iter_content(chunk_size=self.chunk_size):
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+        data = decompressor.flush()
+        if data:
+            yield data
+
+
+class JsonStreamingEndpoint(StreamingEndpoint):
+    """A JSON endpoint whose response body is streamed in fixed-size chunks instead of buffered"""
+
+    chunk_size = 64 * 1024
+
+    def format_response(self, response):
+        return response.iter_content(chunk_size=self.chunk_size)
+
+    @property
+    def required_headers(self):
+        return {"Accept": "application/json"}
@@ -12,6 +12,7 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from apiron import JsonEndpoint, StreamingEndpoint, Service
+from .streaming import ChunkedStreamingEndpoint, JsonStreamingEndpoint
 
 __all__ = ["OrthancStudies"]
 
@@ -19,10 +20,12 @@ __all__ = ["OrthancStudies"]
 class OrthancStudies(Service):
 
     studies = JsonEndpoint(path="/studies/")
+    studies_stream = JsonStreamingEndpoint(path="/studies/")
     study = JsonEndpoint(path="/studies/{id_}/")
     del_study = JsonEndpoint(path="/studies/{id_}/", default_method="DELETE")
     anonymize = JsonEndpoint(path="/studies/{id_}/anonymize/", default_method="POST")
-    archive = StreamingEndpoint(path="/studies/{id_}/archive/")
+    archive = ChunkedStreamingEndpoint(path="/studies/{id_}/archive/")
+    archive_job = JsonEndpoint(path="/studies/{id_}/archive/", default_method="POST")
     attachments = JsonEndpoint(path="studies/{id_}/attachments")
     attachment = JsonEndpoint(path="studies/{id_}/attachment/{name}/")
     del_attachment = JsonEndpoint(
@@ -57,7 +60,8 @@ class OrthancStudies(Service):
     )
     instances = JsonEndpoint(path="/studies/{id_}/instances/")
     instances_tags = JsonEndpoint(path="/studies/{id_}/instances-tags/")
-    media = StreamingEndpoint(path="/studies/{id_}/media/")
+    instances_tags_stream = JsonStreamingEndpoint(path="/studies/{id_}/instances-tags/")
+    media = ChunkedStreamingEndpoint(path="/studies/{id_}/media/")
     list_metadata = JsonEndpoint(path="studies/{id_}/metadata/")
     metadata = JsonEndpoint(path="studies/{id_}/metadata/{name}/")
     del_metadata = JsonEndpoint(
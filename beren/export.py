@@ -0,0 +1,233 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from functools import partial
+from itertools import chain
+from json import dumps
+
+__all__ = ["catalog_rows", "export_catalog"]
+
+FORMATS = ("parquet", "arrow")
+
+# Listing methods yielding expanded resources of a level, pageable with since/limit
+LISTINGS = {
+    "Patient": "stream_patients",
+    "Study": "stream_studies",
+    "Series": "stream_series",
+    "Instance": "stream_instances",
+}
+
+# Non-tag columns of each level: (column, JSON key, arrow type name)
+FIELDS = {
+    "Patient": [("CountStudies", "Studies", "count")],
+    "Study": [
+        ("ParentPatient", "ParentPatient", "string"),
+        ("CountSeries", "Series", "count"),
+    ],
+    "Series": [
+        ("ParentStudy", "ParentStudy", "string"),
+        ("Status", "Status", "string"),
+        ("ExpectedNumberOfInstances", "ExpectedNumberOfInstances", "int64"),
+        ("CountInstances", "Instances", "count"),
+    ],
+    "Instance": [
+        ("ParentSeries", "ParentSeries", "string"),
+        ("FileSize", "FileSize", "int64"),
+        ("FileUuid", "FileUuid", "string"),
+        ("IndexInSeries", "IndexInSeries", "int64"),
+    ],
+}
+
+# Column holding, as a JSON object, the tags first seen after the columns are fixed
+EXTRA = "ExtraTags"
+
+COMMON = [
+    ("ID", "ID", "string"),
+    ("IsStable", "IsStable", "bool"),
+    ("LastUpdate", "LastUpdate", "string"),
+    ("Labels", "Labels", "labels"),
+]
+
+
+def catalog_rows(orthanc, level="Instance", query=None, page_size=1000):
+    """Yield the expanded resources of a level, one at a time
+
+    Without a query, the whole listing is read in pages of ``page_size``
+    resources, each parsed incrementally. With a query, a single ``find``
+    request is parsed incrementally.
+
+    :param beren.Orthanc orthanc:
+        The client
+    :param str level:
+        "Patient", "Study", "Series", or "Instance"
+    :param dict query:
+        Only export resources matching this ``find`` query (optional)
+    :param int page_size:
+        Resources per listing request (default: 1000)
+    :rtype:
+        generator
+    """
+    if level not in LISTINGS:
+        raise ValueError("Unknown level {!r}".format(level))
+    if query is not None:
+        yield from orthanc.stream_find(query, level, expand=True)
+        return
+    listing = getattr(orthanc, LISTINGS[level])
+    since = 0
+    while True:
+        count = 0
+        for resource in listing(expand=True, since=since, limit=page_size):
+            count += 1
+            yield resource
+        if count < page_size:
+            return
+        since += count
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _flatten(resource, fields, tags):
+    """Columns of a resource: fixed fields, main DICOM tags, and the other tags"""
+    row = {}
+    for column, key, kind in fields:
+        value = resource.get(key)
+        row[column] = len(value) if kind == "count" and value is not None else value
+    flat = dict(resource.get("PatientMainDicomTags") or {})
+    flat.update(resource.get("MainDicomTags") or {})
+    extra = {}
+    for name, value in flat.items():
+        if name in tags:
+            row[name] = value
+        else:
+            extra[name] = value
+    return row, extra
+
+
+def export_catalog(
+    orthanc,
+    path,
+    level="Instance",
+    format="parquet",
+    query=None,
+    tags=None,
+    row_group_size=50000,
+    page_size=1000,
+    compression="zstd",
+):
+    """Write the expanded resources of a level to a Parquet or Arrow IPC file
+
+    Resources are read page by page and written in row groups of
+    ``row_group_size`` rows, so memory stays bounded whatever the size of the
+    archive. Each row holds the resource UUID, its parent UUID, stability,
+    last update, labels, level-specific fields (file size, number of
+    children...), and one string column per main DICOM tag (patient tags
+    included for studies).
+
+    The tag columns are ``tags`` if given, otherwise those found in the first
+    row group. In the latter case, tags only found later (e.g. in a
+    mixed-modality catalog) are kept as a JSON object in an ``ExtraTags``
+    column.
+
+    Requires pyarrow.
+
+    :param beren.Orthanc orthanc:
+        The client
+    :param str path:
+        Output file
+    :param str level:
+        "Patient", "Study", "Series", or "Instance" (default: "Instance")
+    :param str format:
+        "parquet" or "arrow" (IPC file format) (default: "parquet")
+    :param dict query:
+        Only export resources matching this ``find`` query (optional)
+    :param list tags:
+        Main DICOM tags to export as columns (optional)
+    :param int row_group_size:
+        Rows per row group (Parquet) or record batch (Arrow) (default: 50000)
+    :param int page_size:
+        Resources per listing request (default: 1000)
+    :param str compression:
+        Parquet compression codec (default: "zstd")
+    :return:
+        Number of rows written
+    :rtype:
+        int
+    :raises ValueError:
+        Unknown level or format
+    :raises ImportError:
+        pyarrow is not installed
+    """
+    if format not in FORMATS:
+        raise ValueError(
+            "Unknown format {!r}, use one of {}".format(format, ", ".join(FORMATS))
+        )
+    import pyarrow as pa
+
+    kinds = {
+        "string": pa.string(),
+        "bool": pa.bool_(),
+        "int64": pa.int64(),
+        "count": pa.int64(),
+        "labels": pa.list_(pa.string()),
+    }
+    fields = COMMON + FIELDS.get(level, [])
+    batches = _batches(catalog_rows(orthanc, level, query, page_size), row_group_size)
+    first = next(batches, [])
+    inferred = tags is None
+    if inferred:
+        tags = []
+        for resource in first:
+            for part in ("PatientMainDicomTags", "MainDicomTags"):
+                for name in resource.get(part) or ():
+                    if name not in tags:
+                        tags.append(name)
+    tags = [t for t in tags if t not in {column for column, _, _ in fields}]
+    schema = pa.schema(
+        [pa.field(column, kinds[kind]) for column, _, kind in fields]
+        + [pa.field(name, pa.string()) for name in tags]
+        + ([pa.field(EXTRA, pa.string())] if inferred else [])
+    )
+
+    if format == "parquet":
+        import pyarrow.parquet as pq
+
+        writer = pq.ParquetWriter(path, schema, compression=compression)
+        write = partial(writer.write_table, row_group_size=row_group_size)
+    else:
+        import pyarrow.ipc as ipc
+
+        writer = ipc.new_file(path, schema)
+        write = partial(writer.write_table, max_chunksize=row_group_size)
+
+    known = set(tags)
+    written = 0
+    with writer:
+        for batch in chain([first], batches):
+            flattened = []
+            for resource in batch:
+                row, extra = _flatten(resource, fields, known)
+                if inferred and extra:
+                    row[EXTRA] = dumps(extra, sort_keys=True)
+                flattened.append(row)
+            write(pa.Table.from_pylist(flattened, schema=schema))
+            written += len(flattened)
+    return written
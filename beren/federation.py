@@ -0,0 +1,215 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from beren.orthanc import Orthanc
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from requests.exceptions import RequestException
+from warnings import warn
+
+__all__ = ["FederatedOrthanc"]
+
+# DICOM tag identifying a resource of each level
+UID_TAGS = {
+    "Patient": "PatientID",
+    "Study": "StudyInstanceUID",
+    "Series": "SeriesInstanceUID",
+    "Instance": "SOPInstanceUID",
+}
+
+LISTINGS = {
+    "Patient": "get_patients",
+    "Study": "get_studies",
+    "Series": "get_series",
+    "Instance": "get_instances",
+}
+
+
+class FederatedOrthanc:
+    """
+    Query several Orthanc servers at once.
+
+    Every request is sent to all the servers concurrently. Results are merged
+    and deduplicated by DICOM UID (or Orthanc ID, which derives from the UIDs),
+    and each result lists the servers holding it in ``"Servers"``.
+
+    A server failing to answer is skipped with a warning, unless ``strict``.
+
+    Example:
+
+        >>> sites = FederatedOrthanc({'north': Orthanc(...), 'south': Orthanc(...)})
+        >>> for study in sites.find({'PatientName': 'DOE*'}, 'Study', expand=True):
+        ...     print(study['MainDicomTags']['StudyInstanceUID'], study['Servers'])
+
+    :param clients:
+        ``{name: beren.Orthanc}``, or a list of clients named after their URL
+    :param int workers:
+        Maximum number of concurrent requests (default: one per server)
+    :param bool strict:
+        Raise the error of a failing server instead of skipping it (default: False)
+    """
+
+    def __init__(self, clients, workers=None, strict=False):
+        if not isinstance(clients, dict):
+            clients = OrderedDict((client._target, client) for client in clients)
+        if not clients:
+            raise ValueError("No servers to federate")
+        self.clients = clients
+        self.workers = workers or len(clients)
+        self.strict = strict
+
+    def __repr__(self):
+        return "<FederatedOrthanc({})>".format(", ".join(self.clients))
+
+    @classmethod
+    def from_peers(cls, orthanc, auth=None, name="local", **kwargs):
+        """Federate a server with the peers it is configured with
+
+        :param beren.Orthanc orthanc:
+            Client of the server whose peers are used
+        :param auth:
+            Auth object for every peer, or ``{peer name: auth}`` (optional,
+            Orthanc does not disclose the peers' passwords)
+        :param str name:
+            Name of ``orthanc`` among the servers (default: "local"), or None
+            to leave it out
+        :param kwargs:
+            Passed to the peers' :class:`beren.Orthanc` clients (retry, cache...)
+        :rtype:
+            FederatedOrthanc
+        """
+        clients = OrderedDict()
+        if name is not None:
+            clients[name] = orthanc
+        peers = orthanc.get_peers(params={"expand": 1})
+        for peer, config in sorted(peers.items()):
+            peer_auth = auth.get(peer) if isinstance(auth, dict) else auth
+            clients[peer] = Orthanc(config["Url"], auth=peer_auth, **kwargs)
+        return cls(clients)
+
+    def map(self, func):
+        """Call ``func(client)`` for every server concurrently
+
+        :param callable func:
+            Called with each client
+        :return:
+            ``{server name: result}`` of the servers that answered
+        :rtype:
+            dict
+        """
+        results = OrderedDict()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [
+                (name, executor.submit(func, client))
+                for name, client in self.clients.items()
+            ]
+            for name, future in futures:
+                try:
+                    results[name] = future.result()
+                except RequestException as e:
+                    if self.strict:
+                        raise
+                    warn("Server {} failed: {}".format(name, e), RuntimeWarning)
+        return results
+
+    @staticmethod
+    def _merge(results, key):
+        """Merge per-server lists, first server's copy first, tagged with its servers"""
+        merged = OrderedDict()
+        for name, items in results.items():
+            for item in items:
+                if not isinstance(item, dict):
+                    item = {"ID": item}
+                k = key(item)
+                if k in merged:
+                    merged[k]["Servers"].append(name)
+                else:
+                    merged[k] = dict(item, Servers=[name])
+        return list(merged.values())
+
+    def _merge_resources(self, results, level):
+        tag = UID_TAGS[level]
+
+        def key(resource):
+            uid = (resource.get("MainDicomTags") or {}).get(tag)
+            return ("UID", uid) if uid else ("ID", resource["ID"])
+
+        return self._merge(results, key)
+
+    def find(self, query, level, expand=False, limit=None, **kwargs):
+        """Search every server, see :meth:`beren.Orthanc.find`
+
+        :param dict query:
+            Query to run
+        :param str level:
+            "Patient", "Study", "Series", or "Instance"
+        :param bool expand:
+            Return resources, not just ``{"ID": ..., "Servers": [...]}`` (default: False)
+        :param int limit:
+            Limit number of merged records returned (each server returns at most as many)
+        :return:
+            Merged matching records
+        :rtype:
+            list (dict)
+        """
+        if level not in UID_TAGS:
+            raise ValueError("Unknown level {!r}".format(level))
+        results = self.map(
+            lambda client: client.find(query, level, expand, limit, **kwargs)
+        )
+        merged = self._merge_resources(results, level)
+        return merged[:limit] if limit else merged
+
+    def get_resources(self, level, expand=False, **kwargs):
+        """List the resources of a level on every server
+
+        :param str level:
+            "Patient", "Study", "Series", or "Instance"
+        :param bool expand:
+            Return resources, not just ``{"ID": ..., "Servers": [...]}`` (default: False)
+        :return:
+            Merged records
+        :rtype:
+            list (dict)
+        """
+        if level not in LISTINGS:
+            raise ValueError("Unknown level {!r}".format(level))
+        results = self.map(
+            lambda client: getattr(client, LISTINGS[level])(expand=expand, **kwargs)
+        )
+        return self._merge_resources(results, level)
+
+    def get_patients(self, expand=False, **kwargs):
+        return self.get_resources("Patient", expand, **kwargs)
+
+    def get_studies(self, expand=False, **kwargs):
+        return self.get_resources("Study", expand, **kwargs)
+
+    def get_series(self, expand=False, **kwargs):
+        return self.get_resources("Series", expand, **kwargs)
+
+    def get_instances(self, expand=False, **kwargs):
+        return self.get_resources("Instance", expand, **kwargs)
+
+    def lookup(self, lookup, **kwargs):
+        """Map DICOM UIDs to Orthanc identifiers on every server
+
+        :param lookup:
+            UID(s) to map
+        :return:
+            Merged ``{"ID", "Path", "Type", "Servers"}`` records
+        :rtype:
+            list (dict)
+        """
+        results = self.map(lambda client: client.lookup(lookup, **kwargs))
+        return self._merge(results, lambda item: (item.get("Type"), item["ID"]))
@@ -0,0 +1,231 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from beren.records import to_record
+
+__all__ = ["PatientNode", "StudyNode", "SeriesNode", "InstanceNode"]
+
+LEVELS = ("Patient", "Study", "Series", "Instance")
+
+
+class Node:
+    """
+    A lazily loaded resource of the Orthanc object graph.
+
+    Children are fetched on first access. Nodes reached from a parent share
+    the parent's loading: asking one study of a patient for its series
+    fetches the series of *all* the patient's studies in a single request
+    (e.g. ``get_patient_series``), so walking a hierarchy costs one request
+    per level instead of one per resource.
+
+    :param beren.Orthanc orthanc:
+        The client
+    :param str id_:
+        Resource UUID
+    :param dict data:
+        Expanded resource, when already known (optional)
+    :param Node parent:
+        Node this one was loaded from (optional)
+    """
+
+    level = None
+    parent_key = None
+    parent_key_json = None
+
+    def __init__(self, orthanc, id_, data=None, parent=None):
+        self.orthanc = orthanc
+        self.id = id_
+        self._record = to_record(data) if data is not None else None
+        self._parent = parent
+        self._up = None
+        self._children = None
+
+    def __repr__(self):
+        return "<{}({})>".format(type(self).__name__, self.id)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    @property
+    def record(self):
+        """Compact record of this resource, see :mod:`beren.records`"""
+        if self._record is None:
+            self._record = to_record(self._fetch())
+        return self._record
+
+    @property
+    def main_dicom_tags(self):
+        return self.record.main_dicom_tags
+
+    def tag(self, name, default=None):
+        """Value of a single main DICOM tag"""
+        return self.record.tag(name, default)
+
+    def refresh(self):
+        """Forget everything loaded below and including this node"""
+        self._record = None
+        self._children = None
+
+    def _fetch(self):
+        return FETCH[self.level](self.orthanc, self.id)
+
+    def _parent_node(self):
+        """The parent node, loaded from the parent UUID if needed"""
+        if self._parent is not None:
+            return self._parent
+        if self._up is None:
+            # Not the loading parent: its children are new nodes, not this one
+            parent_id = getattr(self.record, self.parent_key)
+            self._up = NODES[LEVELS[LEVELS.index(self.level) - 1]](
+                self.orthanc, parent_id
+            )
+        return self._up
+
+    def _descendants(self, level):
+        """All loaded-on-demand nodes ``level`` below this one"""
+        if level == self.level:
+            return [self]
+        if LEVELS.index(level) == LEVELS.index(self.level) + 1:
+            return self._child_nodes()
+        nodes = []
+        for child in self._child_nodes():
+            nodes.extend(child._descendants(level))
+        return nodes
+
+    def _child_nodes(self):
+        if self._children is None:
+            top = self
+            while top._parent is not None:
+                top = top._parent
+            top._load(LEVELS[LEVELS.index(self.level) + 1])
+        return self._children
+
+    def _load(self, level):
+        """Fetch every descendant at ``level`` in one request and hand them to their parents"""
+        parent_level = LEVELS[LEVELS.index(level) - 1]
+        parents = {node.id: node for node in self._descendants(parent_level)}
+        children = {id_: [] for id_ in parents}
+        cls = NODES[level]
+        for data in FETCH_DESCENDANTS[self.level, level](self.orthanc, self.id):
+            parent = parents.get(data[cls.parent_key_json])
+            if parent is not None:
+                children[parent.id].append(cls(self.orthanc, data["ID"], data, parent))
+        for id_, nodes in children.items():
+            parents[id_]._children = nodes
+
+
+class PatientNode(Node):
+    """A patient of the object graph"""
+
+    level = "Patient"
+
+    @property
+    def studies(self):
+        """Studies of this patient"""
+        return self._descendants("Study")
+
+    @property
+    def series(self):
+        """Series of all the studies of this patient"""
+        return self._descendants("Series")
+
+    @property
+    def instances(self):
+        """Instances of all the series of this patient"""
+        return self._descendants("Instance")
+
+
+class StudyNode(Node):
+    """A study of the object graph"""
+
+    level = "Study"
+    parent_key = "parent_patient"
+    parent_key_json = "ParentPatient"
+
+    @property
+    def patient(self):
+        """Parent patient"""
+        return self._parent_node()
+
+    @property
+    def series(self):
+        """Series of this study"""
+        return self._descendants("Series")
+
+    @property
+    def instances(self):
+        """Instances of all the series of this study"""
+        return self._descendants("Instance")
+
+
+class SeriesNode(Node):
+    """A series of the object graph"""
+
+    level = "Series"
+    parent_key = "parent_study"
+    parent_key_json = "ParentStudy"
+
+    @property
+    def study(self):
+        """Parent study"""
+        return self._parent_node()
+
+    @property
+    def instances(self):
+        """Instances of this series"""
+        return self._descendants("Instance")
+
+
+class InstanceNode(Node):
+    """An instance of the object graph"""
+
+    level = "Instance"
+    parent_key = "parent_series"
+    parent_key_json = "ParentSeries"
+
+    @property
+    def series(self):
+        """Parent series"""
+        return self._parent_node()
+
+    def _child_nodes(self):
+        return []
+
+
+NODES = {
+    "Patient": PatientNode,
+    "Study": StudyNode,
+    "Series": SeriesNode,
+    "Instance": InstanceNode,
+}
+
+# Endpoints returning a single expanded resource, by level
+FETCH = {
+    "Patient": lambda o, id_: o.get_patient(id_),
+    "Study": lambda o, id_: o.get_study(id_),
+    "Series": lambda o, id_: o.get_one_series(id_),
+    "Instance": lambda o, id_: o.get_instance(id_),
+}
+
+# Endpoints returning all expanded descendants of a resource at a given level
+FETCH_DESCENDANTS = {
+    ("Patient", "Study"): lambda o, id_: o.get_patient_studies(id_),
+    ("Patient", "Series"): lambda o, id_: o.get_patient_series(id_),
+    ("Patient", "Instance"): lambda o, id_: o.get_patient_instances(id_),
+    ("Study", "Series"): lambda o, id_: o.get_study_series(id_),
+    ("Study", "Instance"): lambda o, id_: o.get_study_instances(id_),
+    ("Series", "Instance"): lambda o, id_: o.get_series_instances(id_),
+}
@@ -0,0 +1,174 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha1
+
+__all__ = ["orthanc_id", "orthanc_ids", "resolve_ids"]
+
+LEVELS = ["Patient", "Study", "Series", "Instance"]
+
+
+def _clean(value):
+    """UID as hashed by Orthanc, or None when missing
+
+    Empty values are hashed as such, e.g. the PatientID of anonymized data.
+    """
+    if value is None or value != value:  # None or NaN (pandas)
+        return None
+    return str(value).strip(" \0")
+
+
+def _hash(parts):
+    digest = sha1("|".join(parts).encode("utf-8")).hexdigest()
+    return "-".join(digest[i : i + 8] for i in range(0, 40, 8))
+
+
+def orthanc_id(patient_id, study_uid=None, series_uid=None, sop_uid=None):
+    """Orthanc ID of a resource, computed from its DICOM identifiers
+
+    Orthanc derives its IDs from the SHA-1 of the identifiers from the patient
+    down to the resource, joined with "|": PatientID for a patient, then
+    StudyInstanceUID, SeriesInstanceUID, and SOPInstanceUID.
+
+    Example:
+
+        >>> orthanc_id('123', '1.2.840.113619.2.55.3')   # study
+        '20c64299-b374d0bd-3d47843d-4b432f1b-ac35b2bf'
+
+    :param str patient_id:
+        PatientID
+    :param str study_uid:
+        StudyInstanceUID, for a study and below
+    :param str series_uid:
+        SeriesInstanceUID, for a series and below
+    :param str sop_uid:
+        SOPInstanceUID, for an instance
+    :return:
+        Orthanc ID, or None when an identifier is missing
+    :rtype:
+        str
+    """
+    return orthanc_ids(patient_id, study_uid, series_uid, sop_uid)[0]
+
+
+def orthanc_ids(patient_ids, study_uids=None, series_uids=None, sop_uids=None):
+    """Orthanc IDs of many resources, computed from their DICOM identifiers
+
+    Each argument is a sequence (list, numpy array, pandas Series...) or a
+    single value shared by every resource, e.g. the series of many instances.
+    The resources' level is the deepest level given.
+
+    Example:
+
+        >>> orthanc_ids(df['PatientID'], df['StudyInstanceUID'])   # studies
+
+    :param patient_ids:
+        PatientID of each resource
+    :param study_uids:
+        StudyInstanceUID of each resource, for studies and below
+    :param series_uids:
+        SeriesInstanceUID of each resource, for series and below
+    :param sop_uids:
+        SOPInstanceUID of each resource, for instances
+    :return:
+        Orthanc IDs, None where an identifier is missing
+    :rtype:
+        list
+    :raises ValueError:
+        Identifiers of an intermediate level missing, or sequences of
+        different lengths
+    """
+    columns = [patient_ids, study_uids, series_uids, sop_uids]
+    while columns[-1] is None:
+        columns.pop()
+    if any(column is None for column in columns):
+        raise ValueError("The identifiers of every level above are needed")
+    lengths = {
+        len(column) for column in columns if not isinstance(column, (str, bytes))
+    }
+    if len(lengths) > 1:
+        raise ValueError("Identifier sequences of different lengths")
+    count = lengths.pop() if lengths else 1
+    columns = [
+        [column] * count if isinstance(column, (str, bytes)) else column
+        for column in columns
+    ]
+    ids = []
+    for row in zip(*columns):
+        parts = [_clean(value) for value in row]
+        ids.append(None if None in parts else _hash(parts))
+    return ids
+
+
+def _lookup(orthanc, uid, level):
+    for resource in orthanc.server.tools_lookup(data=uid):
+        if resource.get("Type") == level:
+            return resource["ID"]
+    return None
+
+
+def resolve_ids(
+    orthanc,
+    level,
+    uids,
+    patient_ids=None,
+    study_uids=None,
+    series_uids=None,
+    workers=8,
+):
+    """Orthanc IDs of resources, computed locally, looked up only when needed
+
+    IDs are computed locally (see :func:`orthanc_ids`) for the resources
+    whose parent identifiers are all given. The others (e.g. studies known
+    by StudyInstanceUID only) are looked up on the server, concurrently.
+
+    Locally computed IDs are not checked against the server: they are the
+    IDs the resources have, or would have once stored.
+
+    :param beren.Orthanc orthanc:
+        The client
+    :param str level:
+        "Patient", "Study", "Series", or "Instance"
+    :param uids:
+        Identifier of each resource at its level (PatientID for patients)
+    :param patient_ids:
+        PatientID of each resource (optional)
+    :param study_uids:
+        StudyInstanceUID of each resource, for series and instances (optional)
+    :param series_uids:
+        SeriesInstanceUID of each resource, for instances (optional)
+    :param int workers:
+        Concurrent lookups (default: 8)
+    :return:
+        Orthanc IDs, None for resources not found by lookup
+    :rtype:
+        list
+    """
+    if level not in LEVELS:
+        raise ValueError("Unknown level {!r}".format(level))
+    depth = LEVELS.index(level)
+    uids = [uids] if isinstance(uids, str) else list(uids)
+    parents = [patient_ids, study_uids, series_uids][:depth]
+    parents = [[None] * len(uids) if column is None else column for column in parents]
+    columns = parents + [uids]
+    ids = orthanc_ids(*columns)
+    missing = [i for i, id_ in enumerate(ids) if id_ is None and _clean(uids[i])]
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(workers, len(missing))) as pool:
+            found = pool.map(
+                lambda i: _lookup(orthanc, _clean(uids[i]), level), missing
+            )
+            for i, id_ in zip(missing, found):
+                ids[i] = id_
+    return ids
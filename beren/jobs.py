@@ -0,0 +1,358 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from concurrent.futures import ALL_COMPLETED, Future, as_completed, wait
+from requests.exceptions import HTTPError, RequestException
+from threading import Condition, Thread
+from warnings import warn
+
+__all__ = ["Job", "JobFailed", "JobManager", "JobPollFailed"]
+
+# Consecutive unexpected polling errors after which the tracked jobs fail
+MAX_POLL_ERRORS = 5
+
+
+class JobFailed(Exception):
+    """An Orthanc job ended in the "Failure" state
+
+    :param dict info:
+        Last status of the job, as returned by ``get_job``
+    """
+
+    def __init__(self, info):
+        super().__init__(
+            "Job {} failed: {}".format(
+                info.get("ID"), info.get("ErrorDescription") or "unknown error"
+            )
+        )
+        self.info = info
+
+
+class JobPollFailed(JobFailed):
+    """The status of a job could not be polled, repeatedly
+
+    :param str id_:
+        Job ID
+    :param Exception error:
+        Last polling error, also chained as the cause
+    """
+
+    def __init__(self, id_, error):
+        super().__init__(
+            {
+                "ID": id_,
+                "State": "Failure",
+                "ErrorDescription": "Polling failed: {!r}".format(error),
+            }
+        )
+        self.error = error
+        self.__cause__ = error
+
+
+class Job(Future):
+    """
+    Future-like handle of an Orthanc job.
+
+    The handle is completed by its :class:`JobManager`: :meth:`result` returns
+    the job's ``Content`` once it succeeds, or raises :class:`JobFailed`.
+    Handles work with :func:`concurrent.futures.wait` and
+    :func:`concurrent.futures.as_completed`.
+
+    :param JobManager manager:
+        Manager polling this job
+    :param str id_:
+        Job ID
+    """
+
+    def __init__(self, manager, id_):
+        super().__init__()
+        self.manager = manager
+        self.id = id_
+        self.info = {"ID": id_}
+        self.resubmissions = 0
+
+    def __repr__(self):
+        return "<Job({}, {})>".format(self.id, self.state)
+
+    @property
+    def state(self):
+        """Last known state: "Pending", "Running", "Success", "Failure", "Paused", or "Retry" """
+        return self.info.get("State", "Pending")
+
+    @property
+    def progress(self):
+        """Last known progress, in percent"""
+        return self.info.get("Progress", 0)
+
+    def cancel(self):
+        """Ask the server to cancel the job
+
+        The job then ends in the "Failure" state, and :meth:`result` raises
+        :class:`JobFailed`. Returns False when the job already ended.
+        """
+        if self.done():
+            return False
+        self.manager.orthanc.cancel_job(self.id)
+        self.manager.wake()
+        return True
+
+    def pause(self):
+        """Ask the server to pause the job"""
+        return self.manager.orthanc.pause_job(self.id)
+
+    def resume(self):
+        """Ask the server to resume a paused job"""
+        result = self.manager.orthanc.resume_job(self.id)
+        self.manager.wake()
+        return result
+
+    def output(self, key, **kwargs):
+        """Output of a succeeded job, e.g. "archive" for archive jobs"""
+        return self.manager.orthanc.get_job_output(self.id, key, **kwargs)
+
+
+class JobManager:
+    """
+    Track many Orthanc jobs with a single poller.
+
+    One background thread checks every tracked job at once, with the expanded
+    ``/jobs`` listing when several jobs are tracked and ``/jobs/{id}``
+    otherwise. The interval between checks starts at ``min_interval``, grows
+    by ``backoff`` while nothing changes, up to ``max_interval``, and drops
+    back as soon as a job progresses or ends. Failed jobs are resubmitted up
+    to ``resubmit`` times before their handle fails. Unexpected polling errors
+    (e.g. an HTML error page from a proxy) are warned about and polling goes
+    on; after several in a row, the handles of the tracked jobs fail with
+    :class:`JobPollFailed` rather than waiting forever.
+
+    Example:
+
+        >>> with JobManager(orthanc) as manager:
+        ...     jobs = [manager.track(orthanc.anonymize_study(id_, {"Asynchronous": True}))
+        ...             for id_ in study_ids]
+        ...     for job in manager.as_completed(jobs):
+        ...         print(job.id, job.result()["ID"])
+
+    :param beren.Orthanc orthanc:
+        The client
+    :param float min_interval:
+        Shortest time between two checks, in seconds (default: 0.2)
+    :param float max_interval:
+        Longest time between two checks, in seconds (default: 5)
+    :param float backoff:
+        Interval growth factor while no job changes (default: 1.5)
+    :param int resubmit:
+        Number of times a failed job is resubmitted (default: 0)
+    """
+
+    def __init__(
+        self, orthanc, min_interval=0.2, max_interval=5.0, backoff=1.5, resubmit=0
+    ):
+        self.orthanc = orthanc
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.resubmit = resubmit
+        self.checks = 0
+        self._jobs = {}
+        self._cond = Condition()
+        self._thread = None
+        self._closed = False
+
+    def __repr__(self):
+        return "<JobManager({} jobs)>".format(len(self._jobs))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def track(self, job):
+        """Return the handle of a job, tracking it if needed
+
+        :param job:
+            Job ID, or the response of an asynchronous request (``{"ID": ...}``)
+        :rtype:
+            Job
+        """
+        id_ = job["ID"] if isinstance(job, dict) else job
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("JobManager is closed")
+            handle = self._jobs.get(id_)
+            if handle is None:
+                if not self._jobs:
+                    self._cond.notify_all()  # idle poller
+                handle = self._jobs[id_] = Job(self, id_)
+            if self._thread is None:
+                self._thread = Thread(target=self._poll, name="beren-jobs", daemon=True)
+                self._thread.start()
+        return handle
+
+    def submit(self, func, *args, **kwargs):
+        """Call ``func`` (e.g. ``orthanc.modify_study``), track the job it creates
+
+        ``func`` must accept the request body as ``data`` or its second
+        positional argument; ``"Asynchronous": true`` is added to it.
+        """
+        if "data" in kwargs:
+            kwargs["data"] = dict(kwargs["data"], Asynchronous=True)
+        elif len(args) >= 2:
+            args = (args[0], dict(args[1], Asynchronous=True)) + args[2:]
+        else:
+            kwargs["data"] = {"Asynchronous": True}
+        return self.track(func(*args, **kwargs))
+
+    def wait_all(self, jobs=None, timeout=None):
+        """Wait for jobs to end
+
+        :param list jobs:
+            Handles to wait for (default: every tracked job)
+        :param float timeout:
+            Maximum time to wait, in seconds (default: forever)
+        :return:
+            ``(done, not_done)`` sets of handles
+        """
+        if jobs is None:
+            with self._cond:
+                jobs = list(self._jobs.values())
+        return wait(jobs, timeout, ALL_COMPLETED)
+
+    def as_completed(self, jobs=None, timeout=None):
+        """Yield handles as their jobs end
+
+        :param list jobs:
+            Handles to wait for (default: every tracked job)
+        :param float timeout:
+            Maximum time to wait, in seconds (default: forever)
+        """
+        if jobs is None:
+            with self._cond:
+                jobs = list(self._jobs.values())
+        return as_completed(jobs, timeout)
+
+    def wake(self):
+        """Check the jobs now instead of waiting for the current interval"""
+        with self._cond:
+            self._cond.notify_all()
+
+    def close(self):
+        """Stop the poller, handles of running jobs are left pending"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _poll(self):
+        interval = self.min_interval
+        errors = 0
+        while True:
+            with self._cond:
+                while not self._jobs and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                jobs = dict(self._jobs)
+            try:
+                changed = self._check(jobs)
+                errors = 0
+            except Exception as e:
+                errors += 1
+                warn("Polling jobs failed: {!r}".format(e), RuntimeWarning)
+                if errors >= MAX_POLL_ERRORS:
+                    self._fail(jobs, e)
+                    errors = 0
+                changed = False
+            if changed:
+                interval = self.min_interval
+            else:
+                interval = min(interval * self.backoff, self.max_interval)
+            with self._cond:
+                if not self._closed:
+                    self._cond.wait(interval)
+
+    def _get(self, id_):
+        try:
+            return self.orthanc.get_job(id_)
+        except HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                return {
+                    "ID": id_,
+                    "State": "Failure",
+                    "ErrorDescription": "Unknown job",
+                }
+            return None
+        except RequestException:
+            return None
+
+    def _statuses(self, jobs):
+        """Current status of the jobs, one request for all of them when possible"""
+        self.checks += 1
+        if len(jobs) == 1:
+            return {id_: self._get(id_) for id_ in jobs}
+        try:
+            listing = self.orthanc.get_jobs(params={"expand": 1})
+        except RequestException:
+            return {}
+        infos = {
+            info["ID"]: info
+            for info in listing
+            if isinstance(info, dict) and info.get("ID") in jobs
+        }
+        for id_ in jobs:
+            if id_ not in infos:
+                # Dropped from the listing (history size), ask directly
+                infos[id_] = self._get(id_)
+        return infos
+
+    def _check(self, jobs):
+        """Update the handles, return whether anything changed"""
+        changed = False
+        for id_, info in self._statuses(jobs).items():
+            if info is None:
+                continue
+            job = jobs[id_]
+            previous = job.info
+            job.info = info
+            if (info.get("State"), info.get("Progress")) != (
+                previous.get("State"),
+                previous.get("Progress"),
+            ):
+                changed = True
+            if info.get("State") == "Success":
+                self._finish(job)
+                job.set_result(info.get("Content", {}))
+            elif info.get("State") == "Failure":
+                if job.resubmissions < self.resubmit:
+                    job.resubmissions += 1
+                    try:
+                        self.orthanc.resubmit_job(id_)
+                        continue
+                    except RequestException:
+                        pass
+                self._finish(job)
+                job.set_exception(JobFailed(info))
+        return changed
+
+    def _fail(self, jobs, error):
+        """Fail the handles of jobs the poller cannot check"""
+        for job in jobs.values():
+            self._finish(job)
+            if not job.done():
+                job.set_exception(JobPollFailed(job.id, error))
+
+    def _finish(self, job):
+        with self._cond:
+            self._jobs.pop(job.id, None)
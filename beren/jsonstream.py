@@ -0,0 +1,144 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from codecs import getincrementaldecoder
+from json import JSONDecoder, JSONDecodeError
+import re
+
+__all__ = ["iter_json"]
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def iter_json(chunks):
+    """Incrementally parse a top-level JSON array or object
+
+    Only the item being parsed is kept in memory, so arbitrarily large
+    listings can be consumed one resource at a time.
+
+    Example:
+
+        >>> list(iter_json([b'[{"ID": "a"}, {"ID"', b': "b"}]']))
+        [{'ID': 'a'}, {'ID': 'b'}]
+        >>> list(iter_json([b'{"a": 1, "b": 2}']))
+        [('a', 1), ('b', 2)]
+
+    :param iterable chunks:
+        Chunks of the UTF-8 encoded JSON document
+    :return:
+        Yields array items, or ``(key, value)`` pairs for an object
+    :rtype:
+        generator
+    :raises ValueError:
+        The document is not an array or object, is malformed, or is truncated
+    """
+    reader = _Reader(chunks)
+    first = reader.peek()
+    if first not in "[{":
+        raise ValueError("Expected a JSON array or object")
+    is_object = first == "{"
+    close = "}" if is_object else "]"
+    reader.pos += 1
+    if reader.peek() == close:
+        return
+
+    while True:
+        if is_object:
+            key = reader.decode()
+            if reader.peek() != ":":
+                raise ValueError("Expected ':' at position {}".format(reader.pos))
+            reader.pos += 1
+            yield key, reader.decode()
+        else:
+            yield reader.decode()
+
+        c = reader.peek()
+        reader.pos += 1
+        if c == close:
+            return
+        if c != ",":
+            raise ValueError("Expected ',' or '{}'".format(close))
+
+
+class _Reader:
+    """Text buffer over a byte stream holding only the unconsumed data
+
+    Chunks read while waiting for the end of a large value are kept apart
+    and joined to the buffer only when a decode is attempted, so that a
+    value spanning many chunks is not copied over and over.
+    """
+
+    def __init__(self, chunks):
+        self.text = ""
+        self.pos = 0
+        self._pending = []
+        self._pending_size = 0
+        self._chunks = iter(chunks)
+        self._utf8 = getincrementaldecoder("utf-8")()
+        self._decoder = JSONDecoder()
+        self._eof = False
+
+    def _read(self):
+        """Read the next chunk into the pending ones. False at the end."""
+        if self._eof:
+            return False
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self._eof = True
+            chunk = b""
+        text = self._utf8.decode(chunk, final=self._eof)
+        self._pending.append(text)
+        self._pending_size += len(text)
+        return True
+
+    def _join(self):
+        """Append the pending chunks to the buffer, dropping consumed text"""
+        if self._pending:
+            self.text = self.text[self.pos :] + "".join(self._pending)
+            self.pos = 0
+            self._pending = []
+            self._pending_size = 0
+
+    def peek(self):
+        """Skip whitespace and return the next character"""
+        while True:
+            self.pos = WHITESPACE.match(self.text, self.pos).end()
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if self._pending:
+                self._join()
+            elif not self._read():
+                raise ValueError("Truncated JSON document")
+
+    def decode(self):
+        """Decode the next complete JSON value"""
+        self.peek()
+        needed = 0
+        while True:
+            available = len(self.text) - self.pos + self._pending_size
+            if self._eof or available >= needed:
+                self._join()
+                try:
+                    value, end = self._decoder.raw_decode(self.text, self.pos)
+                except JSONDecodeError:
+                    if self._eof:
+                        raise
+                    # Incomplete value: wait until the buffer doubles to stay linear
+                    needed = 2 * (len(self.text) - self.pos)
+                else:
+                    # A number or literal at the very end may continue in the next chunk
+                    if end < len(self.text) or self._eof:
+                        self.pos = end
+                        return value
+            self._read()
@@ -0,0 +1,320 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from beren.archive import write_file
+from beren.transport import is_not_found
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from requests.exceptions import HTTPError, RequestException
+from threading import Event
+from warnings import warn
+import os
+import sqlite3
+
+__all__ = ["Mirror"]
+
+LEVEL_COLUMNS = {
+    "Patient": "patient",
+    "Study": "study",
+    "Series": "series",
+    "Instance": "id",
+}
+
+
+class Mirror:
+    """
+    Local copy of the DICOM files of a server, kept in sync by its change feed.
+
+    Files are laid out as ``<patient>/<study>/<series>/<instance>.dcm`` (Orthanc
+    UUIDs) under ``directory``, and written atomically. A SQLite manifest
+    records every mirrored instance and the last change applied.
+
+    The first :meth:`sync` downloads every instance in parallel; an
+    interrupted first sync resumes with the instances still missing. Later
+    syncs only apply the changes since the last one: new instances are
+    downloaded, deleted instances, series, studies, and patients are
+    removed. Instances failing to download are retried by the next sync.
+
+    Example:
+
+        >>> with Mirror(orthanc, '/data/mirror', workers=8) as mirror:
+        ...     mirror.sync()
+        {'added': 120345, 'deleted': 0, 'failed': 0}
+
+    :param beren.Orthanc orthanc:
+        The client
+    :param str directory:
+        Root of the mirror
+    :param int workers:
+        Concurrent downloads (default: 4)
+    :param int page_size:
+        Resources or changes per listing request (default: 1000)
+    :param str manifest:
+        SQLite manifest file (default: ``.manifest.db`` in ``directory``)
+    """
+
+    def __init__(self, orthanc, directory, workers=4, page_size=1000, manifest=None):
+        self.orthanc = orthanc
+        self.directory = os.path.abspath(directory)
+        self.workers = workers
+        self.page_size = page_size
+        os.makedirs(self.directory, exist_ok=True)
+        self.manifest = manifest or os.path.join(self.directory, ".manifest.db")
+        self._db = sqlite3.connect(self.manifest)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS instances (id TEXT PRIMARY KEY,"
+                " patient TEXT, study TEXT, series TEXT, size INTEGER)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS by_series ON instances(series)"
+            )
+            self._db.execute("CREATE TABLE IF NOT EXISTS pending (id TEXT PRIMARY KEY)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value)"
+            )
+
+    def __repr__(self):
+        return "<Mirror({} instances in {})>".format(len(self), self.directory)
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM instances").fetchone()[0]
+
+    def __contains__(self, id_):
+        row = self._db.execute("SELECT 1 FROM instances WHERE id = ?", (id_,))
+        return row.fetchone() is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    @property
+    def last(self):
+        """Sequence number of the last change applied, None before the first sync"""
+        row = self._db.execute("SELECT value FROM state WHERE key = 'last'").fetchone()
+        return None if row is None else row[0]
+
+    def path(self, patient, study, series, id_):
+        """Path of an instance file in the mirror"""
+        return os.path.join(self.directory, patient, study, series, id_ + ".dcm")
+
+    def _resources(self):
+        """``(patient, study, series, instance)`` of every instance on the server"""
+        patients = {}
+        since = 0
+        while True:
+            page = self.orthanc.get_studies(
+                expand=True, since=since, limit=self.page_size
+            )
+            patients.update((study["ID"], study["ParentPatient"]) for study in page)
+            if len(page) < self.page_size:
+                break
+            since += len(page)
+        since = 0
+        while True:
+            page = self.orthanc.get_series(
+                expand=True, since=since, limit=self.page_size
+            )
+            for series in page:
+                study = series["ParentStudy"]
+                for id_ in series["Instances"]:
+                    yield patients[study], study, series["ID"], id_
+            if len(page) < self.page_size:
+                return
+            since += len(page)
+
+    def _locate(self, ids):
+        """``(patient, study, series, instance)`` of instances, skipping deleted ones"""
+        parents = {}
+        for id_ in ids:
+            try:
+                series = self.orthanc.get_instance(id_)["ParentSeries"]
+                if series not in parents:
+                    row = self._db.execute(
+                        "SELECT patient, study FROM instances WHERE series = ? LIMIT 1",
+                        (series,),
+                    ).fetchone()
+                    if row is None:
+                        study = self.orthanc.get_instance_study(id_)
+                        row = (study["ParentPatient"], study["ID"])
+                    parents[series] = row
+            except HTTPError as e:
+                if is_not_found(e):  # deleted since
+                    self._record((None, None, None, id_), None)
+                    continue
+                raise
+            yield parents[series] + (series, id_)
+
+    def _fetch(self, item):
+        path = self.path(*item)
+        size = [0]
+
+        def counted(chunks):
+            for chunk in chunks:
+                size[0] += len(chunk)
+                yield chunk
+
+        write_file(path, counted(self.orthanc.get_instance_file(item[3])))
+        return size[0]
+
+    def _download(self, items):
+        """Download instances in parallel, return ``(added, failed)`` counts"""
+        added = failed = 0
+        items = iter(items)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                # Bounded batches, the first sync may list millions of instances
+                batch = list(islice(items, self.workers * 16))
+                if not batch:
+                    return added, failed
+                futures = [(item, executor.submit(self._fetch, item)) for item in batch]
+                for item, future in futures:
+                    try:
+                        size = future.result()
+                    except RequestException as e:
+                        if is_not_found(e):  # deleted meanwhile
+                            self._record(item, None)
+                        else:
+                            self._record(item, False)
+                            failed += 1
+                        continue
+                    self._record(item, size)
+                    added += 1
+
+    def _record(self, item, size):
+        """Record a downloaded instance (``size``), a failure (False), or neither (None)"""
+        with self._db:
+            if size is False:
+                self._db.execute("INSERT OR IGNORE INTO pending VALUES (?)", item[3:])
+                return
+            self._db.execute("DELETE FROM pending WHERE id = ?", item[3:])
+            if size is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO instances VALUES (?, ?, ?, ?, ?)",
+                    (item[3], item[0], item[1], item[2], size),
+                )
+
+    def _delete(self, level, id_):
+        """Remove the files of a deleted resource, return how many were removed"""
+        column = LEVEL_COLUMNS[level]
+        rows = self._db.execute(
+            "SELECT patient, study, series, id FROM instances WHERE {} = ?".format(
+                column
+            ),
+            (id_,),
+        ).fetchall()
+        for row in rows:
+            path = self.path(*row)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._prune(os.path.dirname(path))
+        with self._db:
+            self._db.execute(
+                "DELETE FROM instances WHERE {} = ?".format(column), (id_,)
+            )
+        return len(rows)
+
+    def _prune(self, directory):
+        """Remove empty directories up to the root of the mirror"""
+        while directory != self.directory:
+            try:
+                os.rmdir(directory)
+            except OSError:
+                return
+            directory = os.path.dirname(directory)
+
+    def _set_last(self, last):
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO state VALUES ('last', ?)", (last,))
+
+    def _initial(self, counts):
+        # Changes recorded from now on are applied by the next sync
+        last = self.orthanc.get_changes(last=True).get("Last", 0)
+        items = (item for item in self._resources() if item[3] not in self)
+        added, failed = self._download(items)
+        counts["added"] += added
+        counts["failed"] += failed
+        self._set_last(last)
+
+    def _apply_changes(self, counts):
+        since = self.last
+        while True:
+            page = self.orthanc.get_changes(since=since, limit=self.page_size)
+            new = []
+            for change in page["Changes"]:
+                if change.get("ChangeType") == "NewInstance":
+                    new.append(change["ID"])
+                elif (
+                    change.get("ChangeType") == "Deleted"
+                    and change.get("ResourceType") in LEVEL_COLUMNS
+                ):
+                    # Apply in order, a deleted instance may come back later
+                    self._add(new, counts)
+                    new = []
+                    counts["deleted"] += self._delete(
+                        change["ResourceType"], change["ID"]
+                    )
+            self._add(new, counts)
+            since = max(since, page.get("Last", since))
+            self._set_last(since)
+            if page.get("Done", True):
+                return
+
+    def _add(self, ids, counts):
+        # Instances listed by the first sync also appear in the changes following it
+        ids = [id_ for id_ in ids if id_ not in self]
+        added, failed = self._download(self._locate(ids))
+        counts["added"] += added
+        counts["failed"] += failed
+
+    def sync(self):
+        """Bring the mirror up to date with the server
+
+        :return:
+            Counts of instances added, deleted, and failing to download
+        :rtype:
+            dict
+        """
+        counts = {"added": 0, "deleted": 0, "failed": 0}
+        pending = [row[0] for row in self._db.execute("SELECT id FROM pending")]
+        self._add(pending, counts)
+        if self.last is None:
+            self._initial(counts)
+        else:
+            self._apply_changes(counts)
+        return counts
+
+    def run(self, interval=60.0, stop=None):
+        """Sync continuously
+
+        A sync failing on a server error is retried after ``interval``.
+
+        :param float interval:
+            Seconds between two syncs (default: 60)
+        :param threading.Event stop:
+            Stops the loop once set (default: run forever)
+        """
+        stop = stop or Event()
+        while not stop.is_set():
+            try:
+                self.sync()
+            except RequestException as e:
+                warn("Mirror sync failed, retrying: {}".format(e), RuntimeWarning)
+            stop.wait(interval)
@@ -20,12 +20,61 @@ from beren.endpoints import (
     OrthancServer,
     OrthancStudies,
 )
+from beren.archive import stream_job_output
+from beren.bulk import bulk_anonymize, bulk_modify
+from beren.cache import cache_key, normalize_find
+from beren.download import download_study, plan_study_download
+from beren.export import export_catalog
+from beren.jobs import JobManager
+from beren.graph import PatientNode, StudyNode, SeriesNode, InstanceNode
+from beren.ids import resolve_ids
+from beren.jsonstream import iter_json
+from beren.mirror import Mirror
+from beren.records import to_records
+from beren.remote import answer_contents, query_hierarchy
+from beren.replication import Replicator
+from beren.sender import Sender
+from beren.tables import tag_table
+from beren.transcode import decode_file, transfer_syntax
+from beren.transport import TransferStats, Transport
+from functools import partial
 from json import dumps
+from requests.exceptions import HTTPError
+from threading import Lock
 from warnings import warn
 from urllib.parse import urlparse
 
 __all__ = ["Orthanc"]
 
+# Call arguments of ``find`` that leave its answer unchanged: other arguments
+# (params, headers...) bypass the caches
+CACHEABLE_FIND_ARGUMENTS = frozenset(["timeout_spec", "retry_spec"])
+
+# Public methods built on top of the endpoints rather than calling one,
+# left out of ``get_api_methods``
+HELPER_METHODS = frozenset(
+    [
+        "bulk_anonymize",
+        "bulk_modify",
+        "download_study",
+        "export_catalog",
+        "get_query_answers_contents",
+        "get_query_hierarchy",
+        "get_resource_ids",
+        "get_series_tag_table",
+        "get_study_tag_table",
+        "instance",
+        "mirror",
+        "one_series",
+        "patient",
+        "plan_study_download",
+        "replicate",
+        "send_resources",
+        "study",
+        "track_job",
+    ]
+)
+
 
 class Orthanc:
     """
@@ -37,22 +86,69 @@ class Orthanc:
         Auth object from :mod:`requests` with server credentials (optional)
     :param bool warn_insecure:
         Warn on HTTP endpoints (default: True)
+    :param beren.RetryPolicy retry:
+        Retry idempotent requests with backoff (optional)
+    :param beren.AdaptiveLimiter limiter:
+        Limit concurrent requests across all endpoints of this client (optional)
+    :param json_decoder:
+        Decode JSON responses with "orjson", "msgspec", "ujson", "json", the
+        fastest installed ("auto"), or a callable taking bytes (optional)
+    :param bool coalesce:
+        Send a single request for concurrent identical reads and share its
+        (read-only) result between the callers (default: False)
+    :param beren.DiskCache cache:
+        Cache instance files, frames, and tags on disk (optional)
+    :param beren.SQLiteCache metadata_cache:
+        Cache patients, studies, ordered slices, and ``find`` results, possibly
+        shared with other processes (optional)
+    :param beren.FindCache find_cache:
+        Reuse ``find`` results until the server records a change (optional)
+    :param bool compression:
+        Ask for compressed JSON responses, and download "raw" frames as
+        "raw.gz" (decompressed here); the server must enable
+        ``HttpCompressionEnabled`` (default: False)
+    :param bool transfer_stats:
+        Count the bytes transferred by each endpoint in
+        ``transfer_stats``, a :class:`beren.TransferStats` (default: False)
     :return:
         A class with robust methods to interact with the REST API
     :rtype:
         class
     """
 
-    def __init__(self, server, auth=None, warn_insecure=True):
+    def __init__(
+        self,
+        server,
+        auth=None,
+        warn_insecure=True,
+        retry=None,
+        limiter=None,
+        json_decoder=None,
+        coalesce=False,
+        cache=None,
+        metadata_cache=None,
+        find_cache=None,
+        compression=False,
+        transfer_stats=False,
+    ):
         self._target = server
         self._auth = auth
-        self.instances = OrthancInstances
-        self.modalities = OrthancModalities
-        self.patients = OrthancPatients
-        self.queries = OrthancQueries
-        self.series = OrthancSeries
-        self.server = OrthancServer
-        self.studies = OrthancStudies
+        self._cache = cache
+        self._metadata_cache = metadata_cache
+        self._find_cache = find_cache
+        self._job_manager = None
+        self._job_manager_lock = Lock()
+        self._compression = compression
+        self._raw_gz_frames = compression  # until the server refuses them
+        self.transfer_stats = TransferStats() if transfer_stats else None
+        self._transport = Transport(
+            retry=retry,
+            limiter=limiter,
+            json_decoder=json_decoder,
+            coalesce=coalesce,
+            compression=compression,
+            stats=self.transfer_stats,
+        )
 
         if urlparse(server)[0] == "http" and warn_insecure:
             warn(
@@ -61,22 +157,37 @@ class Orthanc:
                 )
             )
 
-        # Set target and auth for each apiron service
-        for x in [
-            self.instances,
-            self.modalities,
-            self.patients,
-            self.queries,
-            self.series,
-            self.server,
-            self.studies,
-        ]:
-            setattr(x, "domain", self._target)
-            setattr(x, "auth", self._auth)
+        # Bind each apiron service to this client's target, auth and transport
+        bind = self._transport.bind
+        self.instances = bind(OrthancInstances, self._target, self._auth)
+        self.modalities = bind(OrthancModalities, self._target, self._auth)
+        self.patients = bind(OrthancPatients, self._target, self._auth)
+        self.queries = bind(OrthancQueries, self._target, self._auth)
+        self.series = bind(OrthancSeries, self._target, self._auth)
+        self.server = bind(OrthancServer, self._target, self._auth)
+        self.studies = bind(OrthancStudies, self._target, self._auth)
 
     def __repr__(self):
         return "<Orthanc REST client({})>".format(self._target)
 
+    def _cached_metadata(self, key, fetch):
+        """Serve ``fetch()`` through the metadata cache, when there is one"""
+        if self._metadata_cache is None:
+            return fetch()
+        return self._metadata_cache.get_json(cache_key(self._target, *key), fetch)
+
+    @staticmethod
+    def _transcode(kwargs, transcode, body=False):
+        """Ask for a transfer syntax, in the query string or the JSON request body"""
+        if transcode is None:
+            return None
+        uid = transfer_syntax(transcode)
+        if body:
+            kwargs["json"] = dict(kwargs.get("json") or {}, Transcode=uid)
+        else:
+            kwargs["params"] = dict(kwargs.get("params") or {}, transcode=uid)
+        return uid
+
     @classmethod
     def get_api_methods(cls):
         """List callable endpoints"""
@@ -84,7 +195,8 @@ class Orthanc:
             func
             for func in dir(cls)
             if callable(getattr(cls, func))
-            and not func.startswith("__")
+            and not func.startswith("_")
+            and func not in HELPER_METHODS
             and func
             not in [
                 "clean",
@@ -146,9 +258,192 @@ class Orthanc:
         else:
             return params
 
+    #### OBJECT GRAPH
+    def patient(self, id_):
+        """Navigable patient, see :mod:`beren.graph`
+
+        Example:
+
+            >>> for study in orthanc.patient(<id>).studies:
+            ...     for series in study.series:  # one request for all studies
+            ...         print(series.tag("Modality"), len(series.instances))
+
+        :param str id_:
+            Patient UUID
+        :return:
+            Lazily loaded patient
+        :rtype:
+            beren.graph.PatientNode
+        """
+        return PatientNode(self, id_)
+
+    def study(self, id_):
+        """Navigable study, see :mod:`beren.graph`
+
+        :param str id_:
+            Study UUID
+        :rtype:
+            beren.graph.StudyNode
+        """
+        return StudyNode(self, id_)
+
+    def one_series(self, id_):
+        """Navigable series, see :mod:`beren.graph`
+
+        :param str id_:
+            Series UUID
+        :rtype:
+            beren.graph.SeriesNode
+        """
+        return SeriesNode(self, id_)
+
+    def instance(self, id_):
+        """Navigable instance, see :mod:`beren.graph`
+
+        :param str id_:
+            Instance UUID
+        :rtype:
+            beren.graph.InstanceNode
+        """
+        return InstanceNode(self, id_)
+
+    #### EXPORT
+    def export_catalog(self, path, level="Instance", format="parquet", **kwargs):
+        """Export the expanded resources of a level to a Parquet or Arrow file
+
+        See :func:`beren.export.export_catalog` for the other arguments.
+
+        Example:
+
+            >>> orthanc.export_catalog('instances.parquet', 'Instance', row_group_size=100000)
+            1234567
+
+        :param str path:
+            Output file
+        :param str level:
+            "Patient", "Study", "Series", or "Instance" (default: "Instance")
+        :param str format:
+            "parquet" or "arrow" (default: "parquet")
+        :return:
+            Number of rows written
+        :rtype:
+            int
+        """
+        return export_catalog(self, path, level, format, **kwargs)
+
+    #### BULK OPERATIONS
+    def bulk_anonymize(self, ids=None, level="Study", query=None, data=None, **kwargs):
+        """Anonymize many resources with asynchronous jobs
+
+        See :func:`beren.bulk.bulk_anonymize` for the other arguments.
+
+        :param list ids:
+            Resource UUIDs
+        :param str level:
+            "Patient", "Study", or "Series" (default: "Study")
+        :param dict query:
+            Anonymize the resources matching this ``find`` query instead of ``ids``
+        :param dict data:
+            Anonymization request body
+        :return:
+            Yields ``BulkResult(old_id, new_id, job_id, error)`` as jobs end
+        :rtype:
+            generator
+        """
+        return bulk_anonymize(self, ids, level, query, data, **kwargs)
+
+    def bulk_modify(self, data, ids=None, level="Study", query=None, **kwargs):
+        """Modify many resources with asynchronous jobs
+
+        See :func:`beren.bulk.bulk_modify` for the other arguments.
+
+        :param dict data:
+            Modification request body
+        :param list ids:
+            Resource UUIDs
+        :param str level:
+            "Patient", "Study", or "Series" (default: "Study")
+        :param dict query:
+            Modify the resources matching this ``find`` query instead of ``ids``
+        :return:
+            Yields ``BulkResult(old_id, new_id, job_id, error)`` as jobs end
+        :rtype:
+            generator
+        """
+        return bulk_modify(self, data, ids, level, query, **kwargs)
+
+    #### REPLICATION
+    def replicate(self, target, peer=None, checkpoint=None, **kwargs):
+        """Copy the instances missing from another server
+
+        See :class:`beren.Replicator` for the other arguments, and for
+        continuous replication.
+
+        Example:
+
+            >>> orthanc.replicate(backup, checkpoint='dr-sync.json')
+            {'copied': 1234, 'existing': 0, 'failed': 0, 'bytes': 987654321}
+
+        :param beren.Orthanc target:
+            Client of the server to copy to
+        :param str peer:
+            Name of the target among this server's peers, to copy with
+            ``store_peer`` jobs (optional)
+        :param str checkpoint:
+            File holding the replication state, so that only the changes are
+            copied next time (optional)
+        :return:
+            Counts of copied, already present, and failed instances
+        :rtype:
+            dict
+        """
+        return Replicator(self, target, peer, checkpoint=checkpoint, **kwargs).sync()
+
+    def send_resources(self, ids, modalities=(), peers=(), **kwargs):
+        """Send many resources to modalities and peers with batched store jobs
+
+        See :class:`beren.Sender` for the other arguments.
+
+        Example:
+
+            >>> for result in orthanc.send_resources(study_ids, modalities=['READING1']):
+            ...     print(result.destination, len(result.resources), result.error)
+
+        :param list ids:
+            Resource UUIDs
+        :param list modalities:
+            Modality names
+        :param list peers:
+            Peer names
+        :return:
+            Yields a :class:`beren.SendResult` per batch, as its jobs end
+        :rtype:
+            generator
+        """
+        return Sender(self, **kwargs).send(ids, modalities, peers)
+
+    def mirror(self, directory, workers=4, **kwargs):
+        """Bring a local copy of this server's DICOM files up to date
+
+        The first call downloads everything, the next ones only apply the
+        changes since. See :class:`beren.Mirror` for the other arguments, and
+        for continuous mirroring.
+
+        :param str directory:
+            Root of the mirror, laid out as ``<patient>/<study>/<series>/<instance>.dcm``
+        :param int workers:
+            Concurrent downloads (default: 4)
+        :return:
+            Counts of instances added, deleted, and failing to download
+        :rtype:
+            dict
+        """
+        with Mirror(self, directory, workers, **kwargs) as mirror:
+            return mirror.sync()
+
     #### INSTANCES
     def get_instances(
-        self, expand=False, since=None, limit=None, params=None, **kwargs
+        self, expand=False, since=None, limit=None, params=None, records=False, **kwargs
     ):
         """Return instance record(s). No raw file data.
 
@@ -164,13 +459,34 @@ class Orthanc:
             Limit to given number of records. Optional. Must use with ``since``.
         :param dict params:
             Provide overriding parameter dictionary
+        :param bool records:
+            Return compact records (see :mod:`beren.records`) instead of dicts. Default ``False``.
         :return:
             A list of records: either UUIDs or dictionary of information
         :rtype:
             list
         """
         kwargs["params"] = self.build_root_parameters(expand, since, limit, params)
-        return self.instances.instances(**kwargs)
+        result = self.instances.instances(**kwargs)
+        return to_records(result) if records else result
+
+    def stream_instances(
+        self, expand=False, since=None, limit=None, params=None, records=False, **kwargs
+    ):
+        """Like ``get_instances``, but parse the response incrementally.
+
+        Holds one record in memory at a time instead of the whole listing.
+
+        :param bool records:
+            Return compact records (see :mod:`beren.records`) instead of dicts. Default ``False``.
+        :return:
+            Yields records: either UUIDs or dictionary of information
+        :rtype:
+            generator
+        """
+        kwargs["params"] = self.build_root_parameters(expand, since, limit, params)
+        result = iter_json(self.instances.instances_stream(**kwargs))
+        return to_records(result) if records else result
 
     def add_instance(self, dicom, **kwargs):
         """Add DICOM instance.
@@ -184,19 +500,22 @@ class Orthanc:
         """
         return self.instances.add_instance(data=dicom, **kwargs)
 
-    def get_instance(self, id_, **kwargs):
+    def get_instance(self, id_, records=False, **kwargs):
         """Get a single instance record. Equivalent to ``expand``.
 
         No raw data - use ``get_instance_file`` instead
 
         :param str id_:
             The instance UUID
+        :param bool records:
+            Return compact records (see :mod:`beren.records`) instead of dicts. Default ``False``.
         :return:
             Instance information
         :rtype:
             dict
         """
-        return self.instances.instance(id_=id_, **kwargs)
+        result = self.instances.instance(id_=id_, **kwargs)
+        return to_records(result) if records else result
 
     def delete_instance(self, id_, **kwargs):
         """Delete an instance
@@ -289,7 +608,7 @@ class Orthanc:
         """
         return self.instances.export(id_=id_, data={}, **kwargs)
 
-    def get_instance_file(self, id_, **kwargs):
+    def get_instance_file(self, id_, transcode=None, decode=False, **kwargs):
         """Get the instance file
 
         Example:
@@ -297,18 +616,39 @@ class Orthanc:
             >>> for x in orthanc.get_instance_file(<id>):
             ...     print(x)
 
+        Served from the disk cache when the client has one. With
+        ``transcode``, the server compresses the pixel data first, so fewer
+        bytes are transferred; ``decode`` then decompresses it here.
+
         :param str id_:
             The instance UUID
+        :param str transcode:
+            Transfer syntax UID or short name (see :data:`beren.TRANSFER_SYNTAXES`),
+            e.g. "jpeg2000-lossless", to compress the files on the server
+            before they are sent (optional)
+        :param bool decode:
+            Decompress the transcoded file, see :func:`beren.decode_file`. Default ``False``.
         :return:
             Yields the raw DICOM file
         :rtype:
             generator
         """
-        return self.instances.file_(id_=id_, **kwargs)
+        uid = self._transcode(kwargs, transcode)
+        fetch = partial(self.instances.file_, id_=id_, **kwargs)
+        if self._cache is None:
+            chunks = fetch()
+        else:
+            key = ("file", id_) if uid is None else ("file", id_, uid)
+            chunks = self._cache.stream(cache_key(self._target, *key), fetch)
+        return iter([decode_file(chunks)]) if decode else chunks
 
     def get_instance_frame(self, id_, frame, format_, **kwargs):
         """Get an instance frame in specified format
 
+        Served from the disk cache when the client has one. With
+        ``compression``, "raw" frames are downloaded as "raw.gz" and
+        decompressed while they stream, unless the server does not support it.
+
         :param str id_:
             The instance UUID
         :param int frame:
@@ -320,7 +660,27 @@ class Orthanc:
         :return:
             generator
         """
-        return self.instances.frame(id_=id_, frame=frame, format_=format_, **kwargs)
+        fetch = partial(
+            self.instances.frame, id_=id_, number=frame, format_=format_, **kwargs
+        )
+        if format_ == "raw" and self._raw_gz_frames:
+            fetch = partial(self._get_raw_frame, fetch, id_, frame, **kwargs)
+        if self._cache is None:
+            return fetch()
+        key = cache_key(self._target, "frame", id_, frame, format_)
+        return self._cache.stream(key, fetch)
+
+    def _get_raw_frame(self, fetch_raw, id_, frame, **kwargs):
+        """Raw frame through "raw.gz", falling back to "raw" on older servers"""
+        try:
+            return self.instances.frame_raw_gz(id_=id_, number=frame, **kwargs)
+        except HTTPError as e:
+            if e.response is None or not 400 <= e.response.status_code < 500:
+                raise
+        frame_data = fetch_raw()
+        # "raw" works where "raw.gz" did not: the server does not support it
+        self._raw_gz_frames = False
+        return frame_data
 
     def get_instance_frames(self, id_, **kwargs):
         """Get the list of frame numbers in the instance file.
@@ -534,6 +894,8 @@ class Orthanc:
     def get_instance_tags(self, id_, simplify=False, short=False, **kwargs):
         """Get the detailed tags for the DICOM instance
 
+        Served from the disk cache when the client has one.
+
         :param str id_:
             Instance UUID
         :param bool simplify:
@@ -546,10 +908,16 @@ class Orthanc:
             dict
         """
         kwargs["params"] = self.clean({"simplify": simplify, "short": short})
-        return self.instances.tags(id_=id_, **kwargs)
+        fetch = partial(self.instances.tags, id_=id_, **kwargs)
+        if self._cache is None:
+            return fetch()
+        key = cache_key(self._target, "tags", id_, bool(simplify), bool(short))
+        return self._cache.get_json(key, fetch)
 
     #### PATIENTS
-    def get_patients(self, expand=False, since=None, limit=None, params=None, **kwargs):
+    def get_patients(
+        self, expand=False, since=None, limit=None, params=None, records=False, **kwargs
+    ):
         """Return patient record(s)
 
         Use ``expand`` keyword argument to retrieve expanded information.
@@ -564,25 +932,49 @@ class Orthanc:
             Limit to given number of records. Optional. Must use with ``since``.
         :param dict params:
             Provide paramaters dict to override other values
+        :param bool records:
+            Return compact records (see :mod:`beren.records`) instead of dicts. Default ``False``.
         :return:
             A list of records: either UUIDs or dictionary of information
         :rtype:
             list
         """
         kwargs["params"] = self.build_root_parameters(expand, since, limit, params)
-        return self.patients.patients(**kwargs)
+        result = self.patients.patients(**kwargs)
+        return to_records(result) if records else result
+
+    def stream_patients(
+        self, expand=False, since=None, limit=None, params=None, records=False, **kwargs
+    ):
+        """Like ``get_patients``, but parse the response incrementally.
+
+        :param bool records:
+            Return compact records (see :mod:`beren.records`) instead of dicts. Default ``False``.
+        :return:
+            Yields records: either UUIDs or dictionary of information
+        :rtype:
+            generator
+        """
+        kwargs["params"] = self.build_root_parameters(expand, since, limit, params)
+        result = iter_json(self.patients.patients_stream(**kwargs))
+        return to_records(result) if records else result
 
-    def get_patient(self, id_, **kwargs):
+    def get_patient(self, id_, records=False, **kwargs):
         """Get a single patient record. Equivalent to ``expand``.
 
         :param str id_:
             The patient UUID
+        :param bool records:
+            Return compact records (see :mod:`beren.records`) instead of dicts. Default ``False``.
         :return:
             Expanded patient record
         :rtype:
             dict
         """
-        return self.patients.patient(id_=id_, **kwargs)
+        result = self._cached_metadata(
+            ("patient", id_), partial(self.patients.patient, id_=id_, **kwargs)
+        )
+        return to_records(result) if records else result
 
     def delete_patient(self, id_, **kwargs):
         return self.patients.del_patient(id_=id_, **kwargs)
@@ -590,31 +982,86 @@ class Orthanc:
     def anonymize_patient(self, id_, data={}, **kwargs):
         return self.patients.anonymize(id_=id_, json=data, **kwargs)
 
-    def archive_patient(self, id_, **kwargs):
+    def archive_patient(
+        self, id_, asynchronous=False, progress=None, transcode=None, **kwargs
+    ):
+        """Create a ZIP archive of the patient
+
+        :param str id_:
+            Patient UUID
+        :param bool asynchronous:
+            Build the archive with an Orthanc job, then download it, instead of
+            one long request that proxies may time out. Default ``False``.
+        :param callable progress:
+            With ``asynchronous``, called with the :class:`beren.Job` handle
+            whenever the job progresses
+        :param str transcode:
+            Transfer syntax UID or short name (see :data:`beren.TRANSFER_SYNTAXES`),
+            e.g. "jpeg2000-lossless", to compress the files on the server
+            before they are sent (optional)
+        :return:
+            Returns zip archive as a generator
+        :rtype:
+            generator
+        """
+        self._transcode(kwargs, transcode, body=asynchronous)
+        if asynchronous:
+            kwargs["json"] = dict(kwargs.get("json") or {}, Asynchronous=True)
+            job = self.patients.archive_job(id_=id_, **kwargs)
+            return self._job_output(job, progress)
         return self.patients.archive(id_=id_, **kwargs)
 
-    def get_patient_instances(self, id_, **kwargs):
+    def get_patient_instances(self, id_, records=False, **kwargs):
         """Get all instances for this patient
 
         :param str id_:
             Patient UUID
+        :param bool records:
+            Return compact records (see :mod:`beren.records`) instead of dicts. Default ``False``.
         :return:
             All the instances for this patient. Expanded information.
         :rtype:
             list (dict)
         """
-        return self.patients.instances(id_=id_, **kwargs)
+        result = self.patients.instances(id_=id_, **kwargs)
+        return to_records(result) if records else result
 
     def get_patient_instance_tags(self, id_, **kwargs):
         return self.patients.instances_tags(id_=id_, **kwargs)
 
+    def stream_patient_instance_tags(self, id_, **kwargs):
+        """Like ``get_patient_instance_tags``, but parse the response incrementally.
+
+        :param str id_:
+            Patient UUID
+        :return:
+            Yields ``(instance UUID, tags)`` pairs
+        :rtype:
+            generator
+        """
+        return iter_json(self.patients.instances_tags_stream(id_=id_, **kwargs))
+
     def modify_patient(self, id_, data, **kwargs):
         return self.patients.modify(id_=id_, json=data, **kwargs)
 
     def get_patient_module(self, id_, **kwargs):
         return self.patients.module(id_=id_, **kwargs)
 
-    def get_patient_media(self, id_, **kwargs):
+    def get_patient_media(self, id_, transcode=None, **kwargs):
+        """Create a ZIP archive of the patient for media storage, with a DICOMDIR
+
+        :param str id_:
+            Patient UUID
+        :param str transcode:
+            Transfer syntax UID or short name (see :data:`beren.TRANSFER_SYNTAXES`),
+            e.g. "jpeg2000-lossless", to compress the files on the server
+            before they are sent (optional)
+        :return:
+            Returns zip archive as a generator
+        :rtype:
+            generator
+        """
+        self._transcode(kwargs, transcode)
         return self.patients.media(id_=id_, **kwargs)
 
     def get_patient_protected(self, id_, **kwargs):
@@ -626,17 +1073,20 @@ class Orthanc:
     def reconstruct_patient(self, id_, data={}, **kwargs):
         return self.patients.protected(id_=id_, data=data, **kwargs)
 
-    def get_patient_series(self, id_, **kwargs):
+    def get_patient_series(self, id_, records=False, **kwargs):
         """Get all series for this patient
 
         :param str id_:
             Patient UUID
+        :param bool records:
+            Return compact records (see :mod:`beren.records`) instead of dicts. Default ``False``.
         :return:
             All the series for this patient. Expanded information.
         :rtype:
             list (dict)
         """
-        return self.patients.series(id_=id_, **kwargs)
+        result = self.patients.series(id_=id_, **kwargs)
+        return to_records(result) if records else result
 
     def get_patient_shared_tags(self, id_, **kwargs):
         return self.patients.shared_tags(id_=id_, **kwargs)
@@ -644,17 +1094,20 @@ class Orthanc:
     def get_patient_statistics(self, id_, **kwargs):
         return self.patients.statistics(id_=id_, **kwargs)
 
-    def get_patient_studies(self, id_, **kwargs):
+    def get_patient_studies(self, id_, records=False, **kwargs):
         """Get all studies for this patient
 
         :param str id_:
             Patient UUID
+        :param bool records:
+            Return compact records (see :mod:`beren.records`) instead of dicts. Default ``False``.
         :return:
             All the studies for this patient. Expanded information.
         :rtype:
             list (dict)
         """
-        return self.patients.studies(id_=id_, **kwargs)
+        result = self.patients.studies(id_=id_, **kwargs)
+        return to_records(result) if records else result
 
     def get_patient_id_from_uuid(self, id_, **kwargs):
         """Get the patient ID (usually equivalent to MRN/PUID) from UUID
@@ -675,14 +1128,19 @@ class Orthanc:
         )
 
     def get_patient_studies_from_id(self, id_, **kwargs):
+        """Get all studies for the patient ID (usually equivalent to MRN/PUID)
+
+        Helper function. Uses a single ``find`` request.
+
+        :param str id_:
+            The patient ID
+        :return:
+            All the studies for this patient. Expanded information.
+        :rtype:
+            list (dict)
+        """
         try:
-            return [
-                self.get_patient_studies(patient)
-                for patient in self.find(
-                    {"Level": "Patient", "Limit": 1, "Query": {"PatientID": id_}},
-                    **kwargs
-                )
-            ][0]
+            return self.find({"PatientID": id_}, "Study", expand=True, **kwargs)
         except:
             return []
 
@@ -697,11 +1155,56 @@ class Orthanc:
         return self.queries.del_query(id_=id_, **kwargs)
 
     def get_query_answers(self, id_, **kwargs):
-        return self.queries.query(id_=id_, **kwargs)
+        return self.queries.answers(id_=id_, **kwargs)
 
     def get_query_answers_content(self, id_, index, **kwargs):
         return self.queries.answers_content(id_=id_, index=index, **kwargs)
 
+    def get_query_answers_contents(self, id_, simplify=True, workers=8):
+        """Contents of every answer of a query, fetched concurrently
+
+        :param str id_:
+            Query ID
+        :param bool simplify:
+            Tags by name, with plain values (default: True)
+        :param int workers:
+            Concurrent requests (default: 8)
+        :return:
+            Contents, in answer order
+        :rtype:
+            list (dict)
+        """
+        return answer_contents(self, id_, workers=workers, simplify=simplify)
+
+    def get_query_hierarchy(self, id_, depth="Series", workers=8, level=None):
+        """Remote resources below the answers of a query, queried concurrently
+
+        See :func:`beren.query_hierarchy`.
+
+        :param str id_:
+            Query ID
+        :param str depth:
+            Deepest level to query (default: "Series")
+        :param int workers:
+            Concurrent requests (default: 8)
+        :param str level:
+            Level of the query (default: read from its answers)
+        :return:
+            Answers as ``{"Level", "QueryID", "Index", "Tags", "Children"}`` nodes
+        :rtype:
+            list (dict)
+        """
+        return query_hierarchy(self, id_, depth, workers, level)
+
+    def post_query_answers_studies(self, id_, index, data={}, **kwargs):
+        return self.queries.answers_studies(id_=id_, index=index, json=data, **kwargs)
+
+    def post_query_answers_series(self, id_, index, data={}, **kwargs):
+        return self.queries.answers_series(id_=id_, index=index, json=data, **kwargs)
+
+    def post_query_answers_instances(self, id_, index, data={}, **kwargs):
+        return self.queries.answers_instances(id_=id_, index=index, json=data, **kwargs)
+
     def post_query_answers_retrieve(self, id_, index, **kwargs):
         return self.queries.answers_retrieve(id_=id_, index=index, **kwargs)
 
@@ -718,7 +1221,9 @@ class Orthanc:
         return self.queries.retrieve(id_=id_, **kwargs)
 
     #### SERIES
-    def get_series(self, expand=False, since=None, limit=None, params=None, **kwargs):
+    def get_series(
+        self, expand=False, since=None, limit=None, params=None, records=False, **kwargs
+    ):
         """Return series record(s).
 
         Use ``expand`` keyword argument to retrieve extensive information.
@@ -733,16 +1238,47 @@ class Orthanc:
             Limit to given number of records. Optional. Must use with ``since``.
         :param dict params:
             Provide overriding parameter dictionary
+        :param bool records:
+            Return compact records (see :mod:`beren.records`) instead of dicts. Default ``False``.
         :return:
             A list of records: either UUIDs or dictionary of information
         :rtype:
             list
         """
         kwargs["params"] = self.build_root_parameters(expand, since, limit, params)
-        return self.series.series(**kwargs)
+        result = self.series.series(**kwargs)
+        return to_records(result) if records else result
+
+    def stream_series(
+        self, expand=False, since=None, limit=None, params=None, records=False, **kwargs
+    ):
+        """Like ``get_series``, but parse the response incrementally.
+
+        :param bool records:
+            Return compact records (see :mod:`beren.records`) instead of dicts. Default ``False``.
+        :return:
+            Yields records: either UUIDs or dictionary of information
+        :rtype:
+            generator
+        """
+        kwargs["params"] = self.build_root_parameters(expand, since, limit, params)
+        result = iter_json(self.series.series_stream(**kwargs))
+        return to_records(result) if records else result
 
-    def get_one_series(self, id_, **kwargs):
-        return self.series.part(id_=id_, **kwargs)
+    def get_one_series(self, id_, records=False, **kwargs):
+        """Get a single series record. Equivalent to ``expand``.
+
+        :param str id_:
+            Series UUID
+        :param bool records:
+            Return compact records (see :mod:`beren.records`) instead of dicts. Default ``False``.
+        :return:
+            Expanded series record
+        :rtype:
+            dict
+        """
+        result = self.series.part(id_=id_, **kwargs)
+        return to_records(result) if records else result
 
     def delete_series(self, id_, **kwargs):
         return self.series.del_part(id_=id_, **kwargs)
@@ -750,34 +1286,96 @@ class Orthanc:
     def anonymize_series(self, id_, data={}, **kwargs):
         return self.series.anonymize(id_=id_, json=data, **kwargs)
 
-    def get_series_archive(self, id_, **kwargs):
+    def get_series_archive(
+        self, id_, asynchronous=False, progress=None, transcode=None, **kwargs
+    ):
         """Create a ZIP archive for media storage with DICOMDIR
 
         :param str id_:
             Series UUID
+        :param bool asynchronous:
+            Build the archive with an Orthanc job, then download it, instead of
+            one long request that proxies may time out. Default ``False``.
+        :param callable progress:
+            With ``asynchronous``, called with the :class:`beren.Job` handle
+            whenever the job progresses
+        :param str transcode:
+            Transfer syntax UID or short name (see :data:`beren.TRANSFER_SYNTAXES`),
+            e.g. "jpeg2000-lossless", to compress the files on the server
+            before they are sent (optional)
         :return:
             Returns zip archive as a generator
         :rtype:
             generator
         """
+        self._transcode(kwargs, transcode, body=asynchronous)
+        if asynchronous:
+            kwargs["json"] = dict(kwargs.get("json") or {}, Asynchronous=True)
+            job = self.series.archive_job(id_=id_, **kwargs)
+            return self._job_output(job, progress)
         return self.series.archive(id_=id_, **kwargs)
 
-    def get_series_instances(self, id_, **kwargs):
+    def get_series_instances(self, id_, records=False, **kwargs):
         """Retrieve all the instances of this series in a single REST call
 
         :param str id_:
             Series UUID
+        :param bool records:
+            Return compact records (see :mod:`beren.records`) instead of dicts. Default ``False``.
         :return:
             Expanded information of all the instances in this series
         :rtype:
             list (dict)
         """
-        return self.series.instances(id_=id_, **kwargs)
+        result = self.series.instances(id_=id_, **kwargs)
+        return to_records(result) if records else result
 
     def get_series_instances_tags(self, id_, **kwargs):
         return self.series.instances_tags(id_=id_, **kwargs)
 
-    def get_series_media(self, id_, **kwargs):
+    def stream_series_instances_tags(self, id_, **kwargs):
+        """Like ``get_series_instances_tags``, but parse the response incrementally.
+
+        :param str id_:
+            Series UUID
+        :return:
+            Yields ``(instance UUID, tags)`` pairs
+        :rtype:
+            generator
+        """
+        return iter_json(self.series.instances_tags_stream(id_=id_, **kwargs))
+
+    def get_series_tag_table(self, id_, tags=None, types=None, frame=None, **kwargs):
+        """Tags of every instance of the series as a columnar table.
+
+        Like ``get_study_tag_table``, for a series.
+
+        :param str id_:
+            Series UUID
+        :return:
+            One row per instance
+        :rtype:
+            beren.TagTable, or the requested ``frame``
+        """
+        kwargs["params"] = self.clean({"simplify": True})  # overrule
+        table = tag_table(self.stream_series_instances_tags(id_, **kwargs), tags, types)
+        return table.convert(frame)
+
+    def get_series_media(self, id_, transcode=None, **kwargs):
+        """Create a ZIP archive of the series for media storage, with a DICOMDIR
+
+        :param str id_:
+            Series UUID
+        :param str transcode:
+            Transfer syntax UID or short name (see :data:`beren.TRANSFER_SYNTAXES`),
+            e.g. "jpeg2000-lossless", to compress the files on the server
+            before they are sent (optional)
+        :return:
+            Returns zip archive as a generator
+        :rtype:
+            generator
+        """
+        self._transcode(kwargs, transcode)
         return self.series.media(id_=id_, **kwargs)
 
     def modify_series(self, id_, data, **kwargs):
@@ -787,7 +1385,10 @@ class Orthanc:
         return self.series.module(id_=id_, **kwargs)
 
     def get_series_ordered_slices(self, id_, **kwargs):
-        return self.series.ordered_slices(id_=id_, **kwargs)
+        return self._cached_metadata(
+            ("ordered-slices", id_),
+            partial(self.series.ordered_slices, id_=id_, **kwargs),
+        )
 
     def get_series_patient(self, id_, **kwargs):
         return self.series.patient(id_=id_, **kwargs)
@@ -805,7 +1406,9 @@ class Orthanc:
         return self.series.study(id_=id_, **kwargs)
 
     #### STUDIES
-    def get_studies(self, expand=False, since=None, limit=None, params=None, **kwargs):
+    def get_studies(
+        self, expand=False, since=None, limit=None, params=None, records=False, **kwargs
+    ):
         """Return study record(s)
 
         Use ``expand`` keyword argument to retrieve expanded information.
@@ -820,16 +1423,49 @@ class Orthanc:
             Limit to given number of records. Optional. Must use with ``since``.
         :param dict params:
             Provide paramaters dict to override other values
+        :param bool records:
+            Return compact records (see :mod:`beren.records`) instead of dicts. Default ``False``.
         :return:
             A list of records: either UUIDs or dictionary of information
         :rtype:
             list
         """
         kwargs["params"] = self.build_root_parameters(expand, since, limit, params)
-        return self.studies.studies(**kwargs)
+        result = self.studies.studies(**kwargs)
+        return to_records(result) if records else result
+
+    def stream_studies(
+        self, expand=False, since=None, limit=None, params=None, records=False, **kwargs
+    ):
+        """Like ``get_studies``, but parse the response incrementally.
+
+        :param bool records:
+            Return compact records (see :mod:`beren.records`) instead of dicts. Default ``False``.
+        :return:
+            Yields records: either UUIDs or dictionary of information
+        :rtype:
+            generator
+        """
+        kwargs["params"] = self.build_root_parameters(expand, since, limit, params)
+        result = iter_json(self.studies.studies_stream(**kwargs))
+        return to_records(result) if records else result
 
-    def get_study(self, id_, **kwargs):
-        return self.studies.study(id_=id_, **kwargs)
+    def get_study(self, id_, records=False, **kwargs):
+        """Get a single study record. Equivalent to ``expand``.
+
+        :param str id_:
+            Study UUID
+        :param bool records:
+            Return compact records (see :mod:`beren.records`) instead of dicts. Default ``False``.
+        :return:
+            Expanded study record
+        :rtype:
+            dict
+        """
+        result = self._cached_metadata(
+            ("study", id_), partial(self.studies.study, id_=id_, **kwargs)
+        )
+        return to_records(result) if records else result
 
     def delete_study(self, id_, **kwargs):
         return self.studies.del_study(id_=id_, **kwargs)
@@ -837,16 +1473,124 @@ class Orthanc:
     def anonymize_study(self, id_, data={}, **kwargs):
         return self.studies.anonymize(id_=id_, json=data, **kwargs)
 
-    def get_study_archive(self, id_, **kwargs):
+    def get_study_archive(
+        self, id_, asynchronous=False, progress=None, transcode=None, **kwargs
+    ):
+        """Create a ZIP archive of the study
+
+        Example:
+
+            >>> chunks = orthanc.get_study_archive(<id>, asynchronous=True,
+            ...                                    progress=lambda job: print(job.progress))
+            >>> beren.extract_archive(chunks, '/data/export')
+
+        :param str id_:
+            Study UUID
+        :param bool asynchronous:
+            Build the archive with an Orthanc job, then download it, instead of
+            one long request that proxies may time out. Default ``False``.
+        :param callable progress:
+            With ``asynchronous``, called with the :class:`beren.Job` handle
+            whenever the job progresses
+        :param str transcode:
+            Transfer syntax UID or short name (see :data:`beren.TRANSFER_SYNTAXES`),
+            e.g. "jpeg2000-lossless", to compress the files on the server
+            before they are sent (optional)
+        :return:
+            Returns zip archive as a generator
+        :rtype:
+            generator
+        """
+        self._transcode(kwargs, transcode, body=asynchronous)
+        if asynchronous:
+            kwargs["json"] = dict(kwargs.get("json") or {}, Asynchronous=True)
+            job = self.studies.archive_job(id_=id_, **kwargs)
+            return self._job_output(job, progress)
         return self.studies.archive(id_=id_, **kwargs)
 
-    def get_study_instances(self, id_, **kwargs):
-        return self.studies.instances(id_=id_, **kwargs)
+    def get_study_instances(self, id_, records=False, **kwargs):
+        """Get all instances for this study
+
+        :param str id_:
+            Study UUID
+        :param bool records:
+            Return compact records (see :mod:`beren.records`) instead of dicts. Default ``False``.
+        :return:
+            All the instances for this study. Expanded information.
+        :rtype:
+            list (dict)
+        """
+        result = self.studies.instances(id_=id_, **kwargs)
+        return to_records(result) if records else result
 
     def get_study_instances_tags(self, id_, **kwargs):
         return self.studies.instances_tags(id_=id_, **kwargs)
 
-    def get_study_media(self, id_, **kwargs):
+    def stream_study_instances_tags(self, id_, **kwargs):
+        """Like ``get_study_instances_tags``, but parse the response incrementally.
+
+        Example:
+
+            >>> for instance, tags in orthanc.stream_study_instances_tags(<id>):
+            ...     print(instance, tags["0008,0018"]["Value"])
+
+        :param str id_:
+            Study UUID
+        :return:
+            Yields ``(instance UUID, tags)`` pairs
+        :rtype:
+            generator
+        """
+        return iter_json(self.studies.instances_tags_stream(id_=id_, **kwargs))
+
+    def get_study_tag_table(self, id_, tags=None, types=None, frame=None, **kwargs):
+        """Tags of every instance of the study as a columnar table.
+
+        The simplified tags of all instances are fetched in a single request
+        and parsed incrementally into typed columns: integers, floats, tuples
+        of floats for numeric multi-valued tags (ImagePositionPatient...), and
+        strings. Identifiers, dates, and times stay strings.
+
+        Example:
+
+            >>> table = orthanc.get_study_tag_table(<id>, ['SeriesNumber', 'SliceThickness'])
+            >>> table['SliceThickness']
+            [2.5, 2.5, 5.0, ...]
+            >>> df = orthanc.get_study_tag_table(<id>, frame='pandas')
+
+        :param str id_:
+            Study UUID
+        :param list tags:
+            Tag names to keep (default: every tag found)
+        :param dict types:
+            Column types overriding the inferred ones, e.g. ``{"PatientAge": "str"}``
+        :param str frame:
+            Return a "numpy" dict of arrays, a "pandas" DataFrame, or an "arrow"
+            Table instead of a :class:`beren.TagTable` (requires the library)
+        :return:
+            One row per instance
+        :rtype:
+            beren.TagTable, or the requested ``frame``
+        """
+        kwargs["params"] = self.clean({"simplify": True})  # overrule
+        table = tag_table(self.stream_study_instances_tags(id_, **kwargs), tags, types)
+        return table.convert(frame)
+
+    def get_study_media(self, id_, transcode=None, **kwargs):
+        """Create a ZIP archive of the study for media storage, with a DICOMDIR
+
+        :param str id_:
+            Study UUID
+        :param str transcode:
+            Transfer syntax UID or short name (see :data:`beren.TRANSFER_SYNTAXES`),
+            e.g. "jpeg2000-lossless", to compress the files on the server
+            before they are sent (optional)
+        :return:
+            Returns zip archive as a generator
+        :rtype:
+            generator
+        """
+        self._transcode(kwargs, transcode)
         return self.studies.media(id_=id_, **kwargs)
 
     def modify_study(self, id_, data, **kwargs):
@@ -864,8 +1608,20 @@ class Orthanc:
     def reconstruct_study(self, id_, **kwargs):
         return self.studies.reconstruct(id_=id_, **kwargs)
 
-    def get_study_series(self, id_, **kwargs):
-        return self.studies.series(id_=id_, **kwargs)
+    def get_study_series(self, id_, records=False, **kwargs):
+        """Get all series for this study
+
+        :param str id_:
+            Study UUID
+        :param bool records:
+            Return compact records (see :mod:`beren.records`) instead of dicts. Default ``False``.
+        :return:
+            All the series for this study. Expanded information.
+        :rtype:
+            list (dict)
+        """
+        result = self.studies.series(id_=id_, **kwargs)
+        return to_records(result) if records else result
 
     def get_study_shared_tags(self, id_, **kwargs):
         return self.studies.shared_tags(id_=id_, **kwargs)
@@ -873,6 +1629,34 @@ class Orthanc:
     def get_study_statistics(self, id_, **kwargs):
         return self.studies.statistics(id_=id_, **kwargs)
 
+    def plan_study_download(self, id_, **kwargs):
+        """Choose how to download a study, see :func:`beren.download.plan_study_download`
+
+        :param str id_:
+            Study UUID
+        :rtype:
+            beren.DownloadPlan
+        """
+        return plan_study_download(self, id_, **kwargs)
+
+    def download_study(self, id_, directory, workers=4, **kwargs):
+        """Download a study to a directory, split into concurrent requests when large
+
+        See :func:`beren.download.download_study`.
+
+        :param str id_:
+            Study UUID
+        :param str directory:
+            Destination directory
+        :param int workers:
+            Number of concurrent requests (default: 4)
+        :return:
+            Written paths
+        :rtype:
+            list
+        """
+        return download_study(self, id_, directory, workers, **kwargs)
+
     #### MODALITIES ###
     def get_modalities(self, **kwargs):
         return self.modalities.modalities(**kwargs)
@@ -952,6 +1736,47 @@ class Orthanc:
     def resume_job(self, id_, **kwargs):
         return self.server.resume_job(id_=id_, data={}, **kwargs)
 
+    def get_job_output(self, id_, key, **kwargs):
+        return self.server.job_output(id_=id_, key=key, **kwargs)
+
+    def stream_job_output(self, id_, key, **kwargs):
+        """Stream a binary job output, such as the "archive" of an archive job
+
+        :param str id_:
+            Job ID
+        :param str key:
+            Output name
+        :return:
+            Yields ``bytes`` chunks
+        :rtype:
+            generator
+        """
+        return self.server.job_output_stream(id_=id_, key=key, **kwargs)
+
+    def _job_output(self, job, progress=None, key="archive"):
+        """Stream the output of a submitted job once it succeeds"""
+        return stream_job_output(self, self.track_job(job), key, progress)
+
+    def track_job(self, job):
+        """Future-like handle of a job, see :class:`beren.JobManager`
+
+        All the jobs tracked by a client share a single poller.
+
+        Example:
+
+            >>> job = orthanc.track_job(orthanc.modify_study(<id>, {"Replace": {...}, "Asynchronous": True}))
+            >>> job.result(timeout=600)["ID"]   # UUID of the modified study
+
+        :param job:
+            Job ID, or the response of an asynchronous request
+        :rtype:
+            beren.Job
+        """
+        with self._job_manager_lock:
+            if self._job_manager is None:
+                self._job_manager = JobManager(self)
+        return self._job_manager.track(job)
+
     def get_peers(self, **kwargs):
         return self.server.peers(**kwargs)
 
@@ -989,16 +1814,68 @@ class Orthanc:
         """
         return self.server.system(**kwargs)
 
-    def create_archive(self, **kwargs):
+    def create_archive(
+        self, asynchronous=False, progress=None, transcode=None, **kwargs
+    ):
+        """Create a ZIP archive of several resources
+
+        The request body (e.g. ``json={"Resources": [...]}``) is passed as is.
+
+        :param bool asynchronous:
+            Build the archive with an Orthanc job, then download it, instead of
+            one long request that proxies may time out. Default ``False``.
+        :param callable progress:
+            With ``asynchronous``, called with the :class:`beren.Job` handle
+            whenever the job progresses
+        :param str transcode:
+            Transfer syntax UID or short name (see :data:`beren.TRANSFER_SYNTAXES`),
+            e.g. "jpeg2000-lossless", to compress the files on the server
+            before they are sent (optional)
+        :return:
+            Returns zip archive as a generator
+        :rtype:
+            generator
+        """
+        self._transcode(kwargs, transcode, body=True)
+        if asynchronous:
+            kwargs["json"] = dict(kwargs.get("json") or {}, Asynchronous=True)
+            job = self.server.tools_create_archive_job(**kwargs)
+            return self._job_output(job, progress)
         return self.server.tools_create_archive(**kwargs)
 
     def create_dicom(self, **kwargs):
         return self.server.tools_create_dicom(**kwargs)
 
-    def create_media(self, **kwargs):
+    def create_media(self, transcode=None, **kwargs):
+        """Create a ZIP archive for media storage with DICOMDIR of several resources
+
+        The request body (e.g. ``json={"Resources": [...]}``) is passed as is.
+
+        :param str transcode:
+            Transfer syntax UID or short name (see :data:`beren.TRANSFER_SYNTAXES`),
+            e.g. "jpeg2000-lossless", to compress the files on the server
+            before they are sent (optional)
+        :return:
+            Returns zip archive as a generator
+        :rtype:
+            generator
+        """
+        self._transcode(kwargs, transcode, body=True)
         return self.server.tools_create_media(**kwargs)
 
-    def create_media_extended(self, **kwargs):
+    def create_media_extended(self, transcode=None, **kwargs):
+        """Like ``create_media``, with the Type 3 tags in DICOMDIR
+
+        :param str transcode:
+            Transfer syntax UID or short name (see :data:`beren.TRANSFER_SYNTAXES`),
+            e.g. "jpeg2000-lossless", to compress the files on the server
+            before they are sent (optional)
+        :return:
+            Returns zip archive as a generator
+        :rtype:
+            generator
+        """
+        self._transcode(kwargs, transcode, body=True)
         return self.server.tools_create_media_extended(**kwargs)
 
     def get_default_encoding(self, **kwargs):
@@ -1020,7 +1897,7 @@ class Orthanc:
     def execute_script(self, script, **kwargs):
         return self.server.tools_execute_script(json=data, **kwargs)
 
-    def find(self, query, level, expand=False, limit=None, **kwargs):
+    def find(self, query, level, expand=False, limit=None, records=False, **kwargs):
         """Search for matching items
 
         Example:
@@ -1037,13 +1914,44 @@ class Orthanc:
             Return resources not just UUIDs (default: False)
         :param int limit:
             Limit number of records returned
+        :param bool records:
+            Return compact records (see :mod:`beren.records`) instead of dicts. Default ``False``.
         :return:
             Matching records
         :rtype:
             list
         """
         body = {"Query": query, "Level": level, "Expand": expand, "Limit": limit}
-        return self.server.tools_find(json=body, **kwargs)
+        fetch = partial(self.server.tools_find, json=body, **kwargs)
+        key = normalize_find(query, level, expand, limit)
+        if set(kwargs) - CACHEABLE_FIND_ARGUMENTS:
+            result = fetch()
+        elif self._find_cache is not None:
+            result = self._find_cache.get_json(
+                self._target,
+                key,
+                fetch,
+                lambda: self.get_changes(last=True)["Last"],
+            )
+        else:
+            result = self._cached_metadata(("find", key), fetch)
+        return to_records(result) if records else result
+
+    def stream_find(
+        self, query, level, expand=False, limit=None, records=False, **kwargs
+    ):
+        """Like ``find``, but parse the response incrementally.
+
+        :param bool records:
+            Return compact records (see :mod:`beren.records`) instead of dicts. Default ``False``.
+        :return:
+            Yields matching records
+        :rtype:
+            generator
+        """
+        body = {"Query": query, "Level": level, "Expand": expand, "Limit": limit}
+        result = iter_json(self.server.tools_find_stream(json=body, **kwargs))
+        return to_records(result) if records else result
 
     def generate_uid(self, level, **kwargs):
         """Generate DICOM UID
@@ -1075,6 +1983,47 @@ class Orthanc:
         """
         return self.server.tools_lookup(json=lookup, **kwargs)
 
+    def get_resource_ids(
+        self,
+        level,
+        uids,
+        patient_ids=None,
+        study_uids=None,
+        series_uids=None,
+        workers=8,
+    ):
+        """Map many DICOM UIDs to Orthanc identifiers, without a request per UID
+
+        Orthanc identifiers are hashes of the DICOM identifiers, so they are
+        computed locally when the parent identifiers are given (see
+        :func:`beren.orthanc_ids`). Only the others are looked up.
+
+        Example:
+
+            >>> orthanc.get_resource_ids('Instance', df['SOPInstanceUID'],
+            ...     df['PatientID'], df['StudyInstanceUID'], df['SeriesInstanceUID'])
+
+        :param str level:
+            "Patient", "Study", "Series", or "Instance"
+        :param uids:
+            Identifier of each resource at its level (PatientID for patients)
+        :param patient_ids:
+            PatientID of each resource (optional)
+        :param study_uids:
+            StudyInstanceUID of each resource, for series and instances (optional)
+        :param series_uids:
+            SeriesInstanceUID of each resource, for instances (optional)
+        :param int workers:
+            Concurrent lookups (default: 8)
+        :return:
+            Orthanc identifiers, None for resources not found by lookup
+        :rtype:
+            list
+        """
+        return resolve_ids(
+            self, level, uids, patient_ids, study_uids, series_uids, workers
+        )
+
     def get_now(self, **kwargs):
         """Get the current universal datetime (UTC) in the ISO 8601 format
 
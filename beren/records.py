@@ -0,0 +1,296 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from sys import intern
+
+__all__ = ["Patient", "Study", "Series", "Instance", "to_record", "to_records"]
+
+
+class TagShape:
+    """Interned tag names shared by every record with the same set of tags"""
+
+    __slots__ = ("keys", "index")
+
+    def __init__(self, keys):
+        self.keys = tuple(intern(k) for k in keys)
+        self.index = {k: i for i, k in enumerate(self.keys)}
+
+
+_SHAPES = {}
+
+
+def _intern(id_):
+    """Intern parent UUIDs, which are repeated by every sibling record"""
+    return intern(id_) if id_ is not None else None
+
+
+def pack_tags(tags):
+    """Split a tag dictionary into a shared :class:`TagShape` and a tuple of values"""
+    keys = tuple(tags or ())
+    shape = _SHAPES.get(keys)
+    if shape is None:
+        shape = _SHAPES.setdefault(keys, TagShape(keys))
+    return shape, tuple(tags.values()) if tags else ()
+
+
+class Resource:
+    """
+    Base class for compact records of expanded Orthanc resources.
+
+    Records are slotted, keep their children as tuples of UUIDs, and share
+    interned tag names between records. ``MainDicomTags`` are stored as a tuple
+    of values and only turned into a dictionary when asked for; use
+    :meth:`tag` to read a single value without building it.
+    """
+
+    __slots__ = ("id", "is_stable", "last_update", "labels", "_shape", "_values")
+    level = None
+
+    def __init__(
+        self, id_, main_dicom_tags=None, is_stable=None, last_update=None, labels=None
+    ):
+        self.id = id_
+        self._shape, self._values = pack_tags(main_dicom_tags)
+        self.is_stable = is_stable
+        self.last_update = last_update
+        self.labels = tuple(labels) if labels is not None else None
+
+    def __repr__(self):
+        return "<{}({})>".format(type(self).__name__, self.id)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    @property
+    def main_dicom_tags(self):
+        """The main DICOM tags, decoded into a new dictionary"""
+        return dict(zip(self._shape.keys, self._values))
+
+    def tag(self, name, default=None):
+        """Value of a single main DICOM tag
+
+        :param str name:
+            Tag name, e.g. "StudyInstanceUID"
+        :param default:
+            Returned when the tag is missing (default: None)
+        """
+        i = self._shape.index.get(name)
+        return default if i is None else self._values[i]
+
+    @classmethod
+    def _common(cls, data):
+        return {
+            "id_": data["ID"],
+            "main_dicom_tags": data.get("MainDicomTags"),
+            "is_stable": data.get("IsStable"),
+            "last_update": data.get("LastUpdate"),
+            "labels": data.get("Labels"),
+        }
+
+    def to_json(self):
+        """Rebuild the expanded record as returned by Orthanc"""
+        data = {
+            "ID": self.id,
+            "Type": self.level,
+            "MainDicomTags": self.main_dicom_tags,
+        }
+        if self.is_stable is not None:
+            data["IsStable"] = self.is_stable
+        if self.last_update is not None:
+            data["LastUpdate"] = self.last_update
+        if self.labels is not None:
+            data["Labels"] = list(self.labels)
+        return data
+
+
+class Patient(Resource):
+    """Expanded patient record"""
+
+    __slots__ = ("studies",)
+    level = "Patient"
+
+    def __init__(self, id_, studies=(), **kwargs):
+        super().__init__(id_, **kwargs)
+        self.studies = tuple(studies)
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(studies=data.get("Studies", ()), **cls._common(data))
+
+    def to_json(self):
+        data = super().to_json()
+        data["Studies"] = list(self.studies)
+        return data
+
+
+class Study(Resource):
+    """Expanded study record"""
+
+    __slots__ = ("parent_patient", "series", "_patient_shape", "_patient_values")
+    level = "Study"
+
+    def __init__(
+        self,
+        id_,
+        parent_patient=None,
+        patient_main_dicom_tags=None,
+        series=(),
+        **kwargs
+    ):
+        super().__init__(id_, **kwargs)
+        self.parent_patient = _intern(parent_patient)
+        self._patient_shape, self._patient_values = pack_tags(patient_main_dicom_tags)
+        self.series = tuple(series)
+
+    @property
+    def patient_main_dicom_tags(self):
+        """The main DICOM tags of the parent patient, decoded into a new dictionary"""
+        return dict(zip(self._patient_shape.keys, self._patient_values))
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            parent_patient=data.get("ParentPatient"),
+            patient_main_dicom_tags=data.get("PatientMainDicomTags"),
+            series=data.get("Series", ()),
+            **cls._common(data)
+        )
+
+    def to_json(self):
+        data = super().to_json()
+        data["ParentPatient"] = self.parent_patient
+        data["PatientMainDicomTags"] = self.patient_main_dicom_tags
+        data["Series"] = list(self.series)
+        return data
+
+
+class Series(Resource):
+    """Expanded series record"""
+
+    __slots__ = ("parent_study", "instances", "status", "expected_number_of_instances")
+    level = "Series"
+
+    def __init__(
+        self,
+        id_,
+        parent_study=None,
+        instances=(),
+        status=None,
+        expected_number_of_instances=None,
+        **kwargs
+    ):
+        super().__init__(id_, **kwargs)
+        self.parent_study = _intern(parent_study)
+        self.instances = tuple(instances)
+        self.status = status
+        self.expected_number_of_instances = expected_number_of_instances
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            parent_study=data.get("ParentStudy"),
+            instances=data.get("Instances", ()),
+            status=data.get("Status"),
+            expected_number_of_instances=data.get("ExpectedNumberOfInstances"),
+            **cls._common(data)
+        )
+
+    def to_json(self):
+        data = super().to_json()
+        data["ParentStudy"] = self.parent_study
+        data["Instances"] = list(self.instances)
+        data["Status"] = self.status
+        data["ExpectedNumberOfInstances"] = self.expected_number_of_instances
+        return data
+
+
+class Instance(Resource):
+    """Expanded instance record"""
+
+    __slots__ = ("parent_series", "file_size", "file_uuid", "index_in_series")
+    level = "Instance"
+
+    def __init__(
+        self,
+        id_,
+        parent_series=None,
+        file_size=None,
+        file_uuid=None,
+        index_in_series=None,
+        **kwargs
+    ):
+        super().__init__(id_, **kwargs)
+        self.parent_series = _intern(parent_series)
+        self.file_size = file_size
+        self.file_uuid = file_uuid
+        self.index_in_series = index_in_series
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            parent_series=data.get("ParentSeries"),
+            file_size=data.get("FileSize"),
+            file_uuid=data.get("FileUuid"),
+            index_in_series=data.get("IndexInSeries"),
+            **cls._common(data)
+        )
+
+    def to_json(self):
+        data = super().to_json()
+        data["ParentSeries"] = self.parent_series
+        data["FileSize"] = self.file_size
+        data["FileUuid"] = self.file_uuid
+        data["IndexInSeries"] = self.index_in_series
+        return data
+
+
+LEVELS = {cls.level: cls for cls in (Patient, Study, Series, Instance)}
+
+
+def to_record(data):
+    """Convert an expanded resource dictionary into its compact record
+
+    UUID strings (non-expanded listings) are returned unchanged.
+
+    :param dict data:
+        Expanded resource as returned by Orthanc
+    :return:
+        The matching :class:`Patient`, :class:`Study`, :class:`Series`, or :class:`Instance`
+    :raises ValueError:
+        Unknown resource type
+    """
+    if isinstance(data, str):
+        return data
+    try:
+        cls = LEVELS[data["Type"]]
+    except KeyError:
+        raise ValueError("Not an expanded resource: {!r}".format(data.get("Type")))
+    return cls.from_json(data)
+
+
+def to_records(data):
+    """Convert an endpoint result into compact records
+
+    :param data:
+        A single expanded resource, a list of them, or an iterator of them
+    :return:
+        A record, a list of records, or a generator of records, respectively
+    """
+    if isinstance(data, dict):
+        return to_record(data)
+    if isinstance(data, list):
+        return [to_record(d) for d in data]
+    return (to_record(d) for d in data)
@@ -0,0 +1,389 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from beren.jobs import JobFailed
+from collections import OrderedDict, defaultdict, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from json import dumps
+from requests.exceptions import RequestException
+from threading import BoundedSemaphore, Lock
+from time import monotonic, sleep
+
+__all__ = [
+    "RemoteAnswer",
+    "RemoteQueries",
+    "RetrieveResult",
+    "answer_contents",
+    "query_hierarchy",
+]
+
+# Tags identifying a remote resource of each level, sent with C-MOVE requests
+IDENTIFIERS = {
+    "Patient": ["PatientID"],
+    "Study": ["PatientID", "StudyInstanceUID"],
+    "Series": ["PatientID", "StudyInstanceUID", "SeriesInstanceUID"],
+    "Instance": [
+        "PatientID",
+        "StudyInstanceUID",
+        "SeriesInstanceUID",
+        "SOPInstanceUID",
+    ],
+}
+
+# Level below each level, and the client method querying it under an answer
+CHILD_QUERIES = {
+    "Patient": ("Study", "post_query_answers_studies"),
+    "Study": ("Series", "post_query_answers_series"),
+    "Series": ("Instance", "post_query_answers_instances"),
+}
+
+LEVELS = ["Patient", "Study", "Series", "Instance"]
+
+# QueryRetrieveLevel of answers
+QUERY_LEVELS = {
+    "PATIENT": "Patient",
+    "STUDY": "Study",
+    "SERIES": "Series",
+    "IMAGE": "Instance",
+}
+
+RemoteAnswer = namedtuple(
+    "RemoteAnswer", ["modality", "level", "query_id", "index", "tags"]
+)
+RemoteAnswer.__doc__ = """An answer of a C-FIND on a remote modality
+
+``query_id`` and ``index`` locate it under ``/queries`` (as long as Orthanc
+keeps the query), ``tags`` is its simplified content.
+"""
+
+RetrieveResult = namedtuple("RetrieveResult", ["answers", "job_id", "error"])
+RetrieveResult.__doc__ = """Outcome of a C-MOVE of a batch of answers
+
+``error`` describes the failure, or is None when the job succeeded.
+"""
+
+
+def answer_contents(
+    orthanc, id_, indexes=None, executor=None, workers=8, simplify=True
+):
+    """Contents of the answers of a query, fetched concurrently
+
+    :param beren.Orthanc orthanc:
+        The client
+    :param str id_:
+        Query ID
+    :param list indexes:
+        Answer indexes (default: every answer of the query)
+    :param concurrent.futures.Executor executor:
+        Pool to fetch with (default: a new pool of ``workers`` threads)
+    :param int workers:
+        Concurrent requests without ``executor`` (default: 8)
+    :param bool simplify:
+        Tags by name, with plain values (default: True)
+    :return:
+        Contents, in answer order
+    :rtype:
+        list (dict)
+    """
+    if indexes is None:
+        indexes = orthanc.get_query_answers(id_)
+    params = {"simplify": 1} if simplify else {}
+    fetch = lambda index: orthanc.get_query_answers_content(id_, index, params=params)
+    if executor is not None:
+        return [f.result() for f in [executor.submit(fetch, i) for i in indexes]]
+    if not indexes:
+        return []
+    with ThreadPoolExecutor(max_workers=min(workers, len(indexes))) as pool:
+        return list(pool.map(fetch, indexes))
+
+
+def _nodes(level, id_, indexes, tags):
+    return [
+        {
+            "Level": level,
+            "QueryID": id_,
+            "Index": int(index),
+            "Tags": content,
+            "Children": [],
+        }
+        for index, content in zip(indexes, tags)
+    ]
+
+
+def _children(orthanc, node, contents):
+    """Query the level below an answer, fill its children"""
+    level, method = CHILD_QUERIES[node["Level"]]
+    id_ = getattr(orthanc, method)(node["QueryID"], node["Index"])["ID"]
+    indexes = orthanc.get_query_answers(id_)
+    tags = answer_contents(orthanc, id_, indexes, executor=contents)
+    node["Children"] = _nodes(level, id_, indexes, tags)
+    return node["Children"]
+
+
+def query_hierarchy(orthanc, id_, depth="Series", workers=8, level=None):
+    """Remote resources below the answers of a query, queried concurrently
+
+    Each answer is drilled down one level at a time (query-studies,
+    query-series, query-instances), every answer of a level at once.
+
+    Example:
+
+        >>> query = orthanc.query_modality('PACS', {'Level': 'Study', 'Query': {'PatientID': '123'}})
+        >>> for study in query_hierarchy(orthanc, query['ID']):
+        ...     print(study['Tags']['StudyDescription'], len(study['Children']))
+
+    :param beren.Orthanc orthanc:
+        The client
+    :param str id_:
+        Query ID
+    :param str depth:
+        Deepest level to query (default: "Series")
+    :param int workers:
+        Concurrent requests (default: 8)
+    :param str level:
+        Level of the query (default: read from its answers)
+    :return:
+        Answers as ``{"Level", "QueryID", "Index", "Tags", "Children"}``
+        nodes, ``Children`` holding the answers of the level below
+    :rtype:
+        list (dict)
+    """
+    if depth not in LEVELS:
+        raise ValueError("Unknown level {!r}".format(depth))
+    with ThreadPoolExecutor(max_workers=workers) as contents:
+        indexes = orthanc.get_query_answers(id_)
+        tags = answer_contents(orthanc, id_, indexes, executor=contents)
+        if level is None and tags:
+            level = QUERY_LEVELS[tags[0]["QueryRetrieveLevel"].upper()]
+        roots = _nodes(level, id_, indexes, tags)
+        nodes = roots
+        with ThreadPoolExecutor(max_workers=workers) as drill:
+            while nodes and LEVELS.index(level) < LEVELS.index(depth):
+                futures = [drill.submit(_children, orthanc, n, contents) for n in nodes]
+                nodes = [child for f in futures for child in f.result()]
+                level = CHILD_QUERIES[level][0]
+    return roots
+
+
+class RemoteQueries:
+    """
+    Run many C-FIND and C-MOVE requests against remote modalities.
+
+    C-FINDs run concurrently on ``workers`` threads, with at most
+    ``associations`` at once per modality, and the contents of their answers
+    are fetched concurrently. Answers are cached for ``ttl`` seconds.
+    Retrieves are sent as asynchronous C-MOVE jobs of ``batch_size``
+    resources, at most ``associations`` in flight per modality and one
+    submitted every ``interval`` seconds, so the remote PACS is not flooded.
+
+    Example:
+
+        >>> remote = RemoteQueries(orthanc, associations=2)
+        >>> answers = remote.find_values('PACS', 'AccessionNumber', accession_numbers)
+        >>> for result in remote.retrieve('PACS', [a for found in answers for a in found]):
+        ...     print(len(result.answers), result.error)
+
+    :param beren.Orthanc orthanc:
+        The client
+    :param int associations:
+        Concurrent requests per modality (default: 2)
+    :param int workers:
+        Concurrent C-FINDs across modalities, and concurrent answer fetches (default: 8)
+    :param float ttl:
+        Seconds answers are reused for (default: 300, 0 disables the cache)
+    :param int max_entries:
+        Cached queries (default: 1024)
+    """
+
+    def __init__(self, orthanc, associations=2, workers=8, ttl=300, max_entries=1024):
+        self.orthanc = orthanc
+        self.associations = associations
+        self.workers = workers
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = Lock()
+        self._slots = defaultdict(lambda: BoundedSemaphore(associations))
+
+    def __repr__(self):
+        return "<RemoteQueries(hits={}, misses={})>".format(self.hits, self.misses)
+
+    def _slot(self, modality):
+        with self._lock:
+            return self._slots[modality]
+
+    def _cached(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] > monotonic():
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def _store(self, key, answers):
+        if not self.ttl:
+            return
+        with self._lock:
+            self._cache[key] = (monotonic() + self.ttl, answers)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def clear(self):
+        """Forget the cached answers"""
+        with self._lock:
+            self._cache.clear()
+
+    def _find(self, modality, query, level, contents):
+        # Unlike tools/find, "*" and absent keys differ: "*" asks for the tag
+        key = (modality, level, dumps(query, sort_keys=True))
+        answers = self._cached(key)
+        if answers is not None:
+            return answers
+        with self._slot(modality):
+            response = self.orthanc.query_modality(
+                modality, {"Level": level, "Query": query}
+            )
+        id_ = response["ID"]
+        indexes = self.orthanc.get_query_answers(id_)
+        tags = answer_contents(self.orthanc, id_, indexes, executor=contents)
+        answers = [
+            RemoteAnswer(modality, level, id_, int(index), content)
+            for index, content in zip(indexes, tags)
+        ]
+        self._store(key, answers)
+        return answers
+
+    def find(self, modality, queries, level="Study"):
+        """Run C-FINDs concurrently
+
+        :param str modality:
+            Modality name, as configured in Orthanc
+        :param list queries:
+            Queries, e.g. ``[{"AccessionNumber": "A1", "StudyDate": ""}, ...]``
+            (empty values ask for the tag in the answers)
+        :param str level:
+            "Patient", "Study", "Series", or "Instance" (default: "Study")
+        :return:
+            The answers of each query, in query order
+        :rtype:
+            list (list of RemoteAnswer)
+        """
+        if level not in IDENTIFIERS:
+            raise ValueError("Unknown level {!r}".format(level))
+        queries = list(queries)
+        if not queries:
+            return []
+        with ThreadPoolExecutor(max_workers=self.workers) as contents:
+            with ThreadPoolExecutor(
+                max_workers=min(self.workers, len(queries))
+            ) as finds:
+                futures = [
+                    finds.submit(self._find, modality, query, level, contents)
+                    for query in queries
+                ]
+                return [future.result() for future in futures]
+
+    def find_values(self, modality, key, values, level="Study", query=None):
+        """Run a C-FIND for each value of a key, e.g. accession numbers
+
+        :param str modality:
+            Modality name
+        :param str key:
+            Tag name, e.g. "AccessionNumber"
+        :param list values:
+            Values to query
+        :param str level:
+            Query level (default: "Study")
+        :param dict query:
+            Other constraints and requested tags, shared by every query (optional)
+        :return:
+            The answers of each value, in value order
+        :rtype:
+            list (list of RemoteAnswer)
+        """
+        base = dict(query or {})
+        return self.find(
+            modality, [dict(base, **{key: value}) for value in values], level
+        )
+
+    def retrieve(self, modality, answers, target=None, batch_size=10, interval=0.0):
+        """Retrieve answers with throttled, batched asynchronous C-MOVEs
+
+        :param str modality:
+            Modality to retrieve from
+        :param list answers:
+            :class:`RemoteAnswer` to retrieve (all of the same level)
+        :param str target:
+            AET receiving the instances (default: this Orthanc)
+        :param int batch_size:
+            Resources per C-MOVE (default: 10)
+        :param float interval:
+            Minimum seconds between two C-MOVE submissions (default: 0)
+        :return:
+            Yields a :class:`RetrieveResult` per batch, as the jobs end
+        :rtype:
+            generator
+        """
+        answers = list(answers)
+        batches = iter(
+            [answers[i : i + batch_size] for i in range(0, len(answers), batch_size)]
+        )
+        jobs = {}  # handle -> batch
+        submitted = None
+        while True:
+            for batch in batches:
+                if submitted is not None and interval:
+                    sleep(max(0.0, submitted + interval - monotonic()))
+                submitted = monotonic()
+                try:
+                    job = self.orthanc.track_job(
+                        self.orthanc.move_modality(modality, self._move(batch, target))
+                    )
+                except RequestException as e:
+                    yield RetrieveResult(batch, None, str(e))
+                    continue
+                jobs[job] = batch
+                if len(jobs) >= self.associations:
+                    break
+            if not jobs:
+                return
+            done, _ = wait(jobs, return_when=FIRST_COMPLETED)
+            for job in done:
+                batch = jobs.pop(job)
+                try:
+                    job.result()
+                except JobFailed as e:
+                    error = e.info.get("ErrorDescription") or "Job failed"
+                    yield RetrieveResult(batch, job.id, error)
+                else:
+                    yield RetrieveResult(batch, job.id, None)
+
+    @staticmethod
+    def _move(batch, target):
+        level = batch[0].level
+        body = {
+            "Level": level,
+            "Resources": [
+                {k: a.tags[k] for k in IDENTIFIERS[level] if a.tags.get(k)}
+                for a in batch
+            ],
+            "Asynchronous": True,
+        }
+        if target is not None:
+            body["TargetAet"] = target
+        return body
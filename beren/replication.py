@@ -0,0 +1,349 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from beren.archive import write_file
+from beren.jobs import JobFailed
+from beren.transport import is_not_found
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from json import dumps, load
+from requests.exceptions import RequestException
+from threading import Event, Lock
+from time import monotonic, sleep
+from warnings import warn
+import os
+
+__all__ = ["BandwidthLimit", "Replicator"]
+
+
+class BandwidthLimit:
+    """
+    Limit the throughput of several threads to ``rate`` bytes per second.
+
+    A token bucket holding at most ``burst`` bytes: each chunk takes its size
+    in tokens, and waits when the bucket runs dry.
+
+    :param float rate:
+        Bytes per second
+    :param float burst:
+        Bytes that may be sent at once after an idle period (default: ``rate``)
+    """
+
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self._tokens = self.burst
+        self._stamp = monotonic()
+        self._lock = Lock()
+
+    def __repr__(self):
+        return "<BandwidthLimit({:.0f} B/s)>".format(self.rate)
+
+    def consume(self, size):
+        """Take ``size`` bytes, sleeping until the rate allows them"""
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._stamp) * self.rate
+            )
+            self._stamp = now
+            self._tokens -= size
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0
+        if delay:
+            sleep(delay)
+
+    def throttle(self, chunks):
+        """Yield ``chunks`` no faster than the rate"""
+        for chunk in chunks:
+            self.consume(len(chunk))
+            yield chunk
+
+
+class Replicator:
+    """
+    Copy the instances missing from a target server, incrementally.
+
+    The first :meth:`sync` compares both servers with paged instance listings
+    (Orthanc IDs derive from the DICOM UIDs, so equal IDs mean equal UIDs) and
+    records the source's last change. Later syncs only read the source's
+    ``/changes`` since that checkpoint. The checkpoint, and the instances that
+    failed to copy (retried on the next sync), are saved to the ``checkpoint``
+    file, so a sync interrupted at any point resumes where it stopped.
+
+    Instances are copied either by the source itself, with ``store_peer`` jobs
+    of ``batch_size`` instances, or through this client, streaming
+    ``get_instance_file`` into ``add_instance`` on ``workers`` threads (as a
+    chunked request body, files are never held in memory). Instances deleted
+    from the source since they were listed are skipped, not retried, and
+    ``store_peer`` batches leave out the instances already on the target.
+
+    Example:
+
+        >>> replicator = Replicator(primary, backup, checkpoint='/var/lib/dr-sync.json',
+        ...                         bandwidth=50 * 1024**2)
+        >>> replicator.sync()   # first run: full comparison, then only the delta
+        {'copied': 1234, 'existing': 0, 'failed': 0, 'bytes': 987654321}
+        >>> replicator.run(interval=30)   # continuous mode
+
+    :param beren.Orthanc source:
+        Client of the server to copy from
+    :param beren.Orthanc target:
+        Client of the server to copy to
+    :param str peer:
+        Name of the target among the source's peers: copy with ``store_peer``
+        instead of through this client (optional)
+    :param int workers:
+        Concurrent copies, or ``store_peer`` jobs in flight (default: 4)
+    :param int batch_size:
+        Instances per ``store_peer`` job (default: 100)
+    :param float bandwidth:
+        Maximum bytes per second copied through this client (optional)
+    :param str checkpoint:
+        File holding the replication state (optional, kept in memory otherwise)
+    :param int page_size:
+        Instances or changes per listing request (default: 1000)
+    """
+
+    def __init__(
+        self,
+        source,
+        target,
+        peer=None,
+        workers=4,
+        batch_size=100,
+        bandwidth=None,
+        checkpoint=None,
+        page_size=1000,
+    ):
+        if peer is not None and bandwidth is not None:
+            raise ValueError("Peers transfer on their own, bandwidth cannot be limited")
+        self.source = source
+        self.target = target
+        self.peer = peer
+        self.workers = workers
+        self.batch_size = batch_size
+        self.limit = BandwidthLimit(bandwidth) if bandwidth else None
+        self.checkpoint = checkpoint
+        self.page_size = page_size
+        self.stats = {"copied": 0, "existing": 0, "failed": 0, "bytes": 0}
+        self._lock = Lock()
+        self.state = self._load()
+
+    def __repr__(self):
+        return "<Replicator({} -> {})>".format(
+            getattr(self.source, "_target", self.source),
+            self.peer or getattr(self.target, "_target", self.target),
+        )
+
+    def _load(self):
+        if self.checkpoint is None or not os.path.exists(self.checkpoint):
+            return {"Last": None, "Failed": []}
+        with open(self.checkpoint) as f:
+            return load(f)
+
+    def _save(self, last, failed):
+        self.state = {"Last": last, "Failed": sorted(failed)}
+        if self.checkpoint is not None:
+            path = os.path.abspath(self.checkpoint)
+            write_file(path, [dumps(self.state).encode()])
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def _listing(self, client):
+        since = 0
+        while True:
+            page = client.get_instances(since=since, limit=self.page_size)
+            yield from page
+            if len(page) < self.page_size:
+                return
+            since += len(page)
+
+    def compare(self):
+        """Instances of the source missing from the target
+
+        :return:
+            Instance UUIDs, in the source's order
+        :rtype:
+            list
+        """
+        present = set(self._listing(self.target))
+        return [id_ for id_ in self._listing(self.source) if id_ not in present]
+
+    def changes(self, since):
+        """Instances added to the source after change ``since``, page by page
+
+        :param int since:
+            Change sequence number to start after
+        :return:
+            Yields ``(instance UUIDs, last change sequence number)`` pairs
+        :rtype:
+            generator
+        """
+        while True:
+            page = self.source.get_changes(since=since, limit=self.page_size)
+            ids = [
+                change["ID"]
+                for change in page["Changes"]
+                if change.get("ChangeType") == "NewInstance"
+            ]
+            since = max(since, page.get("Last", since))
+            yield ids, since
+            if page.get("Done", True):
+                return
+
+    def _copy_instance(self, id_):
+        size = [0]
+
+        def counted(chunks):
+            for chunk in chunks:
+                size[0] += len(chunk)
+                yield chunk
+
+        chunks = self.source.get_instance_file(id_)
+        if self.limit is not None:
+            chunks = self.limit.throttle(chunks)
+        status = self.target.add_instance(counted(chunks)).get("Status")
+        self._count("existing" if status == "AlreadyStored" else "copied")
+        self._count("bytes", size[0])
+
+    def _copy_files(self, ids):
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self._copy_instance, id_): id_ for id_ in ids}
+            for future, id_ in futures.items():
+                try:
+                    future.result()
+                except RequestException as e:
+                    if not is_not_found(e):  # else deleted from the source since
+                        failed.append(id_)
+        return failed
+
+    def _stored(self, client, ids):
+        """Whether each instance is on ``client``: True, False, or None if unknown"""
+
+        def stored(id_):
+            try:
+                client.get_instance(id_)
+            except RequestException as e:
+                return False if is_not_found(e) else None
+            return True
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return dict(zip(ids, executor.map(stored, ids)))
+
+    def _existing(self, ids):
+        """Instances of a failed batch still on the source"""
+        stored = self._stored(self.source, ids)
+        return [id_ for id_ in ids if stored[id_] is not False]
+
+    def _missing(self, ids):
+        """Instances of a batch to send, those not known to be on the target"""
+        stored = self._stored(self.target, ids)
+        missing = [id_ for id_ in ids if not stored[id_]]
+        self._count("existing", len(ids) - len(missing))
+        return missing
+
+    def _copy_peer(self, ids):
+        batches = iter(
+            [ids[i : i + self.batch_size] for i in range(0, len(ids), self.batch_size)]
+        )
+        failed = []
+        jobs = {}  # handle -> batch
+        while True:
+            for batch in batches:
+                batch = self._missing(batch)
+                if not batch:
+                    continue
+                body = {"Resources": batch, "Asynchronous": True}
+                try:
+                    job = self.source.track_job(
+                        self.source.store_peer(self.peer, json=body)
+                    )
+                except RequestException:
+                    failed.extend(batch)
+                    continue
+                jobs[job] = batch
+                if len(jobs) >= self.workers:
+                    break
+            if not jobs:
+                return failed
+            done, _ = wait(jobs, return_when=FIRST_COMPLETED)
+            for job in done:
+                batch = jobs.pop(job)
+                try:
+                    job.result()
+                    self._count("copied", len(batch))
+                except JobFailed:
+                    failed.extend(self._existing(batch))
+
+    def copy(self, ids):
+        """Copy instances to the target
+
+        :param list ids:
+            Instance UUIDs on the source
+        :return:
+            Instances that could not be copied
+        :rtype:
+            list
+        """
+        ids = list(ids)
+        if not ids:
+            return []
+        failed = self._copy_peer(ids) if self.peer else self._copy_files(ids)
+        self._count("failed", len(failed))
+        return failed
+
+    def sync(self):
+        """Copy what the target misses since the last sync (everything the first time)
+
+        :return:
+            Cumulated counts of copied, already present, and failed instances,
+            and of bytes copied through this client
+        :rtype:
+            dict
+        """
+        retry = self.state["Failed"]
+        last = self.state["Last"]
+        if last is None:
+            # Changes recorded from now on are replayed by the next sync
+            last = self.source.get_changes(last=True).get("Last", 0)
+            pages = [(self.compare(), last)]
+        else:
+            pages = self.changes(last)
+        for ids, last in pages:
+            known = set(retry)
+            ids = retry + [id_ for id_ in ids if id_ not in known]
+            retry = self.copy(ids)
+            self._save(last, retry)
+        return dict(self.stats)
+
+    def run(self, interval=10.0, stop=None):
+        """Sync continuously, following the source's changes
+
+        A sync failing on a server error is retried after ``interval``.
+
+        :param float interval:
+            Seconds between two syncs (default: 10)
+        :param threading.Event stop:
+            Stops the loop once set (default: run forever)
+        """
+        stop = stop or Event()
+        while not stop.is_set():
+            try:
+                self.sync()
+            except RequestException as e:
+                warn("Replication failed, retrying: {}".format(e), RuntimeWarning)
+            stop.wait(interval)
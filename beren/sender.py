@@ -0,0 +1,247 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from beren.jobs import JobFailed
+from collections import Counter, namedtuple
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    CancelledError,
+    ThreadPoolExecutor,
+    wait,
+)
+from requests.exceptions import RequestException
+from time import monotonic, sleep
+
+__all__ = ["SendResult", "Sender"]
+
+SendResult = namedtuple(
+    "SendResult", ["destination", "resources", "job_id", "attempts", "error"]
+)
+SendResult.__doc__ = """Outcome of sending resources to a destination
+
+``destination`` is ``("modality", name)`` or ``("peer", name)``. ``error``
+describes the last failure, or is None when every resource was sent. Batches
+whose C-STORE sub-operations partly failed are split until they hold a single
+resource, so such a failed result names the very resource that could not be
+sent. A batch failing as a whole (destination down, job failure) is reported
+whole.
+"""
+
+_Batch = namedtuple(
+    "_Batch", ["ready", "destination", "resources", "attempts", "retried"]
+)
+
+
+class Sender:
+    """
+    Send many resources to modalities (C-STORE) and peers with asynchronous jobs.
+
+    Resources are grouped into store jobs of ``batch_size``, and each
+    destination runs up to ``concurrency`` jobs at once, all destinations in
+    parallel. Jobs are tracked by the client's shared poller (see
+    :meth:`beren.Orthanc.track_job`). A batch whose C-STORE sub-operations
+    partly fail is split in halves after ``retry_delay`` seconds, until the
+    failing resources end up isolated (at most log2(``batch_size``) splits).
+    A batch failing as a whole (connection error, failed or cancelled job),
+    or a single failing resource, is retried as is ``retries`` times,
+    ``retry_delay`` doubling on every retry, so that an unreachable
+    destination costs a few requests, not one per resource.
+
+    Example:
+
+        >>> sender = Sender(orthanc, batch_size=20)
+        >>> for result in sender.send(study_ids, modalities=['READING1', 'READING2']):
+        ...     if result.error:
+        ...         print('failed', result.destination, result.resources, result.error)
+        >>> future = sender.submit(study_ids, peers=['backup'])   # in the background
+
+    :param beren.Orthanc orthanc:
+        The client
+    :param int batch_size:
+        Resources per store job (default: 50)
+    :param int concurrency:
+        Store jobs in flight per destination (default: 2)
+    :param int retries:
+        Times a failing batch is retried as is (default: 2)
+    :param float retry_delay:
+        Seconds before the first retry (default: 5)
+    """
+
+    def __init__(
+        self, orthanc, batch_size=50, concurrency=2, retries=2, retry_delay=5.0
+    ):
+        self.orthanc = orthanc
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._executor = None
+
+    def __repr__(self):
+        return "<Sender(batch_size={}, concurrency={})>".format(
+            self.batch_size, self.concurrency
+        )
+
+    def _store(self, destination, resources):
+        kind, name = destination
+        body = {"Resources": resources, "Asynchronous": True}
+        if kind == "modality":
+            # Keep going after a failed sub-operation, failures are counted
+            body["Permissive"] = True
+            return self.orthanc.store_modality(name, body)
+        return self.orthanc.store_peer(name, json=body)
+
+    def _failed(self, batch, partial):
+        """Batches retrying a failed one, or None when out of retries
+
+        Only a partial failure tells some resources apart from the others,
+        and is worth splitting the batch.
+        """
+        attempts = batch.attempts + 1
+        if partial and len(batch.resources) > 1:
+            ready = monotonic() + self.retry_delay
+            half = (len(batch.resources) + 1) // 2
+            parts = [batch.resources[:half], batch.resources[half:]]
+            return [
+                _Batch(ready, batch.destination, part, attempts, 0) for part in parts
+            ]
+        if batch.retried >= self.retries:
+            return None
+        ready = monotonic() + self.retry_delay * 2**batch.retried
+        return [
+            _Batch(
+                ready, batch.destination, batch.resources, attempts, batch.retried + 1
+            )
+        ]
+
+    def send(self, ids, modalities=(), peers=()):
+        """Send resources to every destination
+
+        :param list ids:
+            Resource UUIDs (patients, studies, series, or instances)
+        :param list modalities:
+            Modality names, as configured in Orthanc
+        :param list peers:
+            Peer names
+        :return:
+            Yields a :class:`SendResult` per batch, as its jobs end
+        :rtype:
+            generator
+        """
+        ids = list(ids)
+        destinations = [("modality", m) for m in modalities] + [
+            ("peer", p) for p in peers
+        ]
+        if not destinations:
+            raise ValueError("Provide modalities or peers")
+        return self._send(ids, destinations)
+
+    def _send(self, ids, destinations):
+        queue = [
+            _Batch(0.0, destination, ids[i : i + self.batch_size], 1, 0)
+            for i in range(0, len(ids), self.batch_size)
+            for destination in destinations
+        ]
+        jobs = {}  # handle -> batch
+        in_flight = Counter()
+        while queue or jobs:
+            now = monotonic()
+            waiting = []
+            for batch in queue:
+                if (
+                    batch.ready > now
+                    or in_flight[batch.destination] >= self.concurrency
+                ):
+                    waiting.append(batch)
+                    continue
+                try:
+                    job = self.orthanc.track_job(
+                        self._store(batch.destination, batch.resources)
+                    )
+                except RequestException as e:
+                    retry = self._failed(batch, partial=False)
+                    if retry is None:
+                        yield SendResult(
+                            batch.destination,
+                            batch.resources,
+                            None,
+                            batch.attempts,
+                            str(e),
+                        )
+                    else:
+                        waiting.extend(retry)
+                    continue
+                jobs[job] = batch
+                in_flight[batch.destination] += 1
+            queue = waiting
+
+            ready = [b.ready for b in queue if b.ready > monotonic()]
+            timeout = max(0.0, min(ready) - monotonic()) if ready else None
+            if not jobs:
+                if timeout:
+                    sleep(timeout)
+                continue
+            done, _ = wait(jobs, timeout=timeout, return_when=FIRST_COMPLETED)
+            for job in done:
+                batch = jobs.pop(job)
+                in_flight[batch.destination] -= 1
+                error, partial = self._error(job)
+                if error is None:
+                    yield SendResult(
+                        batch.destination, batch.resources, job.id, batch.attempts, None
+                    )
+                    continue
+                retry = self._failed(batch, partial)
+                if retry is None:
+                    yield SendResult(
+                        batch.destination,
+                        batch.resources,
+                        job.id,
+                        batch.attempts,
+                        error,
+                    )
+                else:
+                    queue.extend(retry)
+
+    @staticmethod
+    def _error(job):
+        """Why a finished store job did not send everything (or None), and
+        whether only some of its sub-operations failed"""
+        try:
+            content = job.result() or {}
+        except JobFailed as e:
+            return e.info.get("ErrorDescription") or "Job failed", False
+        except CancelledError:
+            return "Job cancelled", False
+        failed = int(content.get("FailedInstancesCount", 0) or 0)
+        if failed:
+            return "{} instances failed".format(failed), True
+        return None, False
+
+    def submit(self, ids, modalities=(), peers=()):
+        """Like :meth:`send`, in a background thread
+
+        :return:
+            Future of the list of :class:`SendResult`
+        :rtype:
+            concurrent.futures.Future
+        """
+        generator = self.send(ids, modalities, peers)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(thread_name_prefix="beren-sender")
+        return self._executor.submit(list, generator)
+
+    def close(self):
+        """Wait for the background sends"""
+        if self._executor is not None:
+            self._executor.shutdown()
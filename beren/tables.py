@@ -0,0 +1,242 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from json import dumps
+
+__all__ = ["TagTable", "tag_table"]
+
+FRAMES = ("numpy", "pandas", "arrow")
+TYPES = ("int", "float", "multi", "str", "object")
+
+# Tag names kept as strings whatever their content (PatientID "00123", StudyDate...)
+STRING_SUFFIXES = ("UID", "ID", "Date", "Time", "DateTime", "Name", "AccessionNumber")
+
+
+def _parse(value, kind):
+    """Convert a simplified tag value to ``kind``, empty values become None"""
+    if value is None or value == "":
+        return None
+    if kind == "int":
+        return int(value)
+    if kind == "float":
+        return float(value)
+    if kind == "multi":
+        return tuple(float(v) for v in value.split("\\"))
+    return value
+
+
+def _kind(value):
+    """Narrowest type of a single value"""
+    if not isinstance(value, str):
+        return "object"
+    for kind in ("int", "float", "multi"):
+        if kind == "multi" and "\\" not in value:
+            break
+        try:
+            _parse(value, kind)
+        except ValueError:
+            continue
+        return kind
+    return "str"
+
+
+def _infer(name, values):
+    """Narrowest type holding every value of a column
+
+    One of "int", "float", "multi" (backslash-separated numbers, e.g.
+    ImagePositionPatient), "str", or "object" (sequences). Identifiers,
+    dates, and times look numeric but are always kept as strings.
+    """
+    if name.endswith(STRING_SUFFIXES):
+        return "str"
+    kinds = {_kind(v) for v in values if v is not None and v != ""}
+    for kind in ("object", "str", "multi", "float", "int"):
+        if kind in kinds:
+            return kind
+    return "str"
+
+
+class TagTable:
+    """
+    Columnar table of instance tags, one row per instance.
+
+    Columns are lists of typed values (``int``, ``float``, tuples of floats
+    for numeric multi-valued tags, ``str``, or raw values for sequences),
+    with None for missing tags. Convert the table with :meth:`to_numpy`,
+    :meth:`to_pandas`, or :meth:`to_arrow` when those libraries are
+    installed.
+
+    :param list ids:
+        Instance UUIDs, in row order
+    :param dict columns:
+        Raw simplified values by tag name, same length as ``ids``
+    :param dict types:
+        Column types overriding the inferred ones, by tag name: "int",
+        "float", "multi", "str", or "object" (optional)
+    :raises ValueError:
+        Unknown type, or a value that cannot be converted to it
+    """
+
+    def __init__(self, ids, columns, types=None):
+        self.ids = ids
+        self.types = {name: _infer(name, values) for name, values in columns.items()}
+        for name, kind in (types or {}).items():
+            if kind not in TYPES:
+                raise ValueError("Unknown column type {!r}".format(kind))
+            if name in self.types:
+                self.types[name] = kind
+        self.columns = {
+            name: (
+                [_parse(v, self.types[name]) for v in values]
+                if self.types[name] not in ("str", "object")
+                else values
+            )
+            for name, values in columns.items()
+        }
+
+    def __repr__(self):
+        return "<TagTable({} rows, {} columns)>".format(
+            len(self.ids), len(self.columns)
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def to_numpy(self):
+        """Dictionary of NumPy arrays, including the "ID" column
+
+        Integer columns with missing values and float columns use ``float64``
+        with NaN. Multi-valued columns of a constant length become 2-D arrays
+        (e.g. ``(n, 3)`` for ImagePositionPatient).
+
+        :rtype:
+            dict
+        :raises ImportError:
+            NumPy is not installed
+        """
+        import numpy as np
+
+        arrays = {"ID": np.array(self.ids, dtype=object)}
+        for name, values in self.columns.items():
+            kind = self.types[name]
+            missing = any(v is None for v in values)
+            if kind == "int" and not missing:
+                arrays[name] = np.array(values, dtype=np.int64)
+            elif kind in ("int", "float"):
+                arrays[name] = np.array(
+                    [np.nan if v is None else v for v in values], dtype=np.float64
+                )
+            elif (
+                kind == "multi"
+                and not missing
+                and len(set(len(v) for v in values)) == 1
+            ):
+                arrays[name] = np.array(values, dtype=np.float64)
+            else:
+                arrays[name] = np.empty(len(values), dtype=object)
+                arrays[name][:] = values
+        return arrays
+
+    def to_pandas(self):
+        """pandas DataFrame indexed by instance UUID
+
+        Integer columns use the nullable ``Int64`` dtype.
+
+        :rtype:
+            pandas.DataFrame
+        :raises ImportError:
+            pandas is not installed
+        """
+        import pandas as pd
+
+        data = {}
+        for name, values in self.columns.items():
+            kind = self.types[name]
+            if kind == "int":
+                data[name] = pd.array(values, dtype="Int64")
+            elif kind == "float":
+                data[name] = pd.array(values, dtype="float64")
+            else:
+                data[name] = pd.Series(values, dtype=object).array
+        return pd.DataFrame(data, index=pd.Index(self.ids, name="ID"))
+
+    def to_arrow(self):
+        """Arrow table with an "ID" column
+
+        Multi-valued columns become ``list<double>``.
+
+        :rtype:
+            pyarrow.Table
+        :raises ImportError:
+            pyarrow is not installed
+        """
+        import pyarrow as pa
+
+        types = {"int": pa.int64(), "float": pa.float64(), "str": pa.string()}
+        types["multi"] = pa.list_(pa.float64())
+        arrays = {"ID": pa.array(self.ids, type=pa.string())}
+        for name, values in self.columns.items():
+            kind = self.types[name]
+            if kind == "object":
+                # Sequences have no fixed schema, keep them as JSON text
+                values = [None if v is None else dumps(v) for v in values]
+                kind = "str"
+            arrays[name] = pa.array(values, type=types[kind])
+        return pa.table(arrays)
+
+    def convert(self, frame=None):
+        """Convert to ``frame``: None (this table), "numpy", "pandas", or "arrow"
+
+        :raises ValueError:
+            Unknown frame
+        """
+        if frame is None:
+            return self
+        if frame not in FRAMES:
+            raise ValueError(
+                "Unknown frame {!r}, use one of {}".format(frame, ", ".join(FRAMES))
+            )
+        return getattr(self, "to_" + frame)()
+
+
+def tag_table(items, tags=None, types=None):
+    """Build a :class:`TagTable` from ``(instance UUID, simplified tags)`` pairs
+
+    :param iterable items:
+        Pairs as yielded by ``stream_study_instances_tags`` with ``simplify``
+    :param list tags:
+        Tag names to keep as columns (default: every tag found)
+    :param dict types:
+        Column types overriding the inferred ones, see :class:`TagTable`
+    :rtype:
+        TagTable
+    """
+    ids = []
+    columns = {name: [] for name in tags} if tags is not None else {}
+    for id_, instance_tags in items:
+        row = len(ids)
+        ids.append(id_)
+        if tags is None:
+            for name in instance_tags:
+                if name not in columns:
+                    # First seen on this row, missing on the previous ones
+                    columns[name] = [None] * row
+        for name, values in columns.items():
+            values.append(instance_tags.get(name))
+    return TagTable(ids, columns, types)
@@ -0,0 +1,78 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from io import BytesIO
+import re
+
+__all__ = ["TRANSFER_SYNTAXES", "decode_file", "transfer_syntax"]
+
+# Short names of common transfer syntaxes
+TRANSFER_SYNTAXES = {
+    "implicit-little-endian": "1.2.840.10008.1.2",
+    "explicit-little-endian": "1.2.840.10008.1.2.1",
+    "deflated": "1.2.840.10008.1.2.1.99",
+    "jpeg-baseline": "1.2.840.10008.1.2.4.50",
+    "jpeg-lossless": "1.2.840.10008.1.2.4.70",
+    "jpeg-ls-lossless": "1.2.840.10008.1.2.4.80",
+    "jpeg-ls": "1.2.840.10008.1.2.4.81",
+    "jpeg2000-lossless": "1.2.840.10008.1.2.4.90",
+    "jpeg2000": "1.2.840.10008.1.2.4.91",
+    "rle": "1.2.840.10008.1.2.5",
+}
+
+UID = re.compile(r"^[0-9]+(\.[0-9]+)+$")
+
+
+def transfer_syntax(name):
+    """Transfer syntax UID of a short name (see ``TRANSFER_SYNTAXES``) or UID
+
+    :param str name:
+        Short name, e.g. "jpeg2000-lossless", or transfer syntax UID
+    :rtype:
+        str
+    :raises ValueError:
+        Unknown name
+    """
+    if name in TRANSFER_SYNTAXES:
+        return TRANSFER_SYNTAXES[name]
+    if UID.match(name):
+        return name
+    raise ValueError(
+        "Unknown transfer syntax {!r}, use a UID or one of {}".format(
+            name, ", ".join(TRANSFER_SYNTAXES)
+        )
+    )
+
+
+def decode_file(chunks):
+    """Decompress the pixel data of a DICOM file, e.g. one transcoded on download
+
+    Requires pydicom, and the pixel data handlers of the compression used
+    (pylibjpeg, GDCM...).
+
+    :param iterable chunks:
+        DICOM file, e.g. ``get_instance_file(...)``
+    :return:
+        DICOM file in explicit little endian
+    :rtype:
+        bytes
+    :raises ImportError:
+        pydicom is not installed
+    """
+    import pydicom
+
+    dataset = pydicom.dcmread(BytesIO(b"".join(chunks)))
+    dataset.decompress()
+    output = BytesIO()
+    dataset.save_as(output)
+    return output.getvalue()
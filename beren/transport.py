@@ -0,0 +1,608 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from apiron import client, Endpoint, JsonEndpoint
+from beren.decoders import get_decoder
+from functools import partial
+from inspect import getattr_static
+from random import uniform
+from requests.exceptions import ConnectionError, HTTPError, RetryError, Timeout
+from threading import Condition, Event, Lock
+from time import monotonic, sleep
+from urllib3.util.retry import Retry
+
+__all__ = [
+    "AdaptiveLimiter",
+    "Coalescer",
+    "RetryPolicy",
+    "TransferStats",
+    "Transport",
+]
+
+# Retries are handled by the transport, so urllib3 must not retry on its own
+NO_RETRY = Retry(total=0)
+
+
+class RetryPolicy:
+    """
+    Retry idempotent requests with jittered exponential backoff.
+
+    The delay before retry ``n`` (starting at 0) is drawn uniformly from
+    ``[0, min(max_backoff, backoff * 2 ** n)]`` ("full jitter"), so that many
+    clients failing at once do not retry in lockstep.
+
+    :param int attempts:
+        Total number of attempts, including the first one (default: 4)
+    :param float backoff:
+        Base delay in seconds (default: 0.5)
+    :param float max_backoff:
+        Upper bound of a single delay in seconds (default: 30)
+    :param iterable methods:
+        HTTP methods safe to retry (default: GET and HEAD)
+    :param iterable statuses:
+        HTTP status codes worth retrying (default: 429, 500, 502, 503, 504)
+    """
+
+    def __init__(
+        self,
+        attempts=4,
+        backoff=0.5,
+        max_backoff=30.0,
+        methods=("GET", "HEAD"),
+        statuses=(429, 500, 502, 503, 504),
+    ):
+        if attempts < 1:
+            raise ValueError("Must make at least one attempt")
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.methods = frozenset(m.upper() for m in methods)
+        self.statuses = frozenset(statuses)
+
+    def __repr__(self):
+        return "<RetryPolicy(attempts={}, backoff={})>".format(
+            self.attempts, self.backoff
+        )
+
+    def applies_to(self, method):
+        """Whether requests with this HTTP method may be retried"""
+        return method.upper() in self.methods
+
+    def should_retry(self, error, attempt):
+        """Whether the failed ``attempt`` (starting at 0) should be retried
+
+        :param Exception error:
+            The exception raised by the attempt
+        :param int attempt:
+            The attempt number
+        :rtype:
+            bool
+        """
+        if attempt + 1 >= self.attempts:
+            return False
+        if isinstance(error, HTTPError) and error.response is not None:
+            return error.response.status_code in self.statuses
+        return isinstance(error, (ConnectionError, Timeout, RetryError))
+
+    def delay(self, attempt, error=None):
+        """Seconds to wait before retrying after ``attempt``
+
+        A numeric ``Retry-After`` header sent by the server takes precedence.
+        """
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                return min(self.max_backoff, float(response.headers["Retry-After"]))
+            except (KeyError, ValueError):
+                pass
+        return uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+
+class AdaptiveLimiter:
+    """
+    Limit concurrent requests with an additive-increase/multiplicative-decrease (AIMD) window.
+
+    Every request holds a slot while it is in flight. Timeouts, connection
+    failures, and 5xx/429 responses shrink the window by ``decrease``; requests
+    completing within ``latency_target`` grow it by roughly one slot per full
+    window of healthy requests. Multiple failures within ``cooldown`` seconds
+    count as a single overload event.
+
+    :param int initial:
+        Starting number of concurrent requests (default: 8)
+    :param int minimum:
+        Smallest window (default: 1)
+    :param int maximum:
+        Largest window (default: 64)
+    :param float latency_target:
+        Latency in seconds under which the server is considered healthy (default: 1.0)
+    :param float decrease:
+        Multiplicative factor applied on overload (default: 0.5)
+    :param float cooldown:
+        Seconds between two successive decreases (default: 1.0)
+    """
+
+    def __init__(
+        self,
+        initial=8,
+        minimum=1,
+        maximum=64,
+        latency_target=1.0,
+        decrease=0.5,
+        cooldown=1.0,
+    ):
+        if not 1 <= minimum <= initial <= maximum:
+            raise ValueError("Must satisfy 1 <= minimum <= initial <= maximum")
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._last_decrease = None
+        self._condition = Condition()
+
+    def __repr__(self):
+        return "<AdaptiveLimiter(limit={}, in_flight={})>".format(
+            self.limit, self.in_flight
+        )
+
+    @property
+    def limit(self):
+        """Current number of allowed concurrent requests"""
+        return int(self._limit)
+
+    @property
+    def in_flight(self):
+        """Number of requests currently holding a slot"""
+        return self._in_flight
+
+    def acquire(self):
+        """Block until a slot is available and take it"""
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(self, latency=None, overloaded=False):
+        """Give back a slot and adapt the window
+
+        :param float latency:
+            Duration of the request in seconds, if it completed
+        :param bool overloaded:
+            The request failed in a way that signals server overload
+        """
+        with self._condition:
+            self._in_flight -= 1
+            now = monotonic()
+            if overloaded:
+                if (
+                    self._last_decrease is None
+                    or now - self._last_decrease >= self.cooldown
+                ):
+                    self._limit = max(self.minimum, self._limit * self.decrease)
+                    self._last_decrease = now
+            elif latency is not None and latency <= self.latency_target:
+                self._limit = min(self.maximum, self._limit + 1.0 / self._limit)
+            self._condition.notify_all()
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class Coalescer:
+    """
+    Share a single in-flight request between concurrent identical calls.
+
+    The first caller for a key performs the request; callers arriving while it
+    is in flight wait for it and receive the same result (or exception). The
+    result object is shared, so treat it as read-only.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._flights = {}
+        self.requests = 0
+        self.coalesced = 0
+
+    def __repr__(self):
+        return "<Coalescer(requests={}, coalesced={})>".format(
+            self.requests, self.coalesced
+        )
+
+    def do(self, key, func):
+        """Return ``func()``, or the result of the identical call in flight
+
+        :param hashable key:
+            Identifies identical calls
+        :param callable func:
+            Performs the call
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.requests += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+
+class TransferStats:
+    """
+    Count the bytes transferred by each endpoint.
+
+    For every endpoint (keyed by method and path template, e.g.
+    ``"GET tools/find/"``), records the number of requests, the bytes read off
+    the wire (compressed, when the server compressed the response) and the
+    bytes delivered after decompression. Comparing both shows what
+    compression saves.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._endpoints = {}
+
+    def __repr__(self):
+        totals = self.totals()
+        return "<TransferStats(wire_bytes={}, decoded_bytes={})>".format(
+            totals["wire_bytes"], totals["decoded_bytes"]
+        )
+
+    def record(self, name, wire_bytes, decoded_bytes):
+        """Record a response of endpoint ``name``"""
+        with self._lock:
+            entry = self._endpoints.setdefault(
+                name, {"requests": 0, "wire_bytes": 0, "decoded_bytes": 0}
+            )
+            entry["requests"] += 1
+            entry["wire_bytes"] += wire_bytes
+            entry["decoded_bytes"] += decoded_bytes
+
+    def snapshot(self):
+        """Counters of each endpoint, with their compression ``ratio`` (wire / decoded)
+
+        :rtype:
+            dict
+        """
+        with self._lock:
+            endpoints = {name: dict(entry) for name, entry in self._endpoints.items()}
+        for entry in endpoints.values():
+            entry["ratio"] = (
+                entry["wire_bytes"] / entry["decoded_bytes"]
+                if entry["decoded_bytes"]
+                else 1.0
+            )
+        return endpoints
+
+    def totals(self):
+        """Counters summed over every endpoint"""
+        totals = {"requests": 0, "wire_bytes": 0, "decoded_bytes": 0}
+        with self._lock:
+            for entry in self._endpoints.values():
+                for k in totals:
+                    totals[k] += entry[k]
+        return totals
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+def _wire_bytes(response, default):
+    """Bytes read off the wire for ``response``, before content decoding"""
+    try:
+        return int(response.raw.tell())
+    except (AttributeError, TypeError, ValueError):
+        return default
+
+
+def _freeze(value):
+    """Hashable equivalent of a JSON-like value"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+# Call arguments that can be part of a coalescing key; anything else (sessions,
+# request bodies, ...) makes the call unique
+COALESCIBLE_ARGUMENTS = frozenset(
+    ["params", "headers", "auth", "timeout_spec", "retry_spec", "method"]
+)
+
+
+def is_overload(error):
+    """Whether a failed request indicates an overloaded server"""
+    if isinstance(error, HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(error, (ConnectionError, Timeout, RetryError))
+
+
+def is_not_found(error):
+    """Whether a failed request got a 404, e.g. for a deleted resource"""
+    return (
+        isinstance(error, HTTPError)
+        and error.response is not None
+        and error.response.status_code == 404
+    )
+
+
+class _Slot:
+    """A request's place in the concurrency limiter, released once"""
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        limiter.acquire()
+        self.start = monotonic()
+        self.released = False
+
+    def release(self, error=None):
+        if self.released:
+            return
+        self.released = True
+        if error is not None:
+            self.limiter.release(overloaded=is_overload(error))
+        else:
+            self.limiter.release(latency=monotonic() - self.start)
+
+
+class _SlotStream:
+    """Chunks of a streamed body, holding a limiter slot until used up or closed
+
+    A class rather than a generator: closing a generator that never started
+    would not run its cleanup.
+    """
+
+    def __init__(self, chunks, slot):
+        self._chunks = iter(chunks)
+        self._slot = slot
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            self.close()
+            raise
+        except Exception as e:
+            self._slot.release(e)
+            self.close()
+            raise
+
+    def close(self):
+        self._slot.release()
+        close = getattr(self._chunks, "close", None)
+        if close is not None:
+            close()
+
+    def __del__(self):
+        self.close()
+
+
+class Transport:
+    """
+    Dispatch endpoint calls for a single client.
+
+    Applies the client's retry policy, concurrency limiter and JSON decoder
+    around :func:`apiron.client.call`. Without any of them, calls behave exactly
+    like plain ``apiron`` calls.
+
+    :param RetryPolicy retry:
+        Retry policy for idempotent requests (optional)
+    :param AdaptiveLimiter limiter:
+        Concurrency limiter shared by all services of the client (optional)
+    :param json_decoder:
+        Decoder name, "auto", or callable for :class:`apiron.JsonEndpoint`
+        responses (optional, see :func:`beren.decoders.get_decoder`)
+    :param bool coalesce:
+        Share concurrent identical GET requests of non-streaming endpoints (default: False)
+    :param bool compression:
+        Ask for gzip or deflate compressed :class:`apiron.JsonEndpoint`
+        responses, whatever the session's default headers (default: False)
+    :param TransferStats stats:
+        Record the bytes transferred by each endpoint (optional)
+    """
+
+    def __init__(
+        self,
+        retry=None,
+        limiter=None,
+        json_decoder=None,
+        coalesce=False,
+        compression=False,
+        stats=None,
+    ):
+        self.retry = retry
+        self.limiter = limiter
+        self.json_decoder = (
+            get_decoder(json_decoder) if json_decoder is not None else None
+        )
+        self.coalescer = Coalescer() if coalesce else None
+        self.compression = compression
+        self.stats = stats
+
+    def bind(self, service, domain, auth):
+        """Return ``service`` bound to this transport, ``domain`` and ``auth``"""
+        return BoundService(service, self, domain, auth)
+
+    def call(self, service, endpoint, **kwargs):
+        """Call ``endpoint`` of ``service``, retrying and limiting as configured"""
+        key = self._coalescing_key(service, endpoint, kwargs)
+        if key is None:
+            return self._call(service, endpoint, **kwargs)
+        return self.coalescer.do(key, partial(self._call, service, endpoint, **kwargs))
+
+    def _coalescing_key(self, service, endpoint, kwargs):
+        """Key identifying identical reads, or None when the call must not be shared"""
+        if self.coalescer is None or getattr(endpoint, "streaming", False):
+            return None
+        method = kwargs.get("method") or endpoint.default_method
+        if method.upper() != "GET":
+            return None
+        placeholders = endpoint.path_placeholders
+        if any(
+            k not in COALESCIBLE_ARGUMENTS and k not in placeholders for k in kwargs
+        ):
+            return None
+        key = (
+            service.domain,
+            endpoint.path,
+            tuple(
+                (k, id(v) if k == "auth" else _freeze(v))
+                for k, v in sorted(kwargs.items())
+            ),
+        )
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def _call(self, service, endpoint, **kwargs):
+        is_json = isinstance(endpoint, JsonEndpoint)
+        if self.compression and is_json:
+            headers = dict(kwargs.get("headers") or {})
+            headers.setdefault("Accept-Encoding", "gzip, deflate")
+            kwargs["headers"] = headers
+        if kwargs.get("return_raw_response_object") is not None:
+            response = self._retrying(service, endpoint, **kwargs)
+            # The caller reads the body on its own, it is out of our hands
+            slot = getattr(response, "beren_slot", None)
+            if slot is not None:
+                slot.release()
+            return response
+        if self.stats is not None:
+            return self._counted(service, endpoint, **kwargs)
+        if self.json_decoder is not None and is_json:
+            kwargs["return_raw_response_object"] = True
+            response = self._retrying(service, endpoint, **kwargs)
+            return self.json_decoder(response.content)
+        return self._retrying(service, endpoint, **kwargs)
+
+    def _counted(self, service, endpoint, **kwargs):
+        """Decode the response here, recording its size on the wire and decoded"""
+        name = "{} {}".format(
+            (kwargs.get("method") or endpoint.default_method).upper(), endpoint.path
+        )
+        kwargs["return_raw_response_object"] = True
+        response = self._retrying(service, endpoint, **kwargs)
+        if getattr(endpoint, "streaming", False):
+            chunks = endpoint.format_response(response)
+            slot = getattr(response, "beren_slot", None)
+            if slot is not None:
+                chunks = _SlotStream(chunks, slot)
+            return self._counted_stream(name, response, chunks)
+        content = response.content
+        self.stats.record(name, _wire_bytes(response, len(content)), len(content))
+        if self.json_decoder is not None and isinstance(endpoint, JsonEndpoint):
+            return self.json_decoder(content)
+        return endpoint.format_response(response)
+
+    def _counted_stream(self, name, response, chunks):
+        decoded = 0
+        try:
+            for chunk in chunks:
+                decoded += len(chunk)
+                yield chunk
+        finally:
+            self.stats.record(name, _wire_bytes(response, decoded), decoded)
+
+    def _retrying(self, service, endpoint, **kwargs):
+        method = kwargs.get("method") or endpoint.default_method
+        retry = self.retry if self.retry and self.retry.applies_to(method) else None
+        if retry is not None:
+            kwargs.setdefault("retry_spec", NO_RETRY)
+
+        attempt = 0
+        while True:
+            try:
+                return self._send(service, endpoint, **kwargs)
+            except Exception as e:
+                if retry is None or not retry.should_retry(e, attempt):
+                    raise
+                sleep(retry.delay(attempt, e))
+                attempt += 1
+
+    def _send(self, service, endpoint, **kwargs):
+        if self.limiter is None:
+            return client.call(service, endpoint, **kwargs)
+
+        slot = _Slot(self.limiter)
+        try:
+            result = client.call(service, endpoint, **kwargs)
+        except Exception as e:
+            slot.release(e)
+            raise
+        if not getattr(endpoint, "streaming", False):
+            slot.release()
+            return result
+        # The body is read later: the slot is held until it is used up or
+        # closed, so that large downloads count against the limit
+        if kwargs.get("return_raw_response_object"):
+            result.beren_slot = slot
+            return result
+        return _SlotStream(result, slot)
+
+
+class BoundService:
+    """
+    An :class:`apiron.Service` bound to one client.
+
+    Attribute access is forwarded to a private subclass of the service carrying
+    the client's domain and auth, so that several clients never overwrite each
+    other's settings. Endpoints are dispatched through the client's transport.
+    """
+
+    def __init__(self, service, transport, domain, auth):
+        self.service = type(
+            service.__name__, (service,), {"domain": domain, "auth": auth}
+        )
+        self.transport = transport
+
+    def __repr__(self):
+        return "<{}({})>".format(self.service.__name__, self.service.domain)
+
+    def __getattr__(self, name):
+        attr = getattr_static(self.service, name, None)
+        if isinstance(attr, Endpoint):
+            return partial(self.transport.call, self.service, attr)
+        return getattr(self.service, name)
@@ -0,0 +1,137 @@
+from beren import Job, JobFailed, Orthanc, extract_archive, iter_zip, stream_job_output
+from requests.exceptions import ConnectionError
+from unittest import mock
+import io
+import os
+import pytest
+import zipfile
+
+URL = "https://demo.orthanc-server.com"
+
+FILES = {
+    "PATIENT/STUDY/CT SERIES/CT000000.dcm": os.urandom(50000),
+    "PATIENT/STUDY/CT SERIES/CT000001.dcm": b"DICM" * 20000,
+    "PATIENT/STUDY/SR/SR000000.dcm": b"",
+}
+
+
+class Unseekable(io.RawIOBase):
+    """Forces data descriptors, like the archives streamed by Orthanc"""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.data += b
+        return len(b)
+
+
+def archive(files=FILES, zip64=False):
+    out = Unseekable()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, data in files.items():
+            with z.open(name, "w", force_zip64=zip64) as f:
+                f.write(data)
+    return bytes(out.data)
+
+
+def chunked(data, size):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+class TestArchive:
+    @pytest.mark.parametrize("zip64", [False, True])
+    def test_iter_zip_any_chunking(self, zip64):
+        data = archive(zip64=zip64)
+        for size in (1, 13, 4096, len(data)):
+            members = {name: b"".join(c) for name, c in iter_zip(chunked(data, size))}
+            assert members == FILES
+
+    def test_skipped_members_and_errors(self):
+        data = archive()
+        assert [name for name, _ in iter_zip([data])] == list(FILES)
+        with pytest.raises(ValueError):
+            list(iter_zip([data[:-5000]]))
+        with pytest.raises(ValueError):
+            list(iter_zip([b"not a zip file"]))
+        stored = io.BytesIO()
+        with zipfile.ZipFile(stored, "w", zipfile.ZIP_STORED) as z:
+            z.writestr("a.dcm", b"DICM" * 100)
+        with pytest.raises(ValueError):
+            list(iter_zip([stored.getvalue().replace(b"DICMDICM", b"DICMDICX", 1)]))
+
+    def test_extract_to_directory(self, tmp_path):
+        paths = extract_archive(chunked(archive(), 1000), str(tmp_path))
+        assert len(paths) == 3
+        for name, data in FILES.items():
+            assert (tmp_path / name).read_bytes() == data
+        assert not [p for p in tmp_path.rglob(".tmp-*")]
+
+    def test_extract_refuses_escaping_paths(self, tmp_path):
+        with pytest.raises(ValueError):
+            extract_archive([archive({"../evil.dcm": b"x"})], str(tmp_path / "out"))
+        assert not (tmp_path / "evil.dcm").exists()
+
+    @mock.patch("apiron.client.call")
+    def test_extract_study_archive_to_callback(self, call):
+        call.return_value = iter(chunked(archive(), 4096))
+        received = {}
+        names = extract_archive(
+            Orthanc(URL).get_study_archive("s"), callback=received.__setitem__
+        )
+        assert names == list(FILES)
+        assert received == FILES
+
+
+class FlakyResponse:
+    def __init__(self, data, status_code=200, fail_after=None):
+        self.data = data
+        self.status_code = status_code
+        self.fail_after = fail_after
+
+    def iter_content(self, chunk_size):
+        for i, chunk in enumerate(chunked(self.data, 1000)):
+            if i == self.fail_after:
+                raise ConnectionError("reset")
+            yield chunk
+
+
+class TestAsynchronousArchive:
+    def job(self, info):
+        manager = mock.Mock()
+        handle = Job(manager, "job")
+        handle.info = info
+        handle.set_result({})
+        return handle
+
+    @pytest.mark.parametrize("ranges", [True, False])
+    def test_resume_after_failure(self, ranges):
+        data = archive()
+        orthanc = mock.Mock()
+        orthanc.stream_job_output.side_effect = [
+            FlakyResponse(data, fail_after=3),
+            FlakyResponse(data[3000:] if ranges else data, 206 if ranges else 200),
+        ]
+        chunks = stream_job_output(orthanc, self.job({"State": "Success"}), backoff=0)
+        assert b"".join(chunks) == data
+        second = orthanc.stream_job_output.call_args_list[1]
+        assert second[1]["headers"] == {"Range": "bytes=3000-"}
+
+    def test_failed_job(self):
+        handle = Job(mock.Mock(), "job")
+        handle.set_exception(JobFailed({"ID": "job", "ErrorDescription": "Boom"}))
+        with pytest.raises(JobFailed):
+            list(stream_job_output(mock.Mock(), handle))
+
+    @mock.patch("apiron.client.call")
+    def test_study_archive_job(self, call):
+        orthanc = Orthanc(URL)
+        call.side_effect = [{"ID": "job", "Path": "/jobs/job"}]
+        with mock.patch.object(Orthanc, "_job_output") as output:
+            orthanc.get_study_archive("s", asynchronous=True)
+        assert call.call_args[1]["json"] == {"Asynchronous": True}
+        assert call.call_args[0][1].default_method == "POST"
+        output.assert_called_once_with({"ID": "job", "Path": "/jobs/job"}, None)
@@ -0,0 +1,80 @@
+from beren import BulkResult, bulk_anonymize, bulk_modify
+from requests.exceptions import HTTPError
+from unittest import mock
+import pytest
+
+
+class FakeOrthanc:
+    """Runs every job to completion on its second status check"""
+
+    def __init__(self):
+        self.checks = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.bodies = []
+
+    def anonymize_study(self, id_, data):
+        if id_ == "bad":
+            raise HTTPError("404 Client Error")
+        self.bodies.append(data)
+        self.checks["job-" + id_] = 0
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return {"ID": "job-" + id_, "Path": "/jobs/job-" + id_}
+
+    modify_study = anonymize_study
+
+    def get_job(self, id_):
+        self.checks[id_] = self.checks.get(id_, 0) + 1
+        if self.checks[id_] < 2:
+            return {"ID": id_, "State": "Running"}
+        if self.checks[id_] == 2:
+            self.in_flight -= 1
+        if id_ == "job-fail":
+            return {"ID": id_, "State": "Failure", "ErrorDescription": "Bad file"}
+        return {"ID": id_, "State": "Success", "Content": {"ID": "new-" + id_[4:]}}
+
+    def get_jobs(self, params=None):
+        return [self.get_job(id_) for id_ in list(self.checks)]
+
+    def find(self, query, level):
+        return ["a", "b"]
+
+
+class TestBulk:
+    def test_mapping_and_failures(self):
+        orthanc = FakeOrthanc()
+        results = list(
+            bulk_anonymize(
+                orthanc, ["a", "bad", "fail", "b", "c"], concurrency=2, interval=0
+            )
+        )
+        assert orthanc.max_in_flight == 2
+        assert sorted(r.old_id for r in results) == ["a", "b", "bad", "c", "fail"]
+        ok = {r.old_id: r.new_id for r in results if r.error is None}
+        assert ok == {"a": "new-a", "b": "new-b", "c": "new-c"}
+        failed = {r.old_id: r for r in results if r.error is not None}
+        assert failed["fail"] == BulkResult("fail", None, "job-fail", "Bad file")
+        assert failed["bad"].job_id is None
+        assert all(body["Asynchronous"] for body in orthanc.bodies)
+
+    def test_query_and_arguments(self):
+        orthanc = FakeOrthanc()
+        results = bulk_modify(
+            orthanc, {"Replace": {"StudyDescription": "X"}}, query={}, interval=0
+        )
+        assert {r.new_id for r in results} == {"new-a", "new-b"}
+        assert orthanc.bodies[0]["Replace"] == {"StudyDescription": "X"}
+        with pytest.raises(ValueError):
+            bulk_anonymize(orthanc, ["a"], level="Instance")
+        with pytest.raises(ValueError):
+            bulk_anonymize(orthanc)
+
+    def test_poll_errors_fail_each_resource(self):
+        orthanc = FakeOrthanc()
+        orthanc.get_job = mock.Mock(side_effect=KeyError("ID"))
+        orthanc.get_jobs = orthanc.get_job
+        with pytest.warns(RuntimeWarning):
+            results = list(bulk_anonymize(orthanc, ["a", "b"], interval=0))
+        assert sorted(r.old_id for r in results) == ["a", "b"]
+        assert all(r.new_id is None and "KeyError" in r.error for r in results)
@@ -0,0 +1,150 @@
+from beren import Orthanc, DiskCache, FindCache, SQLiteCache
+from beren.cache import cache_key, normalize_find
+from unittest import mock
+import os
+import time
+
+URL = "https://demo.orthanc-server.com"
+
+
+class TestDiskCache:
+    def test_stream_miss_then_hit(self, tmp_path):
+        cache = DiskCache(str(tmp_path))
+        fetch = mock.Mock(return_value=iter([b"DI", b"CM"]))
+        assert b"".join(cache.stream("k" * 64, fetch)) == b"DICM"
+        assert b"".join(cache.stream("k" * 64, fetch)) == b"DICM"
+        assert fetch.call_count == 1
+        assert cache.stats()["hits"] == cache.stats()["misses"] == 1
+
+    def test_partial_read_is_not_stored(self, tmp_path):
+        cache = DiskCache(str(tmp_path))
+        stream = cache.stream("a" * 64, lambda: iter([b"1", b"2"]))
+        next(stream)
+        stream.close()
+        assert "a" * 64 not in cache
+        assert cache.size() == 0
+
+    def test_lru_eviction(self, tmp_path):
+        cache = DiskCache(str(tmp_path), max_size=25, low_water=0.5)
+        for i, key in enumerate(["a", "b"]):
+            list(cache.stream(cache_key(key), lambda: [b"x" * 10]))
+            past = time.time() - 100 + i
+            os.utime(cache._path(cache_key(key)), (past, past))
+        list(cache.stream(cache_key("c"), lambda: [b"x" * 10]))
+        assert cache_key("a") not in cache
+        assert cache_key("b") not in cache
+        assert cache_key("c") in cache
+        assert cache.evictions == 2
+
+    def test_cap_shared_by_processes(self, tmp_path):
+        first = DiskCache(str(tmp_path), max_size=100, low_water=0.5)
+        second = DiskCache(str(tmp_path), max_size=100, low_water=0.5)
+        list(first.stream(cache_key("a"), lambda: [b"x" * 10]))
+        list(second.stream(cache_key("b"), lambda: [b"x" * 10]))
+        for i in range(7):
+            for cache in (first, second):
+                key = cache_key("{}{}".format(i, id(cache)))
+                list(cache.stream(key, lambda: [b"x" * 10]))
+        # Each process wrote 80 bytes, under the cap on its own
+        assert first.size() <= 100
+
+    @mock.patch("apiron.client.call")
+    def test_client_uses_cache(self, call, tmp_path):
+        orthanc = Orthanc(URL, cache=DiskCache(str(tmp_path)))
+        call.return_value = {"0010,0010": {"Value": "X"}}
+        assert orthanc.get_instance_tags("i") == call.return_value
+        assert orthanc.get_instance_tags("i") == call.return_value
+        assert orthanc.get_instance_tags("i", simplify=True) == call.return_value
+        assert call.call_count == 2
+
+        call.return_value = iter([b"frame"])
+        assert list(orthanc.get_instance_frame("i", 0, "raw")) == [b"frame"]
+        assert list(orthanc.get_instance_frame("i", 0, "raw")) == [b"frame"]
+        assert call.call_count == 3
+        assert call.call_args[1]["number"] == 0
+
+
+class TestSQLiteCache:
+    def test_get_json_and_expiry(self, tmp_path):
+        cache = SQLiteCache(str(tmp_path / "meta.db"), ttl=60)
+        fetch = mock.Mock(return_value={"ID": "s"})
+        assert cache.get_json("k", fetch) == {"ID": "s"}
+        assert cache.get_json("k", fetch) == {"ID": "s"}
+        assert fetch.call_count == 1
+        cache.set("k", {"ID": "old"}, ttl=-1)
+        assert cache.get_json("k", fetch) == {"ID": "s"}
+        assert fetch.call_count == 2
+
+    def test_cached_null_and_purge_on_set(self, tmp_path):
+        cache = SQLiteCache(str(tmp_path / "meta.db"), purge_interval=0)
+        fetch = mock.Mock(return_value=None)
+        assert cache.get_json("null", fetch) is None
+        assert cache.get_json("null", fetch) is None
+        assert fetch.call_count == 1
+        cache.set("old", 1, ttl=-1)
+        cache.set("new", 2)
+        count = cache._connection().execute("SELECT COUNT(*) FROM entries")
+        assert count.fetchone()[0] == 2  # "null" and "new"
+
+    def test_shared_between_processes(self, tmp_path):
+        path = str(tmp_path / "meta.db")
+        SQLiteCache(path).set("k", [1, 2])
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0 if SQLiteCache(path).get("k") == [1, 2] else 1)
+        assert os.waitpid(pid, 0)[1] == 0
+
+    @mock.patch("apiron.client.call")
+    def test_client_uses_metadata_cache(self, call, tmp_path):
+        cache = SQLiteCache(str(tmp_path / "meta.db"))
+        first = Orthanc(URL, metadata_cache=cache)
+        second = Orthanc(URL, metadata_cache=cache)
+        call.return_value = [{"ID": "s", "Type": "Study"}]
+        assert first.find({"PatientID": "1"}, "Study") == call.return_value
+        assert second.find({"PatientID": "1"}, "Study") == call.return_value
+        assert first.find({"PatientID": "2"}, "Study") == call.return_value
+        assert call.call_count == 2
+
+
+class TestFindCache:
+    def test_normalize_find(self):
+        assert normalize_find(
+            {"PatientName": " Jon* ", "StudyDate": "*", "Modality": "CT"}, "study"
+        ) == normalize_find({"Modality": "CT", "PatientName": "Jon*"}, "Study")
+        assert normalize_find({}, "Study") != normalize_find({}, "Study", True)
+
+    def test_invalidated_by_change_sequence(self):
+        cache = FindCache(check_interval=0)
+        fetch = mock.Mock(return_value=["a"])
+        sequence = mock.Mock(return_value=5)
+        assert cache.get_json(URL, "q", fetch, sequence) == ["a"]
+        assert cache.get_json(URL, "q", fetch, sequence) == ["a"]
+        assert fetch.call_count == 1
+        sequence.return_value = 6
+        cache.get_json(URL, "q", fetch, sequence)
+        assert fetch.call_count == 2
+        assert cache.stats()["hits"] == 1
+
+    def test_sequence_checked_once_per_interval(self):
+        cache = FindCache(check_interval=60)
+        sequence = mock.Mock(return_value=1)
+        for body in ("a", "b", "a"):
+            cache.get_json(URL, body, lambda: [], sequence)
+        assert sequence.call_count == 1
+
+    @mock.patch("apiron.client.call")
+    def test_client_uses_find_cache(self, call):
+        orthanc = Orthanc(URL, find_cache=FindCache(check_interval=0))
+        call.side_effect = lambda service, endpoint, **kw: (
+            {"Last": 3} if endpoint.path == "changes/" else ["s"]
+        )
+        assert orthanc.find({"PatientID": "1"}, "Study") == ["s"]
+        assert orthanc.find({"PatientID": "1 "}, "study") == ["s"]
+        finds = [c for c in call.call_args_list if c[0][1].path == "tools/find/"]
+        assert len(finds) == 1
+        # Results are copies, and arguments changing the answer bypass the cache
+        orthanc.find({"PatientID": "1"}, "Study").append("mutated")
+        assert orthanc.find({"PatientID": "1"}, "Study") == ["s"]
+        orthanc.find({"PatientID": "1"}, "Study", headers={"X": "1"})
+        finds = [c for c in call.call_args_list if c[0][1].path == "tools/find/"]
+        assert len(finds) == 2
@@ -36,6 +36,11 @@ class TestClass:
         assert orthanc.queries.auth == auth
         assert orthanc.modalities.auth == auth
 
+    def test_api_methods(self):
+        methods = Orthanc.get_api_methods()
+        assert "get_patients" in methods and "stream_patients" in methods
+        assert "patient" not in methods and "mirror" not in methods
+
     def test_connection_warning(self):
         with pytest.warns(UserWarning):
             Orthanc(WEAK_URL)
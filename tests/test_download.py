@@ -0,0 +1,114 @@
+from beren import download_study, plan_study_download
+from tests.test_archive import archive
+import pytest
+
+MB = 1024**2
+
+
+class FakeOrthanc:
+    def __init__(self, size, series):
+        self.series = series
+        self.size = size
+        self.requests = []
+
+    def get_study_statistics(self, id_):
+        count = sum(len(s["Instances"]) for s in self.series)
+        return {"DicomDiskSize": str(self.size), "CountInstances": str(count)}
+
+    def get_study(self, id_):
+        return {
+            "MainDicomTags": {"AccessionNumber": "A1", "StudyDescription": "Head"},
+            "PatientMainDicomTags": {"PatientID": "P1", "PatientName": "DOE^JOHN"},
+        }
+
+    def get_study_series(self, id_):
+        return self.series
+
+    def get_study_archive(self, id_):
+        self.requests.append(("study", id_))
+        return iter([archive({"P/S/A/1.dcm": b"1", "P/S/B/2.dcm": b"2"})])
+
+    def get_series_archive(self, id_):
+        self.requests.append(("series", id_))
+        # As Orthanc does, series without description share a directory name
+        (series,) = [s for s in self.series if s["ID"] == id_]
+        members = {
+            "P1 DOE^JOHN/A1 Head/CT/CT{:06d}.dcm".format(i): instance.encode()
+            for i, instance in enumerate(series["Instances"])
+        }
+        return iter([archive(members)])
+
+    def get_instance_file(self, id_):
+        self.requests.append(("instance", id_))
+        return iter([id_.encode()])
+
+
+def series(id_, count, modality="CT"):
+    return {
+        "ID": id_,
+        "Instances": ["{}{}".format(id_, i) for i in range(count)],
+        "MainDicomTags": {"Modality": modality},
+    }
+
+
+class TestDownload:
+    def test_strategies(self):
+        small = FakeOrthanc(10 * MB, [series("a", 100)])
+        assert plan_study_download(small, "s").strategy == "archive"
+        many = FakeOrthanc(
+            2000 * MB, [series(c, n) for c, n in zip("abcde", [5, 50, 20, 40, 10])]
+        )
+        plan = plan_study_download(many, "s")
+        assert plan.strategy == "series"
+        assert plan.items == ["b", "d", "c", "e", "a"]
+        mammo = FakeOrthanc(
+            2000 * MB, [series(c, 1) for c in "abcd"] + [series("e", 8)]
+        )
+        assert plan_study_download(mammo, "s").strategy == "instances"
+        assert plan_study_download(mammo, "s", strategy="series").strategy == "series"
+        with pytest.raises(ValueError):
+            plan_study_download(mammo, "s", strategy="zip")
+
+    def test_download_series_in_parallel(self, tmp_path):
+        orthanc = FakeOrthanc(2000 * MB, [series(c, 10) for c in "abcd"])
+        paths = download_study(orthanc, "s", str(tmp_path), workers=4)
+        assert sorted(orthanc.requests) == [("series", c) for c in "abcd"]
+        assert len(set(paths)) == 40
+        # Four series with the same description, none overwritten
+        study = tmp_path / "P1 DOE^JOHN" / "A1 Head"
+        assert sorted(p.name for p in study.iterdir()) == [
+            "CT",
+            "CT_2",
+            "CT_3",
+            "CT_4",
+        ]
+        assert (study / "CT_3" / "CT000009.dcm").read_bytes() == b"c9"
+
+    def test_same_layout_for_series_and_instances(self, tmp_path):
+        orthanc = FakeOrthanc(2000 * MB, [series(c, 3) for c in "abcd"])
+        layouts = []
+        for strategy in ("series", "instances"):
+            directory = tmp_path / strategy
+            download_study(orthanc, "s", str(directory), strategy=strategy)
+            layouts.append(
+                sorted(
+                    (str(p.relative_to(directory)), p.read_bytes())
+                    for p in directory.rglob("*.dcm")
+                )
+            )
+        assert layouts[0] == layouts[1]
+        assert len(layouts[0]) == 12
+
+    def test_download_instances(self, tmp_path):
+        orthanc = FakeOrthanc(2000 * MB, [series("a", 3), series("b", 1)])
+        paths = download_study(orthanc, "s", str(tmp_path), workers=2)
+        assert len(paths) == 4
+        # Same layout as the archives
+        study = tmp_path / "P1 DOE^JOHN" / "A1 Head"
+        assert (study / "CT" / "CT000002.dcm").read_bytes() == b"a2"
+        assert (study / "CT_2" / "CT000000.dcm").read_bytes() == b"b0"
+
+    def test_download_small_study_as_one_archive(self, tmp_path):
+        orthanc = FakeOrthanc(MB, [series("a", 3)])
+        assert len(download_study(orthanc, "s", str(tmp_path))) == 2
+        assert orthanc.requests == [("study", "s")]
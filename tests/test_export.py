@@ -0,0 +1,59 @@
+from beren import Orthanc
+from beren.export import catalog_rows, export_catalog
+from unittest import mock
+import json
+import pytest
+
+URL = "https://demo.orthanc-server.com"
+
+
+def instance(i, **tags):
+    return {
+        "ID": "i{}".format(i),
+        "Type": "Instance",
+        "ParentSeries": "s",
+        "FileSize": 100 + i,
+        "MainDicomTags": dict({"SOPInstanceUID": "1.{}".format(i)}, **tags),
+    }
+
+
+INSTANCES = [instance(0), instance(1), instance(2, InstanceNumber="3")]
+
+
+def listing(service, endpoint, params=None, **kwargs):
+    since, limit = params["since"], params["limit"]
+    return iter([json.dumps(INSTANCES[since : since + limit]).encode()])
+
+
+class TestExport:
+    @mock.patch("apiron.client.call", side_effect=listing)
+    def test_catalog_rows_paged(self, call):
+        rows = list(catalog_rows(Orthanc(URL), "Instance", page_size=2))
+        assert [r["ID"] for r in rows] == ["i0", "i1", "i2"]
+        assert call.call_count == 2
+
+    @mock.patch("apiron.client.call", side_effect=listing)
+    def test_parquet_row_groups(self, call, tmp_path):
+        pq = pytest.importorskip("pyarrow.parquet")
+        path = str(tmp_path / "catalog.parquet")
+        assert export_catalog(Orthanc(URL), path, row_group_size=2) == 3
+        f = pq.ParquetFile(path)
+        assert f.metadata.num_row_groups == 2
+        table = f.read()
+        assert table.column("FileSize").to_pylist() == [100, 101, 102]
+        assert table.column("SOPInstanceUID").to_pylist() == ["1.0", "1.1", "1.2"]
+        # InstanceNumber only appears after the first row group
+        assert "InstanceNumber" not in table.column_names
+        extra = table.column("ExtraTags").to_pylist()
+        assert extra == [None, None, '{"InstanceNumber": "3"}']
+
+    @mock.patch("apiron.client.call", side_effect=listing)
+    def test_arrow_selected_tags(self, call, tmp_path):
+        ipc = pytest.importorskip("pyarrow.ipc")
+        path = str(tmp_path / "catalog.arrow")
+        Orthanc(URL).export_catalog(path, format="arrow", tags=["InstanceNumber"])
+        table = ipc.open_file(path).read_all()
+        assert table.column("InstanceNumber").to_pylist() == [None, None, "3"]
+        assert "ExtraTags" not in table.column_names
+        with pytest.raises(ValueError):
+            export_catalog(Orthanc(URL), path, format="csv")
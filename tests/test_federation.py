@@ -0,0 +1,76 @@
+from beren import FederatedOrthanc, Orthanc
+from requests.exceptions import ConnectionError
+from unittest import mock
+import pytest
+
+
+def study(id_, uid):
+    return {"ID": id_, "MainDicomTags": {"StudyInstanceUID": uid}}
+
+
+def site(studies, lookup=()):
+    client = mock.Mock(spec=Orthanc)
+    client.find.return_value = studies
+    client.get_studies.return_value = studies
+    client.lookup.return_value = list(lookup)
+    return client
+
+
+class TestFederatedOrthanc:
+    def test_find_merges_by_uid(self):
+        north = site([study("a", "1.1"), study("b", "1.2")])
+        south = site([study("b", "1.2"), study("c", "1.3")])
+        sites = FederatedOrthanc({"north": north, "south": south})
+        result = sites.find({"PatientName": "DOE*"}, "Study", expand=True)
+        assert [(r["ID"], r["Servers"]) for r in result] == [
+            ("a", ["north"]),
+            ("b", ["north", "south"]),
+            ("c", ["south"]),
+        ]
+        north.find.assert_called_once_with({"PatientName": "DOE*"}, "Study", True, None)
+        assert "Servers" not in north.find.return_value[0]
+        assert len(sites.find({}, "Study", expand=True, limit=2)) == 2
+        with pytest.raises(ValueError):
+            sites.find({}, "Visit")
+
+    def test_listings_and_lookup(self):
+        north = site(["a", "b"], [{"ID": "a", "Type": "Study", "Path": "/studies/a"}])
+        south = site(["b"], [{"ID": "a", "Type": "Study", "Path": "/studies/a"}])
+        sites = FederatedOrthanc({"north": north, "south": south})
+        assert sites.get_studies() == [
+            {"ID": "a", "Servers": ["north"]},
+            {"ID": "b", "Servers": ["north", "south"]},
+        ]
+        assert sites.lookup("1.1") == [
+            {
+                "ID": "a",
+                "Type": "Study",
+                "Path": "/studies/a",
+                "Servers": ["north", "south"],
+            }
+        ]
+
+    def test_failing_server(self):
+        north = site([study("a", "1.1")])
+        south = site([])
+        south.find.side_effect = ConnectionError()
+        with pytest.warns(RuntimeWarning):
+            result = FederatedOrthanc({"north": north, "south": south}).find(
+                {}, "Study", expand=True
+            )
+        assert [r["ID"] for r in result] == ["a"]
+        with pytest.raises(ConnectionError):
+            FederatedOrthanc({"north": north, "south": south}, strict=True).find(
+                {}, "Study"
+            )
+
+    def test_from_peers(self):
+        local = mock.Mock(spec=Orthanc)
+        local.get_peers.return_value = {
+            "west": {"Url": "https://west.example.com/"},
+            "east": {"Url": "https://east.example.com/"},
+        }
+        sites = FederatedOrthanc.from_peers(local, auth={"east": "secret"})
+        assert list(sites.clients) == ["local", "east", "west"]
+        assert sites.clients["east"]._auth == "secret"
+        assert sites.clients["west"]._target == "https://west.example.com/"
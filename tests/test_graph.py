@@ -0,0 +1,55 @@
+from beren.graph import PatientNode, SeriesNode
+from collections import Counter
+
+
+class FakeOrthanc:
+    """Patient p with 3 studies of 2 series of 2 instances each"""
+
+    def __init__(self):
+        self.calls = Counter()
+        self.studies = [
+            {"ID": "st%d" % i, "Type": "Study", "ParentPatient": "p"} for i in range(3)
+        ]
+        self.series = [
+            {"ID": "se%d" % i, "Type": "Series", "ParentStudy": "st%d" % (i // 2)}
+            for i in range(6)
+        ]
+        self.instances = [
+            {"ID": "in%d" % i, "Type": "Instance", "ParentSeries": "se%d" % (i // 2)}
+            for i in range(12)
+        ]
+
+    def __getattr__(self, name):
+        def method(id_):
+            self.calls[name] += 1
+            if name == "get_one_series":
+                return next(s for s in self.series if s["ID"] == id_)
+            if name == "get_study":
+                return next(s for s in self.studies if s["ID"] == id_)
+            # Descendants of other resources are ignored by the graph anyway
+            return getattr(self, name.rsplit("_", 1)[1])
+
+        return method
+
+
+class TestGraph:
+    def test_walk_patient_one_request_per_level(self):
+        orthanc = FakeOrthanc()
+        patient = PatientNode(orthanc, "p")
+        walked = [
+            instance.id
+            for study in patient.studies
+            for series in study.series
+            for instance in series.instances
+        ]
+        assert walked == ["in%d" % i for i in range(12)]
+        assert orthanc.calls == Counter(
+            get_patient_studies=1, get_patient_series=1, get_patient_instances=1
+        )
+
+    def test_parents(self):
+        orthanc = FakeOrthanc()
+        series = SeriesNode(orthanc, "se3")
+        assert series.study.id == "st1"
+        assert [i.id for i in series.instances] == ["in6", "in7"]
+        assert series.instances[0].series is series
@@ -0,0 +1,78 @@
+from beren import Orthanc, orthanc_id, orthanc_ids, resolve_ids
+from hashlib import sha1
+from unittest import mock
+import pytest
+
+
+def expected(*uids):
+    digest = sha1("|".join(uids).encode()).hexdigest()
+    return "-".join(digest[i : i + 8] for i in range(0, 40, 8))
+
+
+class FakeServer:
+    def __init__(self, resources):
+        self.resources = resources
+        self.lookups = []
+
+    def tools_lookup(self, data):
+        self.lookups.append(data)
+        return self.resources.get(data, [])
+
+
+class TestOrthancIds:
+    def test_levels(self):
+        assert orthanc_id("P1") == expected("P1")
+        assert orthanc_id("P1", "1.2") == expected("P1", "1.2")
+        assert orthanc_id("P1", "1.2", "1.2.3", "1.2.3.4 ") == expected(
+            "P1", "1.2", "1.2.3", "1.2.3.4"
+        )
+        assert orthanc_id("P1", None) == expected("P1")
+
+    def test_empty_patient_id(self):
+        assert orthanc_ids(["", None], "1.2") == [expected("", "1.2"), None]
+
+    def test_batch(self):
+        sops = ("1.1", "1.2", None)
+        ids = orthanc_ids("P1", "2", "3", sops)
+        assert ids == [
+            expected("P1", "2", "3", "1.1"),
+            expected("P1", "2", "3", "1.2"),
+            None,
+        ]
+        assert orthanc_ids(["A", "B"], ["1", "2"]) == [
+            expected("A", "1"),
+            expected("B", "2"),
+        ]
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            orthanc_ids("P1", None, "1.2.3")
+        with pytest.raises(ValueError):
+            orthanc_ids(["A", "B"], ["1"])
+
+
+class TestResolveIds:
+    def test_fallback(self):
+        orthanc = mock.Mock()
+        orthanc.server = FakeServer(
+            {"1.9": [{"ID": "s19", "Path": "/studies/s19", "Type": "Study"}]}
+        )
+        ids = resolve_ids(orthanc, "Study", ["1.1", "1.9", "1.8"], ["P1", None, None])
+        assert ids == [expected("P1", "1.1"), "s19", None]
+        assert resolve_ids(orthanc, "Study", ["1.1"], [""]) == [expected("", "1.1")]
+        assert sorted(orthanc.server.lookups) == ["1.8", "1.9"]
+
+    def test_local(self):
+        orthanc = mock.Mock()
+        orthanc.server = FakeServer({})
+        assert resolve_ids(orthanc, "Patient", ["P1"]) == [expected("P1")]
+        assert orthanc.server.lookups == []
+        with pytest.raises(ValueError):
+            resolve_ids(orthanc, "Frame", ["1"])
+
+    def test_client(self):
+        orthanc = Orthanc("http://localhost:8042", warn_insecure=False)
+        with mock.patch("apiron.client.call") as call:
+            ids = orthanc.get_resource_ids("Series", ["3"], ["P1"], ["2"])
+        assert ids == [expected("P1", "2", "3")]
+        call.assert_not_called()
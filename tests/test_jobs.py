@@ -0,0 +1,116 @@
+from beren import Job, JobFailed, JobManager, JobPollFailed, Orthanc
+from unittest import mock
+import pytest
+
+URL = "https://demo.orthanc-server.com"
+
+
+class FakeJobs:
+    """Jobs succeed (or fail) after ``rounds`` listings"""
+
+    def __init__(self, rounds=2, failures=()):
+        self.rounds = rounds
+        self.failures = dict.fromkeys(failures, 1)
+        self.listings = 0
+        self.single = 0
+        self.resubmitted = []
+        self.cancelled = []
+
+    def info(self, id_):
+        if id_ in self.cancelled:
+            return {"ID": id_, "State": "Failure", "ErrorDescription": "Canceled"}
+        if self.listings < self.rounds:
+            return {"ID": id_, "State": "Running", "Progress": 50}
+        if self.failures.get(id_):
+            return {"ID": id_, "State": "Failure", "ErrorDescription": "Boom"}
+        return {"ID": id_, "State": "Success", "Content": {"ID": "new-" + id_}}
+
+    def get_jobs(self, params=None):
+        assert params == {"expand": 1}
+        self.listings += 1
+        return [self.info(id_) for id_ in ("a", "b", "c", "other")]
+
+    def get_job(self, id_):
+        self.single += 1
+        self.listings += 1
+        return self.info(id_)
+
+    def resubmit_job(self, id_):
+        self.resubmitted.append(id_)
+        self.failures[id_] = 0
+        self.listings = 0
+
+    def cancel_job(self, id_):
+        self.cancelled.append(id_)
+
+
+class TestJobManager:
+    def test_single_listing_for_many_jobs(self):
+        orthanc = FakeJobs()
+        with JobManager(orthanc, min_interval=0.01) as manager:
+            jobs = [manager.track({"ID": id_}) for id_ in "abc"]
+            done, not_done = manager.wait_all(jobs, timeout=5)
+        assert not not_done
+        assert [job.result()["ID"] for job in jobs] == ["new-a", "new-b", "new-c"]
+        assert orthanc.single == 0
+        assert orthanc.listings <= 4
+
+    def test_failure_and_resubmission(self):
+        orthanc = FakeJobs(failures=["a"])
+        with JobManager(orthanc, min_interval=0.01) as manager:
+            job = manager.track("a")
+            with pytest.raises(JobFailed):
+                job.result(timeout=5)
+        orthanc = FakeJobs(failures=["a"])
+        with JobManager(orthanc, min_interval=0.01, resubmit=1) as manager:
+            assert manager.track("a").result(timeout=5) == {"ID": "new-a"}
+        assert orthanc.resubmitted == ["a"]
+
+    def test_cancel_and_as_completed(self):
+        orthanc = FakeJobs(rounds=10**6)
+        with JobManager(orthanc, min_interval=0.01) as manager:
+            job = manager.track("b")
+            assert isinstance(job, Job) and manager.track("b") is job
+            job.cancel()
+            assert list(manager.as_completed([job], timeout=5)) == [job]
+            assert isinstance(job.exception(), JobFailed)
+            assert not job.cancel()
+
+    def test_unexpected_errors(self):
+        orthanc = FakeJobs()
+        get_job = orthanc.get_job
+        errors = iter([ValueError("Expecting value")])
+
+        def flaky(id_):
+            error = next(errors, None)
+            if error is not None:
+                raise error
+            return get_job(id_)
+
+        orthanc.get_job = flaky
+        with pytest.warns(RuntimeWarning):
+            with JobManager(orthanc, min_interval=0.01) as manager:
+                # A transient error does not stop the poller
+                assert manager.track("a").result(timeout=5) == {"ID": "new-a"}
+                orthanc.get_job = mock.Mock(side_effect=KeyError("ID"))
+                with pytest.raises(JobPollFailed) as e:
+                    manager.track("b").result(timeout=5)
+                assert isinstance(e.value.error, KeyError)
+
+    def test_interval_backs_off(self):
+        orthanc = FakeJobs(rounds=10**6)
+        manager = JobManager(orthanc, min_interval=0.01, max_interval=0.04, backoff=2)
+        manager.track("a")
+        assert manager.wait_all(timeout=0.5)[1]
+        manager.close()
+        # 0.01 then 0.02 then 0.04 forever: far fewer checks than at min_interval
+        assert manager.checks < 20
+
+    def test_client_shares_manager(self):
+        orthanc = Orthanc(URL)
+        with mock.patch.object(JobManager, "track"):
+            orthanc.track_job("a")
+            manager = orthanc._job_manager
+            orthanc.track_job("b")
+        assert isinstance(manager, JobManager)
+        assert orthanc._job_manager is manager
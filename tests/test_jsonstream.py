@@ -0,0 +1,47 @@
+from beren import Orthanc
+from beren.jsonstream import _Reader, iter_json
+from unittest import mock
+import json
+import pytest
+
+URL = "https://demo.orthanc-server.com"
+
+
+def chunked(data, size):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+class TestJsonStream:
+    def test_array_any_chunking(self):
+        doc = [{"ID": 'a\\"]', "MainDicomTags": {"Name": "é"}}, 12345, [], True]
+        data = json.dumps(doc, ensure_ascii=False).encode()
+        for size in range(1, 10):
+            assert list(iter_json(chunked(data, size))) == doc
+
+    def test_large_item_joined_few_times(self):
+        doc = [{"Instances": ["x" * 40] * 10000}]
+        data = json.dumps(doc).encode()
+        join = _Reader._join
+        with mock.patch.object(_Reader, "_join", autospec=True, side_effect=join) as m:
+            assert list(iter_json(chunked(data, 100))) == doc
+        # The buffer is rebuilt each time it doubles, not for each of the chunks
+        assert m.call_count < 40
+
+    def test_object_pairs(self):
+        doc = {"a": {"0010,0010": {"Value": "X"}}, "b": {}}
+        data = json.dumps(doc).encode()
+        assert dict(iter_json(chunked(data, 3))) == doc
+
+    def test_empty_and_invalid(self):
+        assert list(iter_json([b" [ ] "])) == []
+        for bad in [b"", b'"x"', b"[1,", b"[1 2]"]:
+            with pytest.raises(ValueError):
+                list(iter_json([bad]))
+
+    @mock.patch("apiron.client.call")
+    def test_stream_find(self, call):
+        call.return_value = iter([b'[{"ID": "a"}, ', b'{"ID": "b"}]'])
+        orthanc = Orthanc(URL)
+        results = orthanc.stream_find({}, "Study", expand=True)
+        assert [r["ID"] for r in results] == ["a", "b"]
+        assert call.call_args[0][1].streaming
@@ -0,0 +1,101 @@
+from beren import Mirror
+from requests.exceptions import ConnectionError, HTTPError
+from requests.models import Response
+import pytest
+
+
+def not_found():
+    response = Response()
+    response.status_code = 404
+    return HTTPError(response=response)
+
+
+class FakeServer:
+    def __init__(self):
+        self.instances = {}  # id -> (patient, study, series)
+        self.changes = []
+        self.broken = set()
+
+    def add(self, patient, study, series, id_):
+        self.instances[id_] = (patient, study, series)
+        self.changes.append(
+            {"ChangeType": "NewInstance", "ResourceType": "Instance", "ID": id_}
+        )
+
+    def delete(self, level, id_):
+        index = ["Patient", "Study", "Series"].index(level)
+        for key, parents in list(self.instances.items()):
+            if parents[index] == id_:
+                del self.instances[key]
+        self.changes.append({"ChangeType": "Deleted", "ResourceType": level, "ID": id_})
+
+    def get_studies(self, expand, since, limit):
+        studies = sorted({(p[1], p[0]) for p in self.instances.values()})
+        return [{"ID": s, "ParentPatient": p} for s, p in studies][
+            since : since + limit
+        ]
+
+    def get_series(self, expand, since, limit):
+        series = {}
+        for id_, (_, study, s) in sorted(self.instances.items()):
+            series.setdefault(s, {"ID": s, "ParentStudy": study, "Instances": []})
+            series[s]["Instances"].append(id_)
+        return sorted(series.values(), key=lambda s: s["ID"])[since : since + limit]
+
+    def get_instance(self, id_):
+        if id_ not in self.instances:
+            raise not_found()
+        return {"ID": id_, "ParentSeries": self.instances[id_][2]}
+
+    def get_instance_study(self, id_):
+        patient, study, _ = self.instances[id_]
+        return {"ID": study, "ParentPatient": patient}
+
+    def get_instance_file(self, id_):
+        if id_ in self.broken:
+            raise ConnectionError()
+        if id_ not in self.instances:
+            raise not_found()
+        return iter([b"DICM", id_.encode()])
+
+    def get_changes(self, since=0, limit=100, last=False):
+        if last:
+            return {"Changes": [], "Done": True, "Last": len(self.changes)}
+        page = self.changes[since : since + limit]
+        return {
+            "Changes": page,
+            "Done": since + limit >= len(self.changes),
+            "Last": since + len(page),
+        }
+
+
+class TestMirror:
+    def test_initial_then_changes(self, tmp_path):
+        server = FakeServer()
+        for i in range(5):
+            server.add("p1", "st1", "se{}".format(i % 2), "i{}".format(i))
+        server.add("p2", "st2", "se2", "j0")
+        with Mirror(server, str(tmp_path), page_size=2) as mirror:
+            assert mirror.sync() == {"added": 6, "deleted": 0, "failed": 0}
+            assert mirror.last == 6
+            assert (tmp_path / "p1/st1/se0/i4.dcm").read_bytes() == b"DICMi4"
+            assert (tmp_path / "p2/st2/se2/j0.dcm").exists()
+
+        server.add("p1", "st1", "se1", "i5")
+        server.add("p3", "st3", "se3", "k0")
+        server.delete("Study", "st2")
+        server.add("p2", "st2", "se2", "j0")  # sent again after its deletion
+        server.broken.add("k0")
+        with Mirror(server, str(tmp_path), page_size=2) as mirror:
+            assert mirror.sync() == {"added": 2, "deleted": 1, "failed": 1}
+            assert (tmp_path / "p1/st1/se1/i5.dcm").exists()
+            assert (tmp_path / "p2/st2/se2/j0.dcm").exists()
+            assert not (tmp_path / "p3").exists()
+
+            server.broken.clear()
+            server.delete("Patient", "p2")
+            assert mirror.sync() == {"added": 1, "deleted": 1, "failed": 0}
+            assert (tmp_path / "p3/st3/se3/k0.dcm").exists()
+            assert not (tmp_path / "p2").exists()
+            assert len(mirror) == 7
+            assert "k0" in mirror
@@ -0,0 +1,48 @@
+from beren import Orthanc, Instance, Study, to_record
+from unittest import mock
+import pytest
+
+URL = "https://demo.orthanc-server.com"
+
+STUDY = {
+    "ID": "27f7126f-4f66fb14-03f4081b-f9341db2-53925988",
+    "Type": "Study",
+    "IsStable": True,
+    "LastUpdate": "20200101T101010",
+    "MainDicomTags": {"StudyInstanceUID": "1.2.3", "AccessionNumber": "A1"},
+    "ParentPatient": "da39a3ee-5e6b4b0d-3255bfef-95601890-afd80709",
+    "PatientMainDicomTags": {"PatientID": "P1"},
+    "Series": ["s1", "s2"],
+}
+
+
+class TestRecords:
+    def test_round_trip(self):
+        study = to_record(STUDY)
+        assert isinstance(study, Study)
+        assert study.tag("AccessionNumber") == "A1"
+        assert study.tag("Modality") is None
+        assert study.main_dicom_tags == STUDY["MainDicomTags"]
+        assert study.patient_main_dicom_tags == {"PatientID": "P1"}
+        assert study.series == ("s1", "s2")
+        assert study.to_json() == STUDY
+        assert not hasattr(study, "__dict__")
+
+    def test_shared_tag_names(self):
+        first = to_record(STUDY)
+        second = to_record(dict(STUDY, ID="other"))
+        assert first._shape is second._shape
+        assert first != second
+
+    def test_uuids_and_unknown(self):
+        assert to_record("some-uuid") == "some-uuid"
+        with pytest.raises(ValueError):
+            to_record({"ID": "x", "Type": "Unknown"})
+
+    @mock.patch("apiron.client.call")
+    def test_client_records(self, call):
+        call.return_value = [{"ID": "i", "Type": "Instance", "MainDicomTags": {}}]
+        orthanc = Orthanc(URL)
+        (instance,) = orthanc.get_instances(expand=True, records=True)
+        assert isinstance(instance, Instance)
+        assert orthanc.get_instances(expand=True) == call.return_value
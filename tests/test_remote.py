@@ -0,0 +1,177 @@
+from beren import (
+    JobFailed,
+    Orthanc,
+    RemoteAnswer,
+    RemoteQueries,
+    answer_contents,
+    query_hierarchy,
+)
+from concurrent.futures import Future
+from requests.exceptions import ConnectionError
+from unittest import mock
+import threading
+import time
+
+
+class FakePACS:
+    """Each accession number matches two studies"""
+
+    def __init__(self):
+        self.queries = {}
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+        self.moves = []
+
+    def query_modality(self, modality, data):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.01)
+        with self.lock:
+            self.active -= 1
+            id_ = "q{}".format(len(self.queries))
+            self.queries[id_] = data["Query"]["AccessionNumber"]
+        return {"ID": id_, "Path": "/queries/" + id_}
+
+    def get_query_answers(self, id_):
+        return ["0", "1"]
+
+    def get_query_answers_content(self, id_, index, params=None):
+        assert params == {"simplify": 1}
+        accession = self.queries[id_]
+        return {
+            "AccessionNumber": accession,
+            "PatientID": "P",
+            "StudyInstanceUID": "{}.{}".format(accession, index),
+        }
+
+    def move_modality(self, modality, data):
+        if len(self.moves) == 1:
+            self.moves.append(data)
+            raise ConnectionError("refused")
+        self.moves.append(data)
+        return {"ID": "job{}".format(len(self.moves))}
+
+    def track_job(self, job):
+        future = Future()
+        future.id = job["ID"]
+        if job["ID"] == "job3":
+            future.set_exception(JobFailed({"ID": "job3", "ErrorDescription": "No"}))
+        else:
+            future.set_result({})
+        return future
+
+
+class TestRemoteQueries:
+    def test_find_values(self):
+        pacs = FakePACS()
+        remote = RemoteQueries(pacs, associations=2, workers=8)
+        answers = remote.find_values(
+            "PACS", "AccessionNumber", ["A{}".format(i) for i in range(10)]
+        )
+        assert pacs.peak <= 2
+        assert [len(found) for found in answers] == [2] * 10
+        assert answers[3][1] == RemoteAnswer(
+            "PACS",
+            "Study",
+            answers[3][1].query_id,
+            1,
+            {"AccessionNumber": "A3", "PatientID": "P", "StudyInstanceUID": "A3.1"},
+        )
+
+        # Recent answers are cached
+        assert remote.find_values("PACS", "AccessionNumber", ["A3"])[0] == answers[3]
+        assert len(pacs.queries) == 10
+        assert (remote.hits, remote.misses) == (1, 10)
+
+    def test_retrieve_batches(self):
+        pacs = FakePACS()
+        remote = RemoteQueries(pacs)
+        answers = [
+            a
+            for found in remote.find_values("PACS", "AccessionNumber", "ABC")
+            for a in found
+        ]
+        results = list(remote.retrieve("PACS", answers, target="WS", batch_size=2))
+        assert [len(r.answers) for r in results] == [2, 2, 2]
+        assert sorted(str(r.error) for r in results) == ["No", "None", "refused"]
+        assert pacs.moves[0] == {
+            "Level": "Study",
+            "Resources": [
+                {"PatientID": "P", "StudyInstanceUID": "A.0"},
+                {"PatientID": "P", "StudyInstanceUID": "A.1"},
+            ],
+            "Asynchronous": True,
+            "TargetAet": "WS",
+        }
+
+    def test_answer_contents(self):
+        pacs = FakePACS()
+        pacs.queries["q"] = "X"
+        assert [c["StudyInstanceUID"] for c in answer_contents(pacs, "q")] == [
+            "X.0",
+            "X.1",
+        ]
+
+
+class FakeTree:
+    """Remote query answers: 2 studies, 3 series per study, 2 instances per series"""
+
+    LEVELS = {"Study": "STUDY", "Series": "SERIES", "Instance": "IMAGE"}
+
+    def __init__(self):
+        self.queries = {"root": ("Study", "")}
+        self.lock = threading.Lock()
+
+    def _child(self, id_, index, level):
+        with self.lock:
+            child = "q{}".format(len(self.queries))
+            parent = self.queries[id_][1]
+            self.queries[child] = (level, "{}{}.".format(parent, index))
+        return {"ID": child}
+
+    def post_query_answers_series(self, id_, index):
+        return self._child(id_, index, "Series")
+
+    def post_query_answers_instances(self, id_, index):
+        return self._child(id_, index, "Instance")
+
+    def get_query_answers(self, id_):
+        count = {"Study": 2, "Series": 3, "Instance": 2}[self.queries[id_][0]]
+        return [str(i) for i in range(count)]
+
+    def get_query_answers_content(self, id_, index, params=None):
+        level, prefix = self.queries[id_]
+        return {"QueryRetrieveLevel": self.LEVELS[level], "UID": prefix + index}
+
+
+class TestQueryHierarchy:
+    def test_drill_down(self):
+        tree = FakeTree()
+        studies = query_hierarchy(tree, "root", depth="Instance", workers=4)
+        assert [s["Tags"]["UID"] for s in studies] == ["0", "1"]
+        series = studies[1]["Children"]
+        assert [s["Tags"]["UID"] for s in series] == ["1.0", "1.1", "1.2"]
+        assert series[2]["Level"] == "Series"
+        assert [i["Tags"]["UID"] for i in series[2]["Children"]] == ["1.2.0", "1.2.1"]
+        assert series[2]["Children"][0]["Children"] == []
+        assert len(tree.queries) == 1 + 2 + 6
+
+        shallow = query_hierarchy(FakeTree(), "root")
+        assert shallow[0]["Children"][0]["Children"] == []
+
+    @mock.patch("apiron.client.call")
+    def test_client_methods(self, call):
+        def answer(service, endpoint, **kwargs):
+            if endpoint.path.endswith("answers/"):
+                return ["0", "1", "2"]
+            return {"Index": kwargs["index"], "Params": kwargs["params"]}
+
+        call.side_effect = answer
+        contents = Orthanc(
+            "https://demo.orthanc-server.com"
+        ).get_query_answers_contents("q")
+        assert contents == [
+            {"Index": str(i), "Params": {"simplify": 1}} for i in range(3)
+        ]
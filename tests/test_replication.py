@@ -0,0 +1,145 @@
+from beren import BandwidthLimit, JobFailed, Replicator
+from concurrent.futures import Future
+from requests.exceptions import ConnectionError, HTTPError
+from unittest import mock
+import json
+import pytest
+
+
+class FakeServer:
+    """Instances are stored under their content"""
+
+    def __init__(self, ids=()):
+        self.instances = []
+        self.changes = []
+        self.broken = set()
+        self.deleted = set()
+        for id_ in ids:
+            self.add_instance(id_.encode())
+
+    def get_instances(self, since, limit):
+        return self.instances[since : since + limit]
+
+    def get_instance(self, id_):
+        if id_ in self.deleted or id_ not in self.instances:
+            raise HTTPError(response=mock.Mock(status_code=404))
+        return {"ID": id_}
+
+    def get_instance_file(self, id_):
+        if id_ in self.broken:
+            raise ConnectionError()
+        self.get_instance(id_)
+        return iter([id_.encode()])
+
+    def add_instance(self, data):
+        if not isinstance(data, bytes):  # streamed
+            data = b"".join(data)
+        id_ = data.decode()
+        if id_ in self.instances:
+            return {"ID": id_, "Status": "AlreadyStored"}
+        self.instances.append(id_)
+        self.changes.append({"ChangeType": "NewInstance", "ID": id_})
+        self.changes.append({"ChangeType": "StableSeries", "ID": "s"})
+        return {"ID": id_, "Status": "Success"}
+
+    def get_changes(self, since=0, limit=100, last=False):
+        if last:
+            return {"Changes": [], "Done": True, "Last": len(self.changes)}
+        page = self.changes[since : since + limit]
+        return {
+            "Changes": page,
+            "Done": since + limit >= len(self.changes),
+            "Last": since + len(page),
+        }
+
+
+class TestReplicator:
+    def test_full_then_incremental(self, tmp_path):
+        source = FakeServer("abcde")
+        target = FakeServer("bd")
+        checkpoint = str(tmp_path / "sync.json")
+        replicator = Replicator(source, target, checkpoint=checkpoint, page_size=2)
+        assert replicator.compare() == ["a", "c", "e"]
+        stats = replicator.sync()
+        assert stats == {"copied": 3, "existing": 0, "failed": 0, "bytes": 3}
+        assert sorted(target.instances) == list("abcde")
+        with open(checkpoint) as f:
+            assert json.load(f) == {"Last": 10, "Failed": []}
+
+        # A new replicator resumes from the checkpoint, reading only the changes
+        source.add_instance(b"f")
+        source.add_instance(b"g")
+        source.broken.add("g")
+        replicator = Replicator(source, target, checkpoint=checkpoint, page_size=2)
+        with mock.patch.object(replicator, "compare") as compare:
+            assert replicator.sync()["failed"] == 1
+        compare.assert_not_called()
+        assert replicator.state == {"Last": 14, "Failed": ["g"]}
+
+        # Failed instances are retried by the next sync
+        source.broken.clear()
+        assert replicator.sync()["copied"] == 2
+        assert replicator.state == {"Last": 14, "Failed": []}
+        assert sorted(target.instances) == list("abcdefg")
+
+    def test_deleted_from_source(self):
+        source = FakeServer("abc")
+        source.deleted.add("b")
+        replicator = Replicator(source, FakeServer())
+        assert replicator.sync()["failed"] == 0
+        assert replicator.state["Failed"] == []
+
+    def test_store_peer(self):
+        source = FakeServer("abcde")
+        source.store_peer = mock.Mock(side_effect=lambda peer, json: json["Resources"])
+
+        def track_job(resources):
+            job = Future()
+            if "e" in resources or "c" in resources:
+                job.set_exception(JobFailed({"ID": "j"}))
+            else:
+                job.set_result({})
+            return job
+
+        source.track_job = track_job
+        replicator = Replicator(source, FakeServer(), peer="backup", batch_size=2)
+        source.deleted.add("c")  # dropped from its failed batch, "d" is retried
+        assert replicator.sync()["copied"] == 2
+        assert replicator.state["Failed"] == ["d", "e"]
+        assert source.store_peer.call_args_list[0] == mock.call(
+            "backup", json={"Resources": ["a", "b"], "Asynchronous": True}
+        )
+        with pytest.raises(ValueError):
+            Replicator(source, FakeServer(), peer="backup", bandwidth=1000)
+
+    def test_store_peer_skips_stored(self):
+        source = FakeServer("abc")
+        source.store_peer = mock.Mock(side_effect=lambda peer, json: json["Resources"])
+        job = Future()
+        job.set_result({})
+        source.track_job = mock.Mock(return_value=job)
+        replicator = Replicator(source, FakeServer("ac"), peer="backup")
+        assert replicator.copy(["a", "b", "c"]) == []
+        source.store_peer.assert_called_once_with(
+            "backup", json={"Resources": ["b"], "Asynchronous": True}
+        )
+        assert replicator.stats["copied"] == 1
+        assert replicator.stats["existing"] == 2
+
+    @mock.patch("beren.replication.sleep")
+    def test_bandwidth_limit(self, sleep):
+        limit = BandwidthLimit(1000)
+        assert list(limit.throttle([b"x" * 1000])) == [b"x" * 1000]
+        sleep.assert_not_called()
+        limit.consume(500)
+        assert 0.45 < sleep.call_args[0][0] <= 0.5
+
+    def test_continuous(self):
+        source = FakeServer("ab")
+        target = FakeServer()
+        stop = mock.Mock()
+        stop.is_set.side_effect = [False, False, True]
+        replicator = Replicator(source, target)
+        replicator.run(interval=0, stop=stop)
+        assert stop.wait.call_count == 2
+        assert target.instances == ["a", "b"]
@@ -0,0 +1,101 @@
+from beren import JobFailed, Sender
+from concurrent.futures import Future
+from requests.exceptions import ConnectionError
+from unittest import mock
+import pytest
+
+
+class FakeOrthanc:
+    """Instance "bad" always fails on modalities, peers fail once on "flaky" """
+
+    def __init__(self):
+        self.stores = []
+        self.flaky = True
+
+    def store_modality(self, name, data):
+        self.stores.append(("modality", name, data["Resources"]))
+        assert data["Permissive"] and data["Asynchronous"]
+        failed = data["Resources"].count("bad")
+        return {
+            "ID": "job{}".format(len(self.stores)),
+            "Content": {"FailedInstancesCount": failed},
+        }
+
+    def store_peer(self, name, json):
+        self.stores.append(("peer", name, json["Resources"]))
+        if "flaky" in json["Resources"] and self.flaky:
+            self.flaky = False
+            raise ConnectionError("reset")
+        return {"ID": "job{}".format(len(self.stores)), "Content": {}}
+
+    def track_job(self, response):
+        job = Future()
+        job.id = response["ID"]
+        job.set_result(response["Content"])
+        return job
+
+
+class TestSender:
+    def test_send(self):
+        orthanc = FakeOrthanc()
+        ids = ["a", "b", "flaky", "bad", "c"]
+        sender = Sender(orthanc, batch_size=2, retries=2, retry_delay=0)
+        results = list(sender.send(ids, modalities=["WS"], peers=["backup"]))
+
+        failures = [r for r in results if r.error]
+        assert [(r.destination, r.resources, r.attempts) for r in failures] == [
+            (("modality", "WS"), ["bad"], 4)
+        ]
+        sent = {}
+        for r in results:
+            if not r.error:
+                sent.setdefault(r.destination, []).extend(r.resources)
+        assert sorted(sent[("modality", "WS")]) == ["a", "b", "c", "flaky"]
+        assert sorted(sent[("peer", "backup")]) == sorted(ids)
+        # A connection error retries the whole batch, it is not split
+        assert orthanc.stores.count(("peer", "backup", ["flaky", "bad"])) == 2
+
+    def test_isolate(self):
+        orthanc = FakeOrthanc()
+        ids = ["a", "b", "c", "bad", "d", "e", "f"]
+        sender = Sender(orthanc, batch_size=8, retries=0, retry_delay=0)
+        results = list(sender.send(ids, modalities=["WS"]))
+        assert [r.resources for r in results if r.error] == [["bad"]]
+        sent = [i for r in results if not r.error for i in r.resources]
+        assert sorted(sent) == ["a", "b", "c", "d", "e", "f"]
+
+    def test_destination_down(self):
+        orthanc = FakeOrthanc()
+        orthanc.store_modality = mock.Mock(side_effect=ConnectionError("refused"))
+        ids = list("abcdefgh")
+        sender = Sender(orthanc, batch_size=8, retries=2, retry_delay=0)
+        results = list(sender.send(ids, modalities=["DOWN"]))
+        assert orthanc.store_modality.call_count == 3
+        assert [(r.resources, r.attempts) for r in results] == [(ids, 3)]
+        assert results[0].error == "refused"
+
+    def test_cancelled(self):
+        orthanc = FakeOrthanc()
+        jobs = []
+
+        def track_job(response):
+            job = Future()
+            job.id = response["ID"]
+            job.cancel()
+            job.set_running_or_notify_cancel()
+            jobs.append(job)
+            return job
+
+        orthanc.track_job = track_job
+        sender = Sender(orthanc, retries=0, retry_delay=0)
+        results = list(sender.send(["a"], modalities=["WS"], peers=["backup"]))
+        assert {r.error for r in results} == {"Job cancelled"}
+        assert len(results) == 2
+
+    def test_submit(self):
+        sender = Sender(FakeOrthanc(), retry_delay=0)
+        future = sender.submit(["a", "b"], peers=["backup"])
+        assert [r.resources for r in future.result(timeout=5)] == [["a", "b"]]
+        sender.close()
+        with pytest.raises(ValueError):
+            sender.send(["a"])
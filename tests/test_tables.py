@@ -0,0 +1,61 @@
+from beren import Orthanc, TagTable, tag_table
+from unittest import mock
+import json
+import pytest
+
+URL = "https://demo.orthanc-server.com"
+
+TAGS = {
+    "i1": {
+        "PatientID": "007",
+        "InstanceNumber": "1",
+        "SliceThickness": "2.5",
+        "ImagePositionPatient": "0\\0\\1",
+    },
+    "i2": {
+        "PatientID": "007",
+        "InstanceNumber": "2",
+        "SliceThickness": "",
+        "ImagePositionPatient": "0\\0\\3.5",
+        "ReferencedImageSequence": [{"ReferencedSOPInstanceUID": "1.2"}],
+    },
+}
+
+
+class TestTagTable:
+    def test_typed_columns(self):
+        table = tag_table(TAGS.items())
+        assert table.ids == ["i1", "i2"]
+        assert table["PatientID"] == ["007", "007"]
+        assert table["InstanceNumber"] == [1, 2]
+        assert table["SliceThickness"] == [2.5, None]
+        assert table["ImagePositionPatient"] == [(0, 0, 1), (0, 0, 3.5)]
+        assert table["ReferencedImageSequence"][0] is None
+        assert table.types["ReferencedImageSequence"] == "object"
+
+    def test_selected_tags_and_types(self):
+        table = tag_table(
+            TAGS.items(), ["InstanceNumber", "Missing"], {"InstanceNumber": "str"}
+        )
+        assert list(table.columns) == ["InstanceNumber", "Missing"]
+        assert table["InstanceNumber"] == ["1", "2"]
+        assert table["Missing"] == [None, None]
+        with pytest.raises(ValueError):
+            TagTable(["i1"], {"A": ["1"]}, {"A": "date"})
+
+    def test_to_numpy(self):
+        np = pytest.importorskip("numpy")
+        arrays = tag_table(TAGS.items()).to_numpy()
+        assert arrays["InstanceNumber"].dtype == np.int64
+        assert np.isnan(arrays["SliceThickness"][1])
+        assert arrays["ImagePositionPatient"].shape == (2, 3)
+
+    @mock.patch("apiron.client.call")
+    def test_study_tag_table_single_request(self, call):
+        call.return_value = iter([json.dumps(TAGS).encode()])
+        table = Orthanc(URL).get_study_tag_table("s", ["InstanceNumber"])
+        assert table["InstanceNumber"] == [1, 2]
+        assert call.call_count == 1
+        assert call.call_args[1]["params"] == {"simplify": 1}
+        with pytest.raises(ValueError):
+            table.convert("excel")
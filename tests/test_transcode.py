@@ -0,0 +1,56 @@
+from beren import DiskCache, Orthanc, TRANSFER_SYNTAXES, decode_file, transfer_syntax
+from unittest import mock
+import pytest
+
+URL = "https://demo.orthanc-server.com"
+J2K = TRANSFER_SYNTAXES["jpeg2000-lossless"]
+
+
+class TestTranscode:
+    def test_transfer_syntax(self):
+        assert transfer_syntax("jpeg-ls-lossless") == "1.2.840.10008.1.2.4.80"
+        assert transfer_syntax("1.2.840.10008.1.2.4.90") == J2K
+        with pytest.raises(ValueError):
+            transfer_syntax("jpeg3000")
+
+    @mock.patch("apiron.client.call")
+    def test_instance_file(self, call, tmp_path):
+        orthanc = Orthanc(URL, cache=DiskCache(str(tmp_path)))
+        call.side_effect = lambda *args, **kwargs: iter([b"dicom"])
+        assert b"".join(orthanc.get_instance_file("i")) == b"dicom"
+        assert "params" not in call.call_args[1]
+        assert b"".join(orthanc.get_instance_file("i", transcode="jpeg2000-lossless"))
+        assert call.call_args[1]["params"] == {"transcode": J2K}
+        # Each transfer syntax has its own cache entry
+        assert b"".join(orthanc.get_instance_file("i", transcode=J2K))
+        assert call.call_count == 2
+
+    @mock.patch("apiron.client.call")
+    def test_archives(self, call):
+        orthanc = Orthanc(URL)
+        call.return_value = iter([b"zip"])
+        orthanc.get_study_archive("s", transcode="jpeg2000-lossless")
+        assert call.call_args[1]["params"] == {"transcode": J2K}
+        orthanc.get_series_media("s", transcode="jpeg2000-lossless")
+        assert call.call_args[1]["params"] == {"transcode": J2K}
+        orthanc.create_media(json={"Resources": ["s"]}, transcode=J2K)
+        assert call.call_args[1]["json"] == {"Resources": ["s"], "Transcode": J2K}
+
+        call.return_value = {"ID": "job", "Path": "/jobs/job"}
+        with mock.patch.object(Orthanc, "_job_output") as output:
+            orthanc.archive_patient("p", asynchronous=True, transcode=J2K)
+        assert call.call_args[1]["json"] == {"Asynchronous": True, "Transcode": J2K}
+        output.assert_called_once()
+
+    def test_decode_file(self):
+        pydicom = pytest.importorskip("pydicom")
+        from pydicom.data import get_testdata_file
+
+        with open(get_testdata_file("JPEG2000.dcm"), "rb") as f:
+            data = f.read()
+        try:
+            decoded = decode_file([data])
+        except (NotImplementedError, RuntimeError):
+            pytest.skip("no JPEG 2000 pixel data handler")
+        dataset = pydicom.dcmread(pydicom.filebase.DicomBytesIO(decoded))
+        assert not dataset.file_meta.TransferSyntaxUID.is_compressed
@@ -0,0 +1,197 @@
+from beren import Orthanc, AdaptiveLimiter, RetryPolicy, get_decoder
+from beren.endpoints.streaming import GzipStreamingEndpoint
+from concurrent.futures import ThreadPoolExecutor
+from requests.exceptions import ConnectionError, HTTPError
+from requests.models import Response
+from unittest import mock
+import gzip
+import pytest
+import threading
+import time
+
+URL = "https://demo.orthanc-server.com"
+
+
+def http_error(status):
+    response = Response()
+    response.status_code = status
+    return HTTPError(response=response)
+
+
+class TestTransport:
+    def test_services_are_per_client(self):
+        first = Orthanc(URL)
+        second = Orthanc("https://other.orthanc-server.com")
+        assert first.instances.domain == URL
+        assert second.instances.domain == "https://other.orthanc-server.com"
+
+    @mock.patch("beren.transport.sleep")
+    @mock.patch("apiron.client.call")
+    def test_retry_get(self, call, sleep):
+        call.side_effect = [ConnectionError(), http_error(503), ["a"]]
+        orthanc = Orthanc(URL, retry=RetryPolicy(attempts=3))
+        assert orthanc.get_patients() == ["a"]
+        assert call.call_count == 3
+        assert sleep.call_count == 2
+
+    @mock.patch("beren.transport.sleep")
+    @mock.patch("apiron.client.call")
+    def test_no_retry_post_or_client_error(self, call, sleep):
+        orthanc = Orthanc(URL, retry=RetryPolicy(attempts=3))
+        call.side_effect = ConnectionError()
+        with pytest.raises(ConnectionError):
+            orthanc.find({}, "Patient")
+        call.side_effect = http_error(404)
+        with pytest.raises(HTTPError):
+            orthanc.get_patient("x")
+        assert call.call_count == 2
+        assert sleep.call_count == 0
+
+    @mock.patch("apiron.client.call")
+    def test_limiter_adapts(self, call):
+        limiter = AdaptiveLimiter(initial=8, minimum=2, cooldown=0)
+        orthanc = Orthanc(URL, limiter=limiter)
+        call.side_effect = http_error(500)
+        with pytest.raises(HTTPError):
+            orthanc.get_patients()
+        assert limiter.limit == 4
+        call.side_effect = None
+        call.return_value = []
+        for _ in range(8):
+            orthanc.get_patients()
+        assert limiter.limit == 5
+        assert limiter.in_flight == 0
+
+    @mock.patch("apiron.client.call")
+    def test_limiter_holds_slot_while_streaming(self, call):
+        limiter = AdaptiveLimiter(initial=8)
+        orthanc = Orthanc(URL, limiter=limiter)
+        call.return_value = iter([b"di", b"com"])
+        chunks = orthanc.get_instance_file("i")
+        assert limiter.in_flight == 1
+        assert b"".join(chunks) == b"dicom"
+        assert limiter.in_flight == 0
+
+        call.return_value = iter([b"di", b"com"])
+        chunks = orthanc.get_instance_file("i")
+        chunks.close()  # abandoned before reading
+        assert limiter.in_flight == 0
+
+        stats = Orthanc(URL, limiter=limiter, transfer_stats=True)
+        call.return_value = mock.Mock(
+            iter_content=mock.Mock(return_value=iter([b"dicom"]))
+        )
+        chunks = stats.get_instance_file("i")
+        assert limiter.in_flight == 1
+        assert list(chunks) == [b"dicom"]
+        assert limiter.in_flight == 0
+
+    @mock.patch("apiron.client.call")
+    def test_json_decoder(self, call):
+        response = mock.Mock(content=b'["a"]')
+        call.return_value = response
+        decoder = mock.Mock(return_value=["decoded"])
+        orthanc = Orthanc(URL, json_decoder=decoder)
+        assert orthanc.get_patients() == ["decoded"]
+        decoder.assert_called_once_with(b'["a"]')
+        assert call.call_args[1]["return_raw_response_object"] is True
+
+        call.return_value = iter([b"dicom"])
+        orthanc.get_instance_file("x")
+        assert "return_raw_response_object" not in call.call_args[1]
+
+    def test_get_decoder(self):
+        assert get_decoder("json")(b'{"a": 1}') == {"a": 1}
+        assert get_decoder("auto")(b"[1]") == [1]
+        with pytest.raises(ValueError):
+            get_decoder("yaml")
+
+    @mock.patch("apiron.client.call")
+    def test_coalesce_concurrent_reads(self, call):
+        release = threading.Event()
+
+        def slow_call(service, endpoint, **kwargs):
+            release.wait(5)
+            return {"ID": kwargs["id_"]}
+
+        call.side_effect = slow_call
+        orthanc = Orthanc(URL, coalesce=True)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            same = [pool.submit(orthanc.get_study, "a") for _ in range(6)]
+            other = pool.submit(orthanc.get_study, "b")
+            while orthanc._transport.coalescer.coalesced < 5:
+                time.sleep(0.01)
+            release.set()
+            assert all(f.result() == {"ID": "a"} for f in same)
+            assert other.result() == {"ID": "b"}
+        assert call.call_count == 2
+
+        # Writes are never shared
+        call.side_effect = None
+        orthanc.find({}, "Study")
+        orthanc.find({}, "Study")
+        assert call.call_count == 4
+
+
+class TestCompression:
+    @mock.patch("apiron.client.call")
+    def test_accept_encoding(self, call):
+        call.return_value = []
+        Orthanc(URL, compression=True).get_patients()
+        assert call.call_args[1]["headers"] == {"Accept-Encoding": "gzip, deflate"}
+        Orthanc(URL, compression=True).get_patients(headers={"Accept-Encoding": "br"})
+        assert call.call_args[1]["headers"] == {"Accept-Encoding": "br"}
+        call.return_value = iter([b"dicom"])
+        Orthanc(URL, compression=True).get_instance_file("x")
+        assert "headers" not in call.call_args[1]
+
+    def test_gzip_endpoint(self):
+        data = bytes(range(256)) * 1000
+        compressed = gzip.compress(data)
+        response = mock.Mock()
+        response.iter_content.return_value = [
+            compressed[i : i + 1000] for i in range(0, len(compressed), 1000)
+        ]
+        assert (
+            b"".join(GzipStreamingEndpoint(path="f").format_response(response)) == data
+        )
+
+    @mock.patch("apiron.client.call")
+    def test_raw_gz_frames_fall_back(self, call):
+        def frames(service, endpoint, **kwargs):
+            if endpoint.path.endswith("raw.gz/"):
+                raise http_error(404)
+            return iter([b"raw"])
+
+        call.side_effect = frames
+        orthanc = Orthanc(URL, compression=True)
+        assert list(orthanc.get_instance_frame("i", 0, "raw")) == [b"raw"]
+        assert call.call_count == 2
+        assert list(orthanc.get_instance_frame("i", 0, "raw")) == [b"raw"]
+        assert call.call_count == 3
+
+    @mock.patch("apiron.client.call")
+    def test_transfer_stats(self, call):
+        response = mock.Mock(content=b'["a", "b"]')
+        response.raw.tell.return_value = 4
+        response.json.return_value = ["a", "b"]
+        call.return_value = response
+        orthanc = Orthanc(URL, transfer_stats=True)
+        assert orthanc.get_patients() == ["a", "b"]
+        assert orthanc.get_patients() == ["a", "b"]
+
+        stream = mock.Mock()
+        stream.raw.tell.return_value = 3
+        stream.iter_content.return_value = iter([b"dic", b"om"])
+        call.return_value = stream
+        assert b"".join(orthanc.get_instance_file("x")) == b"dicom"
+
+        stats = orthanc.transfer_stats.snapshot()
+        assert stats["GET patients/"] == {
+            "requests": 2,
+            "wire_bytes": 8,
+            "decoded_bytes": 20,
+            "ratio": 0.4,
+        }
+        assert stats["GET instances/{id_}/file/"]["decoded_bytes"] == 5
+        assert orthanc.transfer_stats.totals()["wire_bytes"] == 11